@@ -2,21 +2,32 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
-from datetime import timedelta, datetime
+from datetime import datetime
 import os
 from database import db
+from config import config, engine_options
 
-def create_app():
+def create_app(test_config=None, config_name=None):
     app = Flask(__name__)
     
-    # Configuration
-    app.config['SECRET_KEY'] = 'your-secret-key-here'
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///pustakalay.db'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['JWT_SECRET_KEY'] = 'jwt-secret-string'
-    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
+    # Configuration: a class from config.py (chosen by FLASK_CONFIG), then any
+    # PUSTAKALAY_<SETTING> environment variables (values parsed as JSON)
+    app.config.from_object(config[config_name or os.environ.get('FLASK_CONFIG', 'default')])
+    app.config.from_prefixed_env('PUSTAKALAY')
     
-    # Initialize extensions
+    # Overrides for benchmarks and scripts that need their own database
+    if test_config:
+        app.config.update(test_config)
+    
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    
+    # orjson-backed JSON responses when available (see json_provider.py)
+    from json_provider import init_json
+    init_json(app)
+    
+    # Initialize extensions (read replica bind first, see replica.py)
+    from replica import init_replica
+    init_replica(app)
     db.init_app(app)
     
     # Enhanced CORS configuration for mobile connections
@@ -33,24 +44,40 @@ def create_app():
         response.headers.add('Access-Control-Allow-Origin', '*')
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,Accept')
         response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-        response.headers.add('Access-Control-Expose-Headers', 'Content-Type,Authorization')
-        response.headers.add('Cache-Control', 'no-cache, no-store, must-revalidate')
-        response.headers.add('Pragma', 'no-cache')
-        response.headers.add('Expires', '0')
+        response.headers.add('Access-Control-Expose-Headers', 'Content-Type,Authorization,ETag')
+        
+        # Public catalog reads set their own validators (see http_cache.py);
+        # everything else may be user-specific and must not be stored
+        if 'Cache-Control' not in response.headers:
+            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+            response.headers['Pragma'] = 'no-cache'
+            response.headers['Expires'] = '0'
         return response
     
-    JWTManager(app)
+    jwt = JWTManager(app)
+    
+    # Reject tokens minted before the user's last role change
+    from identity import token_is_revoked
+    jwt.token_in_blocklist_loader(token_is_revoked)
     
     # Register blueprints
     from routes.auth import auth_bp
     from routes.books import books_bp
     from routes.donations import donations_bp
     from routes.admin import admin_bp
+    from routes.desk import desk_bp
+    from routes.covers import covers_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(books_bp, url_prefix='/api/books')
     app.register_blueprint(donations_bp, url_prefix='/api/donations')
     app.register_blueprint(admin_bp, url_prefix='/api/admin')
+    app.register_blueprint(desk_bp, url_prefix='/api/desk')
+    app.register_blueprint(covers_bp, url_prefix='/api/covers')
+    
+    # Per-endpoint latency and SQL metrics, served at /api/metrics
+    from metrics import init_metrics
+    init_metrics(app)
     
     # Add a simple test endpoint
     @app.route('/api/test')
@@ -69,8 +96,33 @@ def create_app():
     
     return app
 
+def prepare_database(app):
+    # Schema, migrations and derived state that every entry point needs before serving
+    from migrations import upgrade
+    from search import ensure_search_index
+    from fuzzy import ensure_fuzzy_index
+    from availability import ensure_availability_events
+    from http_cache import ensure_catalog_version
+    from stats import reconcile
+    from overdue import mark_overdue
+    from suggest import build_index
+    
+    with app.app_context():
+        # The schema lives on the primary; a read replica receives it from there
+        db.create_all(bind_key=None)
+        applied = upgrade()
+        ensure_search_index()
+        ensure_fuzzy_index()
+        ensure_availability_events()
+        ensure_catalog_version()
+        mark_overdue()
+        reconcile()
+        build_index()
+    
+    return applied
+
 if __name__ == '__main__':
     app = create_app()
     with app.app_context():
-        db.create_all()
+        db.create_all(bind_key=None)
     app.run(debug=True, host='0.0.0.0', port=5000)
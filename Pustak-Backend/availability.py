@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import text, select, func, case, delete
+from sqlalchemy.exc import OperationalError
+from database import db, Book, DonatedBook, AvailabilityEvent
+
+# Copy availability events for the live feed (events_server.py).
+#
+# Triggers on donated_book append a row to availability_event whenever a
+# copy is donated, changes availability (borrow, return, force return, desk
+# check-out/in, holds setting copies aside) or is removed, in the same
+# transaction as the change. Every write path is covered, Core bulk updates
+# included, without the routes having to remember to emit anything.
+#
+# Events only name the book; readers look up the current counts with
+# book_availability(), so a burst of changes to one book collapses into a
+# single up-to-date message. Old events are pruned by a scheduled job.
+
+EVENT_TABLE = AvailabilityEvent.__tablename__
+
+TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS {EVENT_TABLE}_ai AFTER INSERT ON donated_book BEGIN
+        INSERT INTO {EVENT_TABLE}(book_id, donated_book_id, kind, created_at)
+        VALUES (new.book_id, new.id, 'donation', datetime('now'));
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {EVENT_TABLE}_au AFTER UPDATE OF is_available, book_id ON donated_book
+    WHEN old.is_available IS NOT new.is_available OR old.book_id IS NOT new.book_id BEGIN
+        INSERT INTO {EVENT_TABLE}(book_id, donated_book_id, kind, created_at)
+        VALUES (new.book_id, new.id, 'availability', datetime('now'));
+        INSERT INTO {EVENT_TABLE}(book_id, donated_book_id, kind, created_at)
+        SELECT old.book_id, old.id, 'availability', datetime('now') WHERE old.book_id IS NOT new.book_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {EVENT_TABLE}_ad AFTER DELETE ON donated_book BEGIN
+        INSERT INTO {EVENT_TABLE}(book_id, donated_book_id, kind, created_at)
+        VALUES (old.book_id, old.id, 'availability', datetime('now'));
+    END""",
+]
+
+# Engine URL -> whether the triggers are installed
+_triggers_ready = {}
+
+def ensure_availability_events():
+    engine = db.engine
+    key = str(engine.url)
+
+    if key not in _triggers_ready:
+        if engine.dialect.name != 'sqlite':
+            # The trigger syntax is SQLite's; other databases get no live feed
+            _triggers_ready[key] = False
+        else:
+            try:
+                with engine.begin() as conn:
+                    for statement in TRIGGERS:
+                        conn.execute(text(statement))
+                _triggers_ready[key] = True
+            except OperationalError:
+                _triggers_ready[key] = False
+
+    return _triggers_ready[key]
+
+def last_event_id():
+    return db.session.execute(select(func.max(AvailabilityEvent.id))).scalar() or 0
+
+def oldest_event_id():
+    return db.session.execute(select(func.min(AvailabilityEvent.id))).scalar()
+
+def events_after(event_id, limit, categories=None):
+    # (id, book_id, kind) in order; with categories, only books in them
+    columns = (AvailabilityEvent.id, AvailabilityEvent.book_id, AvailabilityEvent.kind)
+    if categories is None:
+        return db.session.execute(
+            select(*columns).where(AvailabilityEvent.id > event_id).order_by(AvailabilityEvent.id).limit(limit)
+        ).all()
+
+    # Categories arrive casefold()ed, as the events hub matches them. SQLite's
+    # lower() only folds ASCII ("Éducation"), so they are matched here instead,
+    # reading the log in batches of limit until enough events match.
+    categories = set(categories)
+    query = select(*columns, Book.category).join(Book, Book.id == AvailabilityEvent.book_id)
+    events = []
+    while len(events) < limit:
+        rows = db.session.execute(
+            query.where(AvailabilityEvent.id > event_id).order_by(AvailabilityEvent.id).limit(limit)
+        ).all()
+        events += [row[:3] for row in rows if (row.category or '').casefold() in categories]
+        if len(rows) < limit:
+            break
+        event_id = rows[-1].id
+    return events[:limit]
+
+def book_availability(book_ids):
+    # {book_id: {...}} with current copy counts; deleted books are absent
+    if not book_ids:
+        return {}
+
+    rows = db.session.execute(
+        select(
+            Book.id, Book.title, Book.category,
+            func.count(DonatedBook.id),
+            func.coalesce(func.sum(case((DonatedBook.is_available == True, 1), else_=0)), 0)
+        ).outerjoin(DonatedBook, DonatedBook.book_id == Book.id).where(
+            Book.id.in_(book_ids)
+        ).group_by(Book.id)
+    ).all()
+
+    return {
+        book_id: {
+            'book_id': book_id,
+            'title': title,
+            'category': category,
+            'total_copies': total,
+            'available_copies': available,
+            'is_available': available > 0
+        }
+        for book_id, title, category, total, available in rows
+    }
+
+def prune_availability_events():
+    # Scheduled: clients reconnecting after this long get a fresh snapshot instead
+    retention = current_app.config.get('AVAILABILITY_EVENT_RETENTION', 86400)
+    result = db.session.execute(
+        delete(AvailabilityEvent).where(
+            AvailabilityEvent.created_at < datetime.utcnow() - timedelta(seconds=retention)
+        )
+    )
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,69 @@
+from sqlalchemy import event, select, update, bindparam
+from sqlalchemy.orm.attributes import set_committed_value
+from database import DonatedBook
+
+# Barcodes for donated copies, scanned at the lending desk.
+#
+# Every copy gets one: PK + the zero-padded copy id + a mod-10 check digit
+# (e.g. PK000000425), so labels can be printed from the id and mistyped
+# codes are rejected instead of resolving to the wrong copy. Copies that
+# arrive with a label of their own keep it; such labels may not use the PK
+# prefix, which is reserved for generated codes.
+#
+# ORM inserts are labelled by the after_insert hook below. Core bulk inserts
+# (importer.py, seed_data.py) call assign_missing() themselves.
+
+PREFIX = 'PK'
+MAX_LENGTH = 32
+
+def _check_digit(digits):
+    total = 0
+    for position, digit in enumerate(reversed(digits)):
+        value = int(digit) * (2 if position % 2 == 0 else 1)
+        total += value - 9 if value > 9 else value
+    return str((10 - total % 10) % 10)
+
+def barcode_for(copy_id):
+    digits = f'{copy_id:08d}'
+    return f'{PREFIX}{digits}{_check_digit(digits)}'
+
+def normalize(code):
+    return ''.join(str(code).split()).upper()
+
+def is_generated(code):
+    return code.startswith(PREFIX)
+
+def validate_custom(code):
+    # Error message for an unacceptable hand-supplied label, or None
+    if not code:
+        return 'Barcode cannot be empty'
+    if len(code) > MAX_LENGTH:
+        return f'Barcode cannot be longer than {MAX_LENGTH} characters'
+    if is_generated(code):
+        return f'Barcodes starting with {PREFIX} are assigned automatically'
+    return None
+
+def assign_missing(connection, batch_size=10000):
+    # Label every copy without a barcode; takes a session or a connection
+    table = DonatedBook.__table__
+    assign = update(table).where(table.c.id == bindparam('copy_id')).values(barcode=bindparam('code'))
+
+    assigned = 0
+    while True:
+        ids = connection.execute(
+            select(table.c.id).where(table.c.barcode.is_(None)).order_by(table.c.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return assigned
+
+        connection.execute(assign, [{'copy_id': copy_id, 'code': barcode_for(copy_id)} for copy_id in ids])
+        assigned += len(ids)
+
+@event.listens_for(DonatedBook, 'after_insert')
+def _label_new_copy(mapper, connection, target):
+    if target.barcode is None:
+        code = barcode_for(target.id)
+        connection.execute(
+            update(DonatedBook.__table__).where(DonatedBook.__table__.c.id == target.id).values(barcode=code)
+        )
+        set_committed_value(target, 'barcode', code)
@@ -0,0 +1,149 @@
+"""Concurrent borrow benchmark for a single popular title.
+
+Starts several worker processes, each firing many simultaneous
+POST /api/books/<id>/borrow requests through the real blueprint against a
+shared SQLite file, then checks that no copy was handed out twice.
+Requests that time out waiting for the database lock get a 503 and are
+safe to retry; they never hold a copy.
+
+    python -m benchmarks.borrow_concurrency --processes 4 --threads 100 --copies 25
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from app import create_app
+from database import db, User, Book, DonatedBook, BorrowedBook
+
+def make_app(db_path):
+    return create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}'})
+
+def setup_database(db_path, borrowers, copies):
+    app = make_app(db_path)
+
+    with app.app_context():
+        db.create_all()
+
+        donor = User(username='donor', email='donor@example.com', password_hash='-')
+        book = Book(title='Godan', author='Premchand', category='उपन्यास')
+        db.session.add_all([donor, book])
+        db.session.flush()
+
+        db.session.add_all([
+            DonatedBook(book_id=book.id, donor_id=donor.id) for _ in range(copies)
+        ])
+        db.session.add_all([
+            User(username=f'reader{i}', email=f'reader{i}@example.com', password_hash='-')
+            for i in range(borrowers)
+        ])
+        db.session.commit()
+
+        reader_ids = [user.id for user in User.query.filter(User.username != 'donor').all()]
+        return book.id, reader_ids
+
+def worker(db_path, book_id, user_ids, start_at, results):
+    from flask_jwt_extended import create_access_token
+
+    app = make_app(db_path)
+    with app.app_context():
+        tokens = [create_access_token(identity=user_id) for user_id in user_ids]
+
+    statuses = []
+    latencies = []
+    lock = threading.Lock()
+
+    def borrow(token):
+        client = app.test_client()
+        # Line every thread in every process up on the same instant
+        time.sleep(max(0, start_at - time.time()))
+        started = time.perf_counter()
+        response = client.post(
+            f'/api/books/{book_id}/borrow',
+            headers={'Authorization': f'Bearer {token}'}
+        )
+        elapsed = time.perf_counter() - started
+        with lock:
+            statuses.append(response.status_code)
+            latencies.append(elapsed)
+
+    threads = [threading.Thread(target=borrow, args=(token,)) for token in tokens]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results.put((statuses, latencies))
+
+def verify(db_path, book_id):
+    app = make_app(db_path)
+
+    with app.app_context():
+        active = BorrowedBook.query.filter_by(book_id=book_id, is_returned=False).all()
+        per_copy = Counter(borrowing.donated_book_id for borrowing in active)
+        unavailable = DonatedBook.query.filter_by(book_id=book_id, is_available=False).count()
+
+        return {
+            'borrowings': len(active),
+            'copies_marked_unavailable': unavailable,
+            'double_allocated_copies': sum(1 for count in per_copy.values() if count > 1)
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=75, help='concurrent borrowers per process')
+    parser.add_argument('--copies', type=int, default=25)
+    args = parser.parse_args()
+
+    borrowers = args.processes * args.threads
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'borrow_bench.db')
+        book_id, reader_ids = setup_database(db_path, borrowers, args.copies)
+
+        results = multiprocessing.Queue()
+        start_at = time.time() + 2.0
+        chunks = [reader_ids[i::args.processes] for i in range(args.processes)]
+        processes = [
+            multiprocessing.Process(target=worker, args=(db_path, book_id, chunk, start_at, results))
+            for chunk in chunks
+        ]
+
+        for process in processes:
+            process.start()
+
+        statuses = Counter()
+        latencies = []
+        for _ in processes:
+            chunk_statuses, chunk_latencies = results.get()
+            statuses.update(chunk_statuses)
+            latencies.extend(chunk_latencies)
+
+        for process in processes:
+            process.join()
+
+        wall = max(latencies) if latencies else 0
+        latencies.sort()
+        summary = verify(db_path, book_id)
+
+        print(f'{borrowers} concurrent borrowers in {args.processes} processes, {args.copies} copies')
+        print(f'status codes: {dict(statuses)}')
+        print(f'latency p50={latencies[len(latencies) // 2] * 1000:.1f}ms '
+              f'p99={latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms max={wall * 1000:.1f}ms')
+        print(f'result: {summary}')
+
+        # Every 201 must own a distinct copy, and every claimed copy must have a borrowing
+        ok = (
+            summary['double_allocated_copies'] == 0
+            and summary['borrowings'] == statuses[201]
+            and summary['copies_marked_unavailable'] == summary['borrowings']
+        )
+        print('PASS: no copy allocated twice' if ok else 'FAIL: allocation invariant violated')
+        raise SystemExit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Cover uploads: upload latency, thumbnail cost and bytes per catalog grid.
+
+Generates phone-sized JPEG photos, uploads them through the Flask test
+client (streamed to disk, hashed and checked) and reports:
+
+  upload      - POST /api/books/<id>/cover, thumbnails queued to the pool
+  thumbnails  - time to make every COVER_THUMBNAIL_SIZES width for one photo,
+                with and without JPEG draft (reduced-scale) decoding
+  grid        - bytes a 24-cover catalog page downloads with originals
+                versus each thumbnail width
+
+    python -m benchmarks.covers --photos 10
+"""
+import argparse
+import io
+import os
+import statistics
+import tempfile
+import time
+
+from PIL import Image, ImageDraw, JpegImagePlugin
+
+from app import create_app, prepare_database
+from database import db, Book, User
+import covers
+
+GRID = 24
+
+def photo(seed, size=(3024, 4032)):
+    # A gradient with shapes: compresses like a photo, unlike flat colour or noise
+    image = Image.linear_gradient('L').resize(size).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    for index in range(40):
+        x, y = (seed * 97 + index * 131) % size[0], (seed * 53 + index * 211) % size[1]
+        draw.ellipse((x, y, x + 400, y + 300), fill=((seed * 40) % 255, index * 6, 200 - index * 4))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+def token(client):
+    client.post('/api/auth/register', json={'username': 'bench', 'email': 'bench@example.com', 'password': 'secret12'})
+    User.query.filter_by(username='bench').update({'is_admin': True})
+    db.session.commit()
+    response = client.post('/api/auth/login', json={'username': 'bench', 'password': 'secret12'})
+    return response.get_json()['access_token']
+
+def thumbnail_time(root, name, sizes, draft):
+    original = JpegImagePlugin.JpegImageFile.draft
+    if not draft:
+        JpegImagePlugin.JpegImageFile.draft = lambda self, mode, size: None
+    try:
+        started = time.perf_counter()
+        covers.make_thumbnails(root, name, sizes)
+        return time.perf_counter() - started
+    finally:
+        JpegImagePlugin.JpegImageFile.draft = original
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--photos', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=1, help='COVER_WORKERS during uploads')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(tmp, "covers.db")}',
+            'UPLOAD_FOLDER': os.path.join(tmp, 'uploads'),
+            'PASSWORD_HASH_WORKERS': 0,
+            'COVER_WORKERS': args.workers,
+        })
+        prepare_database(app)
+        photos = [photo(seed) for seed in range(args.photos)]
+
+        with app.app_context():
+            client = app.test_client()
+            headers = {'Authorization': f'Bearer {token(client)}', 'Content-Type': 'image/jpeg'}
+            books = [Book(title=f'Bench {index}', author='Bench', isbn=f'B{index}') for index in range(args.photos)]
+            db.session.add_all(books)
+            db.session.commit()
+            book_ids = [book.id for book in books]
+
+            uploads, names = [], []
+            for book_id, data in zip(book_ids, photos):
+                started = time.perf_counter()
+                response = client.post(f'/api/books/{book_id}/cover', data=data, headers=headers)
+                uploads.append(time.perf_counter() - started)
+                assert response.status_code == 201, response.get_data(as_text=True)
+                names.append(response.get_json()['cover']['url'].rsplit('/', 1)[1])
+
+            root, sizes = covers.cover_root(), covers.thumbnail_sizes()
+            pending = [covers.cover_path(root, covers.thumbnail_name(name.split('.')[0], size))
+                       for name in names for size in sizes]
+            while not all(os.path.exists(path) for path in pending):
+                time.sleep(0.01)
+            ready = time.perf_counter() - started
+
+            print(f'Photo: 3024x4032 JPEG, mean {statistics.mean(map(len, photos)) / 1024:.0f} KiB')
+            print(f'upload: mean {statistics.mean(uploads) * 1000:.1f} ms, '
+                  f'max {max(uploads) * 1000:.1f} ms (thumbnails not awaited)')
+            print(f'all thumbnails ready {ready * 1000:.0f} ms after the last upload\n')
+
+            # Thumbnails timed inline, from scratch each time
+            print(f'{"decode":>8} {"per photo ms":>13}')
+            for draft in (False, True):
+                timings = []
+                for name in names:
+                    cover_id = name.split('.')[0]
+                    for size in sizes:
+                        path = covers.cover_path(root, covers.thumbnail_name(cover_id, size))
+                        if os.path.exists(path):
+                            os.unlink(path)
+                    timings.append(thumbnail_time(root, name, sizes, draft))
+                print(f'{"draft" if draft else "full":>8} {statistics.mean(timings) * 1000:>13.1f}')
+
+            print(f'\n{"grid of " + str(GRID):>12} {"KiB":>8}')
+            originals = statistics.mean(len(data) for data in photos)
+            print(f'{"original":>12} {originals * GRID / 1024:>8.0f}')
+            for size in sizes:
+                mean = statistics.mean(
+                    os.path.getsize(covers.cover_path(root, covers.thumbnail_name(name.split('.')[0], size)))
+                    for name in names
+                )
+                print(f'{str(size) + " px":>12} {mean * GRID / 1024:>8.0f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Fuzzy search latency: trigram index versus scanning every book's key.
+
+Seeds catalogs of growing size and times misspelled and cross-script
+queries two ways:
+
+  index  - fuzzy.apply_fuzzy(), one trigram index lookup per query trigram
+  scan   - read every book's search_latin and score it in Python, what fuzzy
+           matching costs without an index
+
+The seeder draws titles from a small vocabulary, so trigrams repeat far more
+than in a real catalog; treat the index numbers as an upper bound.
+
+    python -m benchmarks.fuzzy --sizes 5000 20000 80000
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from app import create_app, prepare_database
+from database import db, Book
+from fuzzy import apply_fuzzy, fold, latinize, trigrams
+from seed_data import seed
+
+QUERIES = ['madhushaala', 'गोदन', 'histroy of inda', 'monsoon jurney', 'kamayni', 'चित्रलेका']
+
+def time_queries(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            started = time.perf_counter()
+            run(query)
+            timings.append(time.perf_counter() - started)
+    return statistics.mean(timings) * 1000
+
+def scan(query, threshold):
+    grams = set(trigrams(latinize(fold(query))))
+    matches = []
+    for book_id, key in db.session.query(Book.id, Book.search_latin):
+        share = len(grams & set(trigrams(key or ''))) / len(grams)
+        if share >= threshold:
+            matches.append((-share, len(key), book_id))
+    return sorted(matches)[:10]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5000, 20000, 80000], help='books to seed')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'{"books":>8} {"index ms":>9} {"scan ms":>9}')
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            app = create_app({
+                'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(tmp, "fuzzy.db")}',
+                'PASSWORD_HASH_WORKERS': 0,
+            })
+            prepare_database(app)
+
+            with app.app_context():
+                seed(users=50, books=size, donations=size, borrowings=0, log=lambda message: None)
+
+            with app.test_request_context():
+                threshold = app.config['FUZZY_THRESHOLD']
+                indexed = time_queries(lambda query: apply_fuzzy(Book.query, query).limit(10).all(), args.repeat)
+                scanned = time_queries(lambda query: scan(query, threshold), 1)
+                db.session.remove()
+
+            print(f'{size:>8} {indexed:>9.1f} {scanned:>9.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""Query plans and latency of the hot queries before and after the index migration.
+
+Builds a large synthetic database without the composite indexes (as an
+existing production database would be), measures the hot queries, applies
+migrations.upgrade(), and measures again.
+
+    python -m benchmarks.index_plans --books 50000 --copies 200000 --borrowings 200000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app import create_app
+from database import db
+from migrations import upgrade
+
+INDEX_MIGRATION = 3
+INDEXES = [
+    'ix_book_title_author',
+    'ix_donated_book_book_available',
+    'ix_donated_book_donor_available',
+    'ix_borrowed_book_borrower_active',
+    'ix_borrowed_book_book_active',
+    'ix_borrowed_book_returned_due',
+]
+
+# (label, SQL, parameter factory)
+def hot_queries(args, now):
+    return [
+        ('overdue check (borrow_book)',
+         'SELECT count(*) FROM borrowed_book WHERE borrower_id = :user AND is_returned = 0 AND due_date < :now',
+         lambda: {'user': random.randint(1, args.users), 'now': now}),
+        ('already borrowed (borrow_book)',
+         'SELECT id FROM borrowed_book WHERE book_id = :book AND borrower_id = :user AND is_returned = 0 LIMIT 1',
+         lambda: {'book': random.randint(1, args.books), 'user': random.randint(1, args.users)}),
+        ('copy candidates (claim)',
+         'SELECT id FROM donated_book WHERE book_id = :book AND is_available = 1 LIMIT 8',
+         lambda: {'book': random.randint(1, args.books)}),
+        ('available copy counts (page)',
+         'SELECT book_id, count(id) FROM donated_book WHERE book_id IN ({}) AND is_available = 1 GROUP BY book_id',
+         None),
+        ('my donations page',
+         'SELECT id FROM donated_book WHERE donor_id = :user ORDER BY id LIMIT 10',
+         lambda: {'user': random.randint(1, args.users)}),
+        ('donation stats',
+         'SELECT count(*) FROM donated_book WHERE donor_id = :user AND is_available = 1',
+         lambda: {'user': random.randint(1, args.users)}),
+        ('donate dedupe (title, author)',
+         'SELECT id FROM book WHERE title = :title AND author = :author LIMIT 1',
+         lambda: {'title': f'Book {random.randint(1, args.books)}', 'author': f'Author {random.randint(1, 500)}'}),
+        ('active borrowings of book (delete)',
+         'SELECT count(*) FROM borrowed_book WHERE book_id = :book AND is_returned = 0',
+         lambda: {'book': random.randint(1, args.books)}),
+        ('overdue total (reconcile)',
+         'SELECT count(*) FROM borrowed_book WHERE is_returned = 0 AND due_date < :now',
+         lambda: {'now': now}),
+    ]
+
+def populate(conn, args, now):
+    conn.execute(text(
+        "INSERT INTO user (id, username, email, password_hash, is_admin, token_version, created_at) "
+        "VALUES (:id, :username, :email, '-', 0, 0, :now)"
+    ), [{'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'now': now}
+        for i in range(1, args.users + 1)])
+
+    conn.execute(text(
+        "INSERT INTO book (id, title, author, category, is_available, created_at) "
+        "VALUES (:id, :title, :author, 'General', 1, :now)"
+    ), [{'id': i, 'title': f'Book {i}', 'author': f'Author {i % 500}', 'now': now}
+        for i in range(1, args.books + 1)])
+
+    conn.execute(text(
+        "INSERT INTO donated_book (id, book_id, donor_id, condition, is_available, donated_at) "
+        "VALUES (:id, :book, :donor, 'Good', :available, :now)"
+    ), [{'id': i, 'book': random.randint(1, args.books), 'donor': random.randint(1, args.users),
+         'available': random.random() < 0.7, 'now': now}
+        for i in range(1, args.copies + 1)])
+
+    conn.execute(text(
+        "INSERT INTO borrowed_book (id, book_id, borrower_id, donated_book_id, borrowed_at, due_date, is_returned) "
+        "VALUES (:id, :book, :user, :copy, :borrowed, :due, :returned)"
+    ), [{'id': i, 'book': random.randint(1, args.books), 'user': random.randint(1, args.users),
+         'copy': random.randint(1, args.copies), 'borrowed': now - timedelta(days=random.randint(0, 400)),
+         'due': now + timedelta(days=random.randint(-30, 14)), 'returned': random.random() < 0.9}
+        for i in range(1, args.borrowings + 1)])
+
+def measure(conn, queries, args):
+    results = {}
+    for label, sql, params in queries:
+        if params is None:
+            ids = ', '.join(str(random.randint(1, args.books)) for _ in range(20))
+            statement, params = text(sql.format(ids)), dict
+        else:
+            statement = text(sql)
+
+        plan = conn.execute(text(f'EXPLAIN QUERY PLAN {statement.text}'), params()).fetchall()
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            conn.execute(statement, params()).fetchall()
+        elapsed = (time.perf_counter() - started) / args.repeat
+        results[label] = (elapsed * 1e6, ' / '.join(row[-1] for row in plan))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--books', type=int, default=50000)
+    parser.add_argument('--copies', type=int, default=200000)
+    parser.add_argument('--borrowings', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    random.seed(42)
+    now = datetime.utcnow()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(tmp, "plans.db")}'})
+
+        with app.app_context():
+            db.create_all()
+            upgrade()
+
+            # Recreate the pre-migration schema: no composite indexes, migration not applied
+            with db.engine.begin() as conn:
+                for name in INDEXES:
+                    conn.execute(text(f'DROP INDEX {name}'))
+                conn.execute(text('DELETE FROM schema_migrations WHERE version = :v'), {'v': INDEX_MIGRATION})
+
+                print(f'Populating {args.users} users, {args.books} books, '
+                      f'{args.copies} copies, {args.borrowings} borrowings...')
+                populate(conn, args, now)
+
+            queries = hot_queries(args, now)
+            with db.engine.connect() as conn:
+                before = measure(conn, queries, args)
+
+            started = time.perf_counter()
+            upgrade()
+            migration_seconds = time.perf_counter() - started
+
+            with db.engine.connect() as conn:
+                after = measure(conn, queries, args)
+
+        print(f'Index migration took {migration_seconds:.1f}s\n')
+        for label, _, _ in queries:
+            before_us, before_plan = before[label]
+            after_us, after_plan = after[label]
+            print(f'{label}')
+            print(f'  before {before_us:10.1f}us  {before_plan}')
+            print(f'  after  {after_us:10.1f}us  {after_plan}')
+
+if __name__ == '__main__':
+    main()
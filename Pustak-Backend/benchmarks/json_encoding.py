@@ -0,0 +1,95 @@
+"""Serialization cost of 1k-row book and borrowing pages.
+
+Builds in-memory pages shaped like GET /api/books/ and GET
+/api/admin/borrowings (no database) and times turning them into a JSON
+response three ways:
+
+  before  - to_dict() formatting every datetime with .isoformat(), stdlib encoder
+  stdlib  - datetimes passed through, encoded by the stdlib provider
+  orjson  - datetimes passed through, encoded by the orjson provider
+
+    python -m benchmarks.json_encoding --rows 1000 --repeat 50
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from app import create_app
+from database import Book, BorrowedBook, User
+from json_provider import StdlibJSONProvider, OrjsonJSONProvider, orjson
+
+def make_rows(count):
+    now = datetime.utcnow()
+    users = [User(id=i, username=f'पाठक{i}', email=f'reader{i}@example.com', is_admin=False,
+                  created_at=now - timedelta(days=i)) for i in range(50)]
+    books = [Book(id=i, title=f'गोदान भाग {i} / Godan part {i}', author='प्रेमचंद', isbn=f'97881{i:08d}',
+                  category='उपन्यास', description='किसान जीवन पर आधारित उपन्यास ' * 3, image_url='',
+                  is_available=True, created_at=now - timedelta(minutes=i)) for i in range(count)]
+    borrowings = [BorrowedBook(id=i, book_id=i, borrower_id=i % 50, donated_book_id=i,
+                               borrowed_at=now - timedelta(days=3), due_date=now + timedelta(days=11),
+                               returned_at=None if i % 3 else now, is_returned=not i % 3) for i in range(count)]
+    return users, books, borrowings
+
+def iso(data):
+    # What to_dict() used to do for every datetime
+    return {key: value.isoformat() if isinstance(value, datetime) else value for key, value in data.items()}
+
+def book_page(books, before):
+    rows = [book.to_dict(available_copies=2) for book in books]
+    return [iso(row) for row in rows] if before else rows
+
+def borrowing_page(borrowings, books, users, before):
+    book_dicts = {book.id: book.to_dict(available_copies=1) for book in books}
+    user_dicts = {user.id: user.to_dict() for user in users}
+    if before:
+        book_dicts = {key: iso(value) for key, value in book_dicts.items()}
+        user_dicts = {key: iso(value) for key, value in user_dicts.items()}
+
+    result = []
+    for borrowing in borrowings:
+        data = borrowing.to_dict(include_related=False)
+        if before:
+            data = iso(data)
+        data['book'] = book_dicts[borrowing.book_id]
+        data['borrower'] = user_dicts[borrowing.borrower_id]
+        result.append(data)
+    return result
+
+def timed(func, repeat):
+    func()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'DEBUG': False})
+    users, books, borrowings = make_rows(args.rows)
+
+    modes = [('before', StdlibJSONProvider, True), ('stdlib', StdlibJSONProvider, False)]
+    if orjson is not None:
+        modes.append(('orjson', OrjsonJSONProvider, False))
+    else:
+        print('orjson is not installed; skipping it')
+
+    print(f'{args.rows}-row pages, mean of {args.repeat} runs (ms): serialize + encode / encode only')
+    with app.test_request_context():
+        for page_name, build in [
+            ('books', lambda before: {'books': book_page(books, before), 'total': args.rows}),
+            ('borrowings', lambda before: {'borrowings': borrowing_page(borrowings, books, users, before)}),
+        ]:
+            for mode, provider_class, before in modes:
+                provider = provider_class(app)
+                payload = build(before)
+                full = timed(lambda: provider.response(build(before)), args.repeat)
+                encode = timed(lambda: provider.response(payload), args.repeat)
+                size = len(provider.response(payload).get_data())
+                print(f'{page_name:>10} {mode:>7}: {full:7.2f} / {encode:6.2f}   {size // 1024} KiB')
+
+if __name__ == '__main__':
+    main()
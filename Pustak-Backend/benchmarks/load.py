@@ -0,0 +1,213 @@
+"""End-to-end load benchmark through the real blueprints.
+
+Seeds a synthetic library (see seed_data.py), or uses an existing database,
+then runs concurrent virtual users in-process for a fixed time. Each user
+picks operations from a weighted mix - login, search, borrow, return,
+donate and the admin dashboard - and the benchmark reports per-endpoint
+throughput, status classes and p50/p95/p99 latency.
+
+    python -m benchmarks.load --size 100000 --threads 16 --seconds 30
+    python -m benchmarks.load --database sqlite:////tmp/seeded.db --mix search=60,borrow=20,return=20
+
+Against an existing database the benchmark really borrows, returns and
+donates, so point it at a copy.
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from app import create_app, prepare_database
+from database import db, User, Book
+from seed_data import seed, SEED_PASSWORD
+
+DEFAULT_MIX = 'login=5,search=45,borrow=15,return=15,donate=10,dashboard=10'
+SEARCH_TERMS = ['गोदान', 'मधुशाला', 'नदी', 'गंगा', 'कहानियाँ', 'River', 'History', 'India',
+                'Monsoon', 'Science', 'Stories', 'Garden', 'Premchand', 'Bond', 'Roy', 'tale']
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in OPERATIONS:
+            raise SystemExit(f"Unknown operation '{name}', expected: {', '.join(OPERATIONS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+class VirtualUser:
+    def __init__(self, app, username, token, admin_token, catalog, rng):
+        self.client = app.test_client()
+        self.username = username
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.admin_headers = {'Authorization': f'Bearer {admin_token}'}
+        self.catalog = catalog
+        self.rng = rng
+        self.borrowed = []
+
+    def login(self):
+        return self.client.post('/api/auth/login', json={'username': self.username, 'password': SEED_PASSWORD})
+
+    def search(self):
+        return self.client.get('/api/books/', query_string={
+            'search': self.rng.choice(SEARCH_TERMS),
+            'page': self.rng.randint(1, 3),
+            'per_page': 20
+        })
+
+    def borrow(self):
+        book_id, _, _ = self.rng.choice(self.catalog)
+        response = self.client.post(f'/api/books/{book_id}/borrow', headers=self.headers)
+        if response.status_code == 201:
+            self.borrowed.append(response.get_json()['borrowing']['id'])
+        return response
+
+    def return_book(self):
+        borrowing_id = self.borrowed.pop(self.rng.randrange(len(self.borrowed)))
+        return self.client.post(f'/api/books/return/{borrowing_id}', headers=self.headers)
+
+    def donate(self):
+        _, title, author = self.rng.choice(self.catalog)
+        return self.client.post('/api/donations/', headers=self.headers, json={
+            'title': title,
+            'author': author,
+            'condition': 'Good'
+        })
+
+    def dashboard(self):
+        return self.client.get('/api/admin/dashboard', headers=self.admin_headers)
+
+OPERATIONS = {
+    'login': VirtualUser.login,
+    'search': VirtualUser.search,
+    'borrow': VirtualUser.borrow,
+    'return': VirtualUser.return_book,
+    'donate': VirtualUser.donate,
+    'dashboard': VirtualUser.dashboard,
+}
+
+def prepare(app, args):
+    from flask_jwt_extended import create_access_token
+    from identity import token_claims
+
+    # Set up exactly as the server does before serving
+    prepare_database(app)
+
+    with app.app_context():
+        if args.size:
+            started = time.perf_counter()
+            report = seed(
+                users=max(args.threads, args.size // 20),
+                books=max(1, args.size // 4),
+                donations=args.size,
+                borrowings=args.size // 2,
+                prefix='loaduser',
+                log=lambda message: None
+            )
+            print(f'Seeded {report.users} users, {report.books} books, {report.donations} donations, '
+                  f'{report.borrowings} borrowings in {time.perf_counter() - started:.1f}s')
+
+        admin = User.query.filter_by(is_admin=True).first()
+        if not admin:
+            admin = User(username='load-admin', email='load-admin@example.com', is_admin=True)
+            admin.set_password(SEED_PASSWORD)
+            db.session.add(admin)
+            db.session.commit()
+        admin_token = create_access_token(identity=admin.id, additional_claims=token_claims(admin))
+
+        readers = User.query.filter(User.is_admin == False).order_by(db.func.random()).limit(args.threads).all()
+        if len(readers) < args.threads:
+            raise SystemExit(f'Need at least {args.threads} non-admin users, found {len(readers)}')
+        users = [
+            (reader.username, create_access_token(identity=reader.id, additional_claims=token_claims(reader)))
+            for reader in readers
+        ]
+
+        catalog = [tuple(row) for row in db.session.query(Book.id, Book.title, Book.author)
+                   .order_by(db.func.random()).limit(5000).all()]
+
+    return users, admin_token, catalog
+
+def run(app, users, admin_token, catalog, mix, args):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    latencies = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + args.seconds
+
+    def loop(index):
+        rng = random.Random(index)
+        username, token = users[index]
+        user = VirtualUser(app, username, token, admin_token, catalog, rng)
+
+        while time.perf_counter() < stop_at:
+            name = rng.choices(names, weights)[0]
+            if name == 'return' and not user.borrowed:
+                # Nothing on loan yet, so borrow instead
+                name = 'borrow'
+            started = time.perf_counter()
+            response = OPERATIONS[name](user)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies[name].append(elapsed)
+                statuses[name][response.status_code // 100] += 1
+
+    threads = [threading.Thread(target=loop, args=(i,)) for i in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+
+    print(f'\n{"endpoint":>10} {"requests":>9} {"req/s":>8} {"2xx":>7} {"4xx":>6} {"5xx":>6} '
+          f'{"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}')
+    everything = []
+    for name in names:
+        values = latencies[name]
+        everything += values
+        if not values:
+            continue
+        counts = statuses[name]
+        print(f'{name:>10} {len(values):>9} {len(values) / duration:>8.1f} {counts[2]:>7} {counts[4]:>6} {counts[5]:>6} '
+              f'{percentile(values, 0.50):>8.1f} {percentile(values, 0.95):>8.1f} {percentile(values, 0.99):>8.1f}')
+    print(f'{"total":>10} {len(everything):>9} {len(everything) / duration:>8.1f} {"":>7} {"":>6} '
+          f'{sum(statuses[name][5] for name in names):>6} '
+          f'{percentile(everything, 0.50):>8.1f} {percentile(everything, 0.95):>8.1f} {percentile(everything, 0.99):>8.1f}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='SQLAlchemy URL of an existing (seeded) database')
+    parser.add_argument('--size', type=int, help='donated copies to seed (default: 10000 for a fresh database, 0 with --database)')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=int, default=20)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'operation weights (default: {DEFAULT_MIX})')
+    parser.add_argument('--rounds', type=int, default=12, help='bcrypt work factor for logins')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    if args.size is None:
+        args.size = 0 if args.database else 10000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database or f'sqlite:///{os.path.join(tmp, "load.db")}'
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': url,
+            'PASSWORD_HASH_ROUNDS': args.rounds
+        })
+
+        users, admin_token, catalog = prepare(app, args)
+        print(f'{args.threads} threads for {args.seconds}s, mix {args.mix}, {os.cpu_count()} CPUs')
+        run(app, users, admin_token, catalog, mix, args)
+
+if __name__ == '__main__':
+    main()
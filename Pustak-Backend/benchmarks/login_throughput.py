@@ -0,0 +1,116 @@
+"""Login throughput versus concurrent catalog latency.
+
+Runs a burst of concurrent logins alongside catalog searches through the
+real blueprints, once with password hashing inline on the request threads
+and once through the bounded hashing pool, and reports logins/second and
+catalog p50/p95/p99 latency for each.
+
+    python -m benchmarks.login_throughput --login-threads 16 --catalog-threads 4 --seconds 10
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from app import create_app
+from database import db, User, Book
+from passwords import _hash
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000
+
+def build_database(db_path, users, books, rounds):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'PASSWORD_HASH_WORKERS': 0
+    })
+
+    with app.app_context():
+        db.create_all()
+        password_hash = _hash('password123', rounds)
+        db.session.add_all([
+            User(username=f'student{i}', email=f'student{i}@example.com', password_hash=password_hash)
+            for i in range(users)
+        ])
+        db.session.add_all([
+            Book(title=f'पुस्तक {i} Book {i}', author=f'Author {i % 50}', category='Test')
+            for i in range(books)
+        ])
+        db.session.commit()
+
+def run_mode(db_path, workers, rounds, args):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'PASSWORD_HASH_ROUNDS': rounds,
+        'PASSWORD_HASH_WORKERS': workers
+    })
+
+    if workers:
+        from passwords import warm_up
+        with app.app_context():
+            warm_up()
+
+    stop_at = time.time() + args.seconds
+    logins = []
+    catalog_latencies = []
+    lock = threading.Lock()
+
+    def login_loop(index):
+        client = app.test_client()
+        while time.time() < stop_at:
+            response = client.post('/api/auth/login', json={
+                'username': f'student{index % args.users}',
+                'password': 'password123'
+            })
+            with lock:
+                logins.append(response.status_code)
+
+    def catalog_loop(index):
+        client = app.test_client()
+        while time.time() < stop_at:
+            started = time.perf_counter()
+            client.get('/api/books/', query_string={'search': f'Book {index}', 'per_page': 20})
+            with lock:
+                catalog_latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=login_loop, args=(i,)) for i in range(args.login_threads)]
+    threads += [threading.Thread(target=catalog_loop, args=(i,)) for i in range(args.catalog_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    label = f'pool ({workers} workers)' if workers else 'inline'
+    print(f'{label:>18}: {logins.count(200) / args.seconds:7.1f} logins/s   '
+          f'catalog {len(catalog_latencies) / args.seconds:7.1f} req/s   '
+          f'p50={percentile(catalog_latencies, 0.50):7.1f}ms '
+          f'p95={percentile(catalog_latencies, 0.95):7.1f}ms '
+          f'p99={percentile(catalog_latencies, 0.99):7.1f}ms')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--login-threads', type=int, default=16)
+    parser.add_argument('--catalog-threads', type=int, default=4)
+    parser.add_argument('--seconds', type=int, default=10)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--books', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=12)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    args = parser.parse_args()
+
+    print(f'{args.login_threads} login threads, {args.catalog_threads} catalog threads, '
+          f'bcrypt rounds={args.rounds}, {os.cpu_count()} CPUs')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'login_bench.db')
+        build_database(db_path, args.users, args.books, args.rounds)
+
+        run_mode(db_path, 0, args.rounds, args)
+        run_mode(db_path, args.workers, args.rounds, args)
+
+if __name__ == '__main__':
+    main()
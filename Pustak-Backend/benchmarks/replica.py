@@ -0,0 +1,142 @@
+"""Read replica routing check (replica.py) against two SQLite files.
+
+Builds a primary database, copies it to a second file opened read-only as
+DATABASE_REPLICA_URL, then changes the primary so the copy lags behind it.
+Each request shows which database answered it:
+
+  catalog       GET /api/books/ and /api/books/<id> read the stale replica
+  own writes    @reads_own_writes views (profile, borrowed) see the primary
+  revocation    a token revoked on the primary is refused although the
+                replica still has the old token version
+  write in GET  a GET that writes reads the rest of the request from the
+                primary
+  metrics       pustakalay_db_route_requests_total counts each endpoint's route
+
+    python -m benchmarks.replica
+"""
+import os
+import shutil
+import stat
+import tempfile
+
+from sqlalchemy import select, update
+
+from app import create_app, prepare_database
+from database import db, Book, DonatedBook, User
+from metrics import render_metrics, reset_metrics
+
+def make_app(primary, replica=None):
+    config = {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{primary}',
+        'PASSWORD_HASH_WORKERS': 0,
+        'TOKEN_VERSION_TTL': 0,
+        'METRICS_ENABLED': True,
+    }
+    if replica:
+        # A read-only connection: any write sent to the replica fails loudly
+        config['DATABASE_REPLICA_URL'] = f'sqlite:///file:{replica}?mode=ro&uri=true'
+    return create_app(config)
+
+def setup_primary(path):
+    app = make_app(path)
+    prepare_database(app)
+
+    with app.app_context():
+        client = app.test_client()
+        client.post('/api/auth/register', json={'username': 'reader', 'email': 'reader@example.com', 'password': 'secret12'})
+        token = client.post('/api/auth/login', json={'username': 'reader', 'password': 'secret12'}).get_json()['access_token']
+
+        reader = User.query.filter_by(username='reader').one()
+        book = Book(title='Godan', author='Premchand', category='उपन्यास')
+        db.session.add(book)
+        db.session.flush()
+        db.session.add(DonatedBook(book_id=book.id, donor_id=reader.id))
+        db.session.commit()
+        return token, book.id
+
+def write_in_get():
+    # Reads the replica, writes, then must read its own write
+    before = db.session.execute(select(Book.id).where(Book.title == 'Karmabhoomi')).first()
+    db.session.add(Book(title='Karmabhoomi', author='Premchand'))
+    db.session.flush()
+    after = db.session.execute(select(Book.id).where(Book.title == 'Karmabhoomi')).first()
+    db.session.commit()
+    return {'before': before is not None, 'after': after is not None}
+
+def route_counts():
+    counts = {}
+    for line in render_metrics().splitlines():
+        if line.startswith('pustakalay_db_route_requests_total{'):
+            labels, count = line[len('pustakalay_db_route_requests_total{'):].rsplit('} ', 1)
+            labels = dict(part.split('=', 1) for part in labels.split(','))
+            key = (labels['endpoint'].strip('"'), labels['route'].strip('"'))
+            counts[key] = counts.get(key, 0) + int(count)
+    return counts
+
+def check(label, ok, detail=''):
+    print(f'{"PASS" if ok else "FAIL"}: {label}{" (" + detail + ")" if detail and not ok else ""}')
+    return ok
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        primary, replica = os.path.join(tmp, 'primary.db'), os.path.join(tmp, 'replica.db')
+        token, book_id = setup_primary(primary)
+        shutil.copy(primary, replica)
+        os.chmod(replica, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+        app = make_app(primary, replica)
+        app.add_url_rule('/check/write-in-get', 'write_in_get', write_in_get, methods=['GET'])
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+
+        # The replica lags: these changes exist only on the primary
+        with app.app_context():
+            db.session.add(Book(title='Nirmala', author='Premchand'))
+            db.session.execute(update(User).where(User.username == 'reader').values(email='new@example.com'))
+            db.session.commit()
+        reset_metrics()
+
+        results = []
+
+        titles = {book['title'] for book in client.get('/api/books/').get_json()['books']}
+        results.append(check('catalog list reads the replica', titles == {'Godan'}, f'titles {sorted(titles)}'))
+        status = client.get(f'/api/books/{book_id}').status_code
+        results.append(check('catalog detail reads the replica', status == 200, f'status {status}'))
+
+        email = client.get('/api/auth/profile', headers=headers).get_json()['user']['email']
+        results.append(check('profile (@reads_own_writes) reads the primary', email == 'new@example.com', email))
+        status = client.get('/api/books/borrowed', headers=headers).status_code
+        results.append(check('borrowed (@reads_own_writes) answers', status == 200, f'status {status}'))
+
+        status = client.get('/api/donations/', headers=headers).status_code
+        results.append(check('donation feed with a valid token', status == 200, f'status {status}'))
+
+        body = client.get('/check/write-in-get').get_json()
+        results.append(check('write in a GET moves later reads to the primary',
+                             body == {'before': False, 'after': True}, str(body)))
+
+        with app.app_context():
+            db.session.execute(update(User).where(User.username == 'reader').values(token_version=User.token_version + 1))
+            db.session.commit()
+        status = client.get('/api/donations/', headers=headers).status_code
+        results.append(check('revoked token refused, checked on the primary', status == 401, f'status {status}'))
+
+        expected = {
+            ('books.get_books', 'replica'): 1,
+            ('books.get_book', 'replica'): 1,
+            ('auth.get_profile', 'primary'): 1,
+            ('books.get_borrowed_books', 'primary'): 1,
+            # Revocation check on the primary, the feed itself from the replica
+            ('donations.get_all_donations', 'both'): 1,
+            ('write_in_get', 'both'): 1,
+            ('donations.get_all_donations', 'primary'): 1,
+        }
+        counts = route_counts()
+        results.append(check('pustakalay_db_route_requests_total counts each route', counts == expected, str(counts)))
+
+        print(f'\n{sum(results)}/{len(results)} checks passed')
+        if not all(results):
+            raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
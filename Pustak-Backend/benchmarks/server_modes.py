@@ -0,0 +1,164 @@
+"""HTTP throughput of the development server versus the production servers.
+
+Seeds a temporary database, then starts each server in turn as a separate
+process on a local port - run.py's Flask development server (debug=True),
+gunicorn via serve.py (preloaded app, worker processes x threads) and
+waitress via serve.py (one multi-threaded process) - and drives it over
+real HTTP from client threads with a read-heavy mix: catalog search,
+book detail, a user's borrowed books and the admin dashboard. Reports
+requests/second and p50/p95/p99 latency per server.
+
+    python -m benchmarks.server_modes --size 20000 --clients 32 --seconds 20
+    python -m benchmarks.server_modes --modes dev,gunicorn --workers 4 --threads 8
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEARCH_TERMS = ['गोदान', 'नदी', 'गंगा', 'कहानियाँ', 'River', 'History', 'India', 'Monsoon', 'Stories', 'Bond']
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000
+
+def prepare(database_url, size):
+    from app import create_app, prepare_database
+    from database import db, User, Book
+    from seed_data import seed
+    from flask_jwt_extended import create_access_token
+    from identity import token_claims
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_url, 'PASSWORD_HASH_WORKERS': 0})
+    prepare_database(app)
+
+    with app.app_context():
+        seed(users=max(50, size // 20), books=max(1, size // 4), donations=size,
+             borrowings=size // 2, log=lambda message: None)
+
+        admin = User(username='bench-admin', email='bench-admin@example.com', password_hash='-', is_admin=True)
+        db.session.add(admin)
+        db.session.commit()
+
+        readers = User.query.filter(User.is_admin == False).limit(50).all()
+        tokens = [create_access_token(identity=user.id, additional_claims=token_claims(user)) for user in readers]
+        admin_token = create_access_token(identity=admin.id, additional_claims=token_claims(admin))
+        book_ids = [row[0] for row in db.session.query(Book.id).limit(5000)]
+
+    return tokens, admin_token, book_ids
+
+def server_command(mode, port, args):
+    if mode == 'dev':
+        # What run.py does, minus the reloader's second process
+        code = ('from app import create_app; '
+                f"create_app().run(debug=True, use_reloader=False, host='127.0.0.1', port={port})")
+        return [sys.executable, '-c', code]
+
+    command = [sys.executable, 'serve.py', '--server', mode, '--host', '127.0.0.1', '--port', str(port)]
+    if mode == 'gunicorn' and args.workers:
+        command += ['--workers', str(args.workers)]
+    if args.threads:
+        command += ['--threads', str(args.threads)]
+    return command
+
+def wait_until_up(base_url, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'Server exited with code {process.returncode}')
+        try:
+            urllib.request.urlopen(f'{base_url}/api/test', timeout=1).read()
+            return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.2)
+    raise SystemExit('Server did not start in time')
+
+def drive(base_url, tokens, admin_token, book_ids, args):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + args.seconds
+
+    def request(rng):
+        choice = rng.random()
+        headers = {}
+        if choice < 0.5:
+            term = urllib.request.quote(rng.choice(SEARCH_TERMS))
+            path = f'/api/books/?search={term}&page={rng.randint(1, 3)}&per_page=20'
+        elif choice < 0.8:
+            path = f'/api/books/{rng.choice(book_ids)}'
+        elif choice < 0.95:
+            path = '/api/books/borrowed'
+            headers['Authorization'] = f'Bearer {rng.choice(tokens)}'
+        else:
+            path = '/api/admin/dashboard'
+            headers['Authorization'] = f'Bearer {admin_token}'
+        return urllib.request.Request(base_url + path, headers=headers)
+
+    def loop(index):
+        rng = random.Random(index)
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request(rng), timeout=30) as response:
+                    response.read()
+                ok = True
+            except (urllib.error.URLError, ConnectionError, OSError):
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                (latencies if ok else errors).append(elapsed)
+
+    threads = [threading.Thread(target=loop, args=(i,)) for i in range(args.clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', default='dev,gunicorn,waitress')
+    parser.add_argument('--size', type=int, default=20000, help='donated copies to seed')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seconds', type=int, default=20)
+    parser.add_argument('--workers', type=int, help='gunicorn workers (default: gunicorn.conf.py)')
+    parser.add_argument('--threads', type=int, help='threads per server process')
+    parser.add_argument('--port', type=int, default=9471)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f'sqlite:///{os.path.join(tmp, "servers.db")}'
+        tokens, admin_token, book_ids = prepare(database_url, args.size)
+
+        env = dict(os.environ, DATABASE_URL=database_url, ACCESS_LOG='', LOG_LEVEL='warning')
+        base_url = f'http://127.0.0.1:{args.port}'
+        print(f'{args.clients} client threads for {args.seconds}s, {os.cpu_count()} CPUs\n')
+        print(f'{"server":>10} {"requests":>9} {"req/s":>8} {"errors":>7} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}')
+
+        for mode in args.modes.split(','):
+            process = subprocess.Popen(server_command(mode, args.port, args), cwd=HERE, env=env,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_until_up(base_url, process)
+                latencies, errors, duration = drive(base_url, tokens, admin_token, book_ids, args)
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+            print(f'{mode:>10} {len(latencies):>9} {len(latencies) / duration:>8.1f} {len(errors):>7} '
+                  f'{percentile(latencies, 0.50):>8.1f} {percentile(latencies, 0.95):>8.1f} '
+                  f'{percentile(latencies, 0.99):>8.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Typeahead latency: in-memory prefix index versus the catalog search query.
+
+Seeds a temporary database, then replays the keystrokes of a set of
+queries ("g", "go", "god", ...) two ways:
+
+  search   - GET /api/books/?search=<prefix>&per_page=8, what the search box
+             calls today (FTS query, copy counts, to_dict)
+  suggest  - GET /api/books/suggest?q=<prefix>&limit=8
+
+Both go through the Flask test client, so routing and JSON encoding are
+included; the suggest index build time is reported separately.
+
+    python -m benchmarks.suggest --size 100000
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from app import create_app, prepare_database
+from seed_data import seed
+import suggest
+
+QUERIES = ['godan', 'गोदान', 'premchand', 'प्रेमचंद', 'river stories', 'कहानियाँ', 'monsoon', 'history of india']
+
+def keystrokes(query):
+    return [query[:length] for length in range(1, len(query) + 1) if query[length - 1] != ' ']
+
+def replay(client, path, repeat):
+    timings = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            for prefix in keystrokes(query):
+                started = time.perf_counter()
+                response = client.get(path.format(prefix))
+                timings.append(time.perf_counter() - started)
+                assert response.status_code == 200, response.get_data(as_text=True)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=100000, help='donated copies to seed')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(tmp, "suggest.db")}',
+            'PASSWORD_HASH_WORKERS': 0,
+            'CATALOG_CACHE_ENTRIES': 0,
+            'SUGGEST_CACHE_MAX_AGE': 0,
+        })
+        prepare_database(app)
+
+        with app.app_context():
+            seed(users=max(50, args.size // 20), books=max(1, args.size // 4), donations=args.size,
+                 borrowings=args.size // 2, log=lambda message: None)
+
+            started = time.perf_counter()
+            books = suggest.build_index()
+            print(f'Index build: {books} books in {(time.perf_counter() - started) * 1000:.0f} ms\n')
+
+        client = app.test_client()
+        print(f'{"endpoint":>8} {"requests":>9} {"mean ms":>8} {"p50 ms":>8} {"p99 ms":>8}')
+        for name, path in [('search', '/api/books/?search={}&per_page=8'),
+                           ('suggest', '/api/books/suggest?q={}&limit=8')]:
+            timings = sorted(replay(client, path, args.repeat))
+            print(f'{name:>8} {len(timings):>9} {statistics.mean(timings) * 1000:>8.2f} '
+                  f'{timings[len(timings) // 2] * 1000:>8.2f} {timings[int(len(timings) * 0.99)] * 1000:>8.2f}')
+
+        # Index lookups alone, without the HTTP layer
+        with app.test_request_context():
+            prefixes = [prefix for query in QUERIES for prefix in keystrokes(query)]
+            suggest.suggest('warm', 8)
+            started = time.perf_counter()
+            for _ in range(args.repeat * 10):
+                for prefix in prefixes:
+                    suggest.suggest(prefix, 8)
+            lookups = args.repeat * 10 * len(prefixes)
+            print(f'\nIndex lookup alone: {(time.perf_counter() - started) / lookups * 1e6:.1f} us per query')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import random
+from datetime import timedelta
+from sqlalchemy import select, update
+from database import db, DonatedBook
+
+# Copy allocation for borrowing.
+#
+# A copy is claimed with a conditional UPDATE ... WHERE is_available, and the
+# claim only counts if exactly one row changed. Two workers racing for the
+# same copy can therefore never both win it: the loser sees rowcount 0 and
+# moves on to the next candidate. Candidates are shuffled so concurrent
+# borrowers of a popular title spread out over its copies instead of all
+# colliding on the lowest id. If every candidate keeps being taken, a last
+# single-statement claim picks whichever copy is still free, so a borrower
+# is only turned away when the title really has none left.
+
+CLAIM_CANDIDATES = 8
+CLAIM_ROUNDS = 3
+LOAN_PERIOD = timedelta(days=14)
+
+def claim_available_copy(book_id):
+    for _ in range(CLAIM_ROUNDS):
+        candidate_ids = [row[0] for row in db.session.query(DonatedBook.id).filter_by(
+            book_id=book_id,
+            is_available=True
+        ).limit(CLAIM_CANDIDATES).all()]
+
+        if not candidate_ids:
+            return None
+
+        random.shuffle(candidate_ids)
+        for copy_id in candidate_ids:
+            result = db.session.execute(
+                update(DonatedBook).where(
+                    DonatedBook.id == copy_id,
+                    DonatedBook.is_available == True
+                ).values(is_available=False),
+                execution_options={'synchronize_session': False}
+            )
+            if result.rowcount == 1:
+                return copy_id
+
+    return _claim_any_copy(book_id)
+
+def _claim_any_copy(book_id):
+    free_copy = select(DonatedBook.id).where(
+        DonatedBook.book_id == book_id,
+        DonatedBook.is_available == True
+    ).limit(1).scalar_subquery()
+
+    # Each miss means another borrower got a copy, so this ends when none are left
+    while True:
+        copy_id = db.session.execute(
+            update(DonatedBook).where(
+                DonatedBook.id == free_copy,
+                DonatedBook.is_available == True
+            ).values(is_available=False).returning(DonatedBook.id),
+            execution_options={'synchronize_session': False}
+        ).scalar()
+        if copy_id is not None:
+            return copy_id
+
+        still_free = db.session.execute(
+            select(DonatedBook.id).where(
+                DonatedBook.book_id == book_id,
+                DonatedBook.is_available == True
+            ).limit(1)
+        ).first()
+        if still_free is None:
+            return None
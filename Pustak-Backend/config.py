@@ -1,23 +1,134 @@
 import os
 from datetime import timedelta
+from sqlalchemy.engine import make_url
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-here-change-in-production'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///pustakalay.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connection pool per worker process (see engine_options below)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))  # seconds, -1 never
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    # Optional read replica for GET requests (replica.py); same pool settings
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-string-change-in-production'
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
+    # Password hashing: bcrypt work factor and size of the hashing process pool
+    PASSWORD_HASH_ROUNDS = int(os.environ.get('PASSWORD_HASH_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    # How stale a worker's view of role changes may get (seconds)
+    TOKEN_VERSION_TTL = int(os.environ.get('TOKEN_VERSION_TTL', 30))
+    
+    # JSON encoder for responses: auto (orjson if installed), orjson or stdlib
+    JSON_ENCODER = os.environ.get('JSON_ENCODER', 'auto')
     
     # File upload settings
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
-    UPLOAD_FOLDER = 'uploads'
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB max request body
+    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')  # relative to the instance folder
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+    # Book covers (covers.py): thumbnail widths in pixels, their JPEG quality,
+    # size of the thumbnail process pool (0 = inline), largest image accepted
+    # in pixels and browser cache lifetime in seconds
+    COVER_THUMBNAIL_SIZES = [int(size) for size in os.environ.get('COVER_THUMBNAIL_SIZES', '96,240,480').split(',')]
+    COVER_THUMBNAIL_QUALITY = int(os.environ.get('COVER_THUMBNAIL_QUALITY', 80))
+    COVER_WORKERS = int(os.environ.get('COVER_WORKERS', 1))
+    COVER_MAX_PIXELS = int(os.environ.get('COVER_MAX_PIXELS', 40_000_000))
+    COVER_CACHE_MAX_AGE = int(os.environ.get('COVER_CACHE_MAX_AGE', 31536000))
+    
+    # Catalog response cache: per-process entries and client max-age (0 = always revalidate)
+    CATALOG_CACHE_ENTRIES = int(os.environ.get('CATALOG_CACHE_ENTRIES', 512))
+    CATALOG_CACHE_MAX_AGE = int(os.environ.get('CATALOG_CACHE_MAX_AGE', 0))
+    
+    # Typeahead index (suggest.py): seconds between checks for books changed by
+    # other processes, most suggestions per request, browser cache lifetime and
+    # how long the book change log is kept (seconds)
+    SUGGEST_REFRESH_INTERVAL = float(os.environ.get('SUGGEST_REFRESH_INTERVAL', 5))
+    SUGGEST_MAX_RESULTS = int(os.environ.get('SUGGEST_MAX_RESULTS', 20))
+    SUGGEST_CACHE_MAX_AGE = int(os.environ.get('SUGGEST_CACHE_MAX_AGE', 30))
+    BOOK_CHANGE_RETENTION = int(os.environ.get('BOOK_CHANGE_RETENTION', 86400))
+    
+    # Fuzzy search (fuzzy.py): share of the query's trigrams a book must
+    # contain to match, and most fuzzy matches returned
+    FUZZY_THRESHOLD = float(os.environ.get('FUZZY_THRESHOLD', 0.5))
+    FUZZY_CANDIDATES = int(os.environ.get('FUZZY_CANDIDATES', 200))
+    
+    # Live availability feed (events_server.py): seconds between reads of the
+    # event log, between keep-alive pings and events kept for reconnecting
+    # clients; open streams per server, books plus categories per stream and
+    # messages buffered for a slow client before it is dropped
+    EVENTS_POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', 1.0))
+    EVENTS_HEARTBEAT_INTERVAL = int(os.environ.get('EVENTS_HEARTBEAT_INTERVAL', 15))
+    AVAILABILITY_EVENT_RETENTION = int(os.environ.get('AVAILABILITY_EVENT_RETENTION', 86400))
+    EVENTS_MAX_CONNECTIONS = int(os.environ.get('EVENTS_MAX_CONNECTIONS', 10000))
+    EVENTS_MAX_BOOKS = int(os.environ.get('EVENTS_MAX_BOOKS', 100))
+    EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', 100))
+    
+    # Background jobs (seconds between runs, 0 disables)
+    STATS_RECONCILE_INTERVAL = int(os.environ.get('STATS_RECONCILE_INTERVAL', 300))
+    OVERDUE_SCAN_INTERVAL = int(os.environ.get('OVERDUE_SCAN_INTERVAL', 60))
+    HOLD_EXPIRY_INTERVAL = int(os.environ.get('HOLD_EXPIRY_INTERVAL', 300))
+    BOOK_CHANGE_PRUNE_INTERVAL = int(os.environ.get('BOOK_CHANGE_PRUNE_INTERVAL', 3600))
+    AVAILABILITY_EVENT_PRUNE_INTERVAL = int(os.environ.get('AVAILABILITY_EVENT_PRUNE_INTERVAL', 3600))
+    
+    # Waitlist: hours a holder has to borrow a copy set aside for them, and
+    # how many titles one reader may hold at once
+    HOLD_PICKUP_HOURS = int(os.environ.get('HOLD_PICKUP_HOURS', 72))
+    HOLD_LIMIT = int(os.environ.get('HOLD_LIMIT', 5))
+    # Most barcodes accepted by one desk check-out or check-in request
+    DESK_BATCH_LIMIT = int(os.environ.get('DESK_BATCH_LIMIT', 200))
+    
+    # Borrower reminders (overdue.py): due-soon window in hours (0 disables
+    # due-soon notices), send batch size and retries per reminder
+    REMINDER_DUE_SOON_HOURS = int(os.environ.get('REMINDER_DUE_SOON_HOURS', 48))
+    REMINDER_BATCH_SIZE = int(os.environ.get('REMINDER_BATCH_SIZE', 100))
+    REMINDER_MAX_ATTEMPTS = int(os.environ.get('REMINDER_MAX_ATTEMPTS', 5))
+    # Delivery (notifiers.py): file, smtp or a module:Class path
+    NOTIFIER = os.environ.get('NOTIFIER', 'file')
+    REMINDER_FILE = os.environ.get('REMINDER_FILE')  # default: instance/reminders.ndjson
+    SMTP_HOST = os.environ.get('SMTP_HOST', 'localhost')
+    SMTP_PORT = int(os.environ.get('SMTP_PORT', 25))
+    SMTP_USERNAME = os.environ.get('SMTP_USERNAME')
+    SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
+    SMTP_SENDER = os.environ.get('SMTP_SENDER', 'library@pustakalay.com')
+    SMTP_USE_TLS = os.environ.get('SMTP_USE_TLS', 'false').lower() == 'true'
+    
+    # Request metrics at /api/metrics (bearer token for scrapers, required in
+    # production) and logging of requests slower than the threshold in
+    # seconds (0 disables)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_REQUIRE_TOKEN = False
+    SLOW_REQUEST_THRESHOLD = float(os.environ.get('SLOW_REQUEST_THRESHOLD', 0))
+    SLOW_REQUEST_MAX_STATEMENTS = int(os.environ.get('SLOW_REQUEST_MAX_STATEMENTS', 20))
 
 class DevelopmentConfig(Config):
     DEBUG = True
 
 class ProductionConfig(Config):
     DEBUG = False
+    # Traffic and SQL timings are not for the public
+    METRICS_REQUIRE_TOKEN = True
+
+def engine_options(settings):
+    # SQLALCHEMY_ENGINE_OPTIONS built from the DB_POOL_* settings
+    options = {
+        'pool_pre_ping': settings['DB_POOL_PRE_PING'],
+        'pool_recycle': settings['DB_POOL_RECYCLE']
+    }
+    
+    # In-memory SQLite shares one static connection, so there is no pool to size
+    url = make_url(settings['SQLALCHEMY_DATABASE_URI'])
+    if not (url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')):
+        options.update(
+            pool_size=settings['DB_POOL_SIZE'],
+            max_overflow=settings['DB_MAX_OVERFLOW'],
+            pool_timeout=settings['DB_POOL_TIMEOUT']
+        )
+    
+    return options
 
 config = {
     'development': DevelopmentConfig,
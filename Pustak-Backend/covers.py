@@ -0,0 +1,266 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app, has_app_context
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Book cover storage.
+#
+# Uploads are streamed to a temporary file in chunks while being hashed, so
+# a large photo is never held in memory. They are checked with Pillow and
+# stored under their SHA-256:
+#
+#   <UPLOAD_FOLDER>/covers/ab/ab12...ef.jpg        the original
+#   <UPLOAD_FOLDER>/covers/ab/ab12...ef-240.jpg    one JPEG per COVER_THUMBNAIL_SIZES width
+#
+# The same image uploaded twice (or for two editions) is stored once. A
+# file's name never refers to different content, so covers are served with
+# immutable cache headers. Files are never deleted, because another book may
+# share them.
+#
+# Thumbnails are made in a bounded process pool (COVER_WORKERS processes) so
+# resizing a phone photo does not hold up request threads. The upload
+# returns without waiting for them. A thumbnail requested before it exists
+# is made on the spot. Setting the worker count to 0 makes them inline,
+# which is handy for scripts.
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = (96, 240, 480)
+DEFAULT_WORKERS = 1
+CHUNK_SIZE = 64 * 1024
+THUMBNAIL_QUALITY = 80
+
+# Pillow format -> stored extension and content type
+FORMATS = {
+    'JPEG': ('jpg', 'image/jpeg'),
+    'PNG': ('png', 'image/png'),
+    'GIF': ('gif', 'image/gif'),
+}
+CONTENT_TYPES = dict(FORMATS.values())
+
+COVER_NAME = re.compile(r'^(?P<cover_id>[0-9a-f]{64})(?:-(?P<size>\d+))?\.(?P<ext>jpg|png|gif)$')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+class InvalidCover(ValueError):
+    pass
+
+def _setting(name, default):
+    if has_app_context():
+        return current_app.config.get(name, default)
+    return default
+
+def cover_root():
+    # A relative UPLOAD_FOLDER lives in the instance folder, next to the database
+    folder = _setting('UPLOAD_FOLDER', 'uploads')
+    if has_app_context() and not os.path.isabs(folder):
+        folder = os.path.join(current_app.instance_path, folder)
+    return os.path.join(folder, 'covers')
+
+def thumbnail_sizes():
+    return sorted({int(size) for size in _setting('COVER_THUMBNAIL_SIZES', DEFAULT_SIZES)})
+
+def cover_path(root, name):
+    return os.path.join(root, name[:2], name)
+
+def cover_url(name):
+    return f'/api/covers/{name}'
+
+def thumbnail_name(cover_id, size):
+    return f'{cover_id}-{size}.jpg'
+
+def thumbnail_urls(cover_id):
+    # {"96": "/api/covers/<id>-96.jpg", ...}; JSON object keys are strings
+    if not cover_id:
+        return None
+    return {str(size): cover_url(thumbnail_name(cover_id, size)) for size in thumbnail_sizes()}
+
+def _allowed_extensions():
+    allowed = {ext.lower() for ext in _setting('ALLOWED_EXTENSIONS', {'png', 'jpg', 'jpeg', 'gif'})}
+    if 'jpeg' in allowed:
+        allowed.add('jpg')
+    return allowed
+
+def _inspect(path):
+    # Pillow reads the header and checks the file's structure without decoding pixels
+    max_pixels = _setting('COVER_MAX_PIXELS', 40_000_000)
+    try:
+        with Image.open(path) as image:
+            image_format = image.format
+            width, height = image.size
+            image.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+        raise InvalidCover('Not a readable image')
+
+    if image_format not in FORMATS or FORMATS[image_format][0] not in _allowed_extensions():
+        raise InvalidCover(f'Cover must be one of: {", ".join(sorted(_allowed_extensions()))}')
+    if width * height > max_pixels:
+        raise InvalidCover(f'Cover is too large ({width}x{height} pixels)')
+
+    return FORMATS[image_format][0], width, height
+
+def save_cover(stream, filename=None):
+    # Stream an upload into the store; returns (cover_id, original name, width, height, created)
+    if filename and os.path.splitext(filename)[1].lstrip('.').lower() not in _allowed_extensions():
+        raise InvalidCover(f'Cover must be one of: {", ".join(sorted(_allowed_extensions()))}')
+
+    root = cover_root()
+    incoming = os.path.join(root, 'incoming')
+    os.makedirs(incoming, exist_ok=True)
+
+    limit = _setting('MAX_CONTENT_LENGTH', None)
+    digest = hashlib.sha256()
+    size = 0
+
+    with tempfile.NamedTemporaryFile(dir=incoming, delete=False) as temp:
+        try:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if limit and size > limit:
+                    raise InvalidCover(f'Cover is larger than {limit} bytes')
+                digest.update(chunk)
+                temp.write(chunk)
+        except BaseException:
+            temp.close()
+            os.unlink(temp.name)
+            raise
+
+    try:
+        if not size:
+            raise InvalidCover('No image data received')
+        ext, width, height = _inspect(temp.name)
+
+        cover_id = digest.hexdigest()
+        name = f'{cover_id}.{ext}'
+        path = cover_path(root, name)
+        created = not os.path.exists(path)
+        if created:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Atomic: readers see either no file or the whole file
+            os.replace(temp.name, path)
+            os.chmod(path, 0o644)
+    finally:
+        if os.path.exists(temp.name):
+            os.unlink(temp.name)
+
+    return cover_id, name, width, height, created
+
+def _thumbnail_image(image):
+    # RGB on white: JPEG has no transparency, and palette GIFs resample badly
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+def make_thumbnails(root, name, sizes, quality=THUMBNAIL_QUALITY):
+    # Runs in a worker process; writes the thumbnails of one original that are missing
+    cover_id = name.split('.')[0]
+    wanted = [size for size in sorted(sizes, reverse=True)
+              if not os.path.exists(cover_path(root, thumbnail_name(cover_id, size)))]
+    if not wanted:
+        return []
+
+    with Image.open(cover_path(root, name)) as original:
+        # JPEG can decode straight to a smaller scale, much faster than full size
+        original.draft('RGB', (wanted[0], wanted[0] * 2))
+        image = _thumbnail_image(original)
+
+    # Largest first, each made from the previous one
+    for size in wanted:
+        image.thumbnail((size, size * 2), Image.Resampling.LANCZOS)
+        path = cover_path(root, thumbnail_name(cover_id, size))
+        temp = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+        image.save(temp, 'JPEG', quality=quality, optimize=True, progressive=True)
+        os.chmod(temp, 0o644)
+        os.replace(temp, path)
+
+    return wanted
+
+def _get_pool(workers):
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a multi-threaded server process is not safe
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+def _reset_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def _log_failure(name):
+    def callback(future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            _reset_pool()
+        if error is not None:
+            # The thumbnail is made when first requested instead
+            logger.error('Making thumbnails for %s failed', name, exc_info=error)
+    return callback
+
+def queue_thumbnails(name):
+    # Returns immediately with a pool; inline when COVER_WORKERS is 0
+    args = (cover_root(), name, thumbnail_sizes(), _setting('COVER_THUMBNAIL_QUALITY', THUMBNAIL_QUALITY))
+    workers = _setting('COVER_WORKERS', DEFAULT_WORKERS)
+    if not workers:
+        make_thumbnails(*args)
+        return
+
+    try:
+        future = _get_pool(workers).submit(make_thumbnails, *args)
+    except BrokenProcessPool:
+        _reset_pool()
+        future = _get_pool(workers).submit(make_thumbnails, *args)
+    future.add_done_callback(_log_failure(name))
+
+def find_cover(name):
+    # Path of a stored original or thumbnail, or None; makes a missing thumbnail of a configured size
+    match = COVER_NAME.match(name)
+    if not match:
+        return None
+
+    root = cover_root()
+    path = cover_path(root, name)
+    if os.path.exists(path):
+        return path
+
+    size = match.group('size')
+    if size is None or match.group('ext') != 'jpg' or int(size) not in thumbnail_sizes():
+        return None
+
+    cover_id = match.group('cover_id')
+    for ext, _ in FORMATS.values():
+        original = f'{cover_id}.{ext}'
+        if os.path.exists(cover_path(root, original)):
+            make_thumbnails(root, original, [int(size)], _setting('COVER_THUMBNAIL_QUALITY', THUMBNAIL_QUALITY))
+            return path
+
+    return None
+
+def content_type(name):
+    return CONTENT_TYPES[name.rsplit('.', 1)[1]]
@@ -1,17 +1,21 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import hash_password, verify_password, needs_rehash
+from replica import RoutingSession
+from covers import thumbnail_urls
 from datetime import datetime
 
-db = SQLAlchemy()
+# Reads may go to a replica when one is configured (see replica.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(255))
     phone = db.Column(db.String(15))
     address = db.Column(db.Text)
     is_admin = db.Column(db.Boolean, default=False)
+    token_version = db.Column(db.Integer, default=0, nullable=False, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -19,11 +23,15 @@ class User(db.Model):
     borrowed_books = db.relationship('BorrowedBook', backref='borrower', lazy=True)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
     
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
+    
+    # Datetimes are left as objects; the app's JSON provider writes them as ISO 8601
     def to_dict(self):
         return {
             'id': self.id,
@@ -32,25 +40,44 @@ class User(db.Model):
             'phone': self.phone,
             'address': self.address,
             'is_admin': self.is_admin,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at
         }
 
 class Book(db.Model):
+    # Indexes here must also be added to existing databases in migrations.py
+    __table_args__ = (
+        db.Index('ix_book_title_author', 'title', 'author'),
+        db.Index('ix_book_isbn_key', 'isbn_key', unique=True),
+        db.Index('ix_book_title_author_key', 'title_author_key'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     author = db.Column(db.String(100), nullable=False)
-    isbn = db.Column(db.String(13), unique=True)
+    isbn = db.Column(db.String(13), unique=True)  # compact, NULL when unknown
+    # Normalized identity donations are matched on (isbn.py)
+    isbn_key = db.Column(db.String(13))
+    title_author_key = db.Column(db.String(320))
     category = db.Column(db.String(50))
     description = db.Column(db.Text)
     image_url = db.Column(db.String(500))
+    # SHA-256 of an uploaded cover; image_url then points at the stored original (covers.py)
+    cover_id = db.Column(db.String(64))
     is_available = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Folded and transliterated "title author" for fuzzy search (fuzzy.py)
+    search_key = db.Column(db.Text)
+    search_latin = db.Column(db.Text)
     
     # Relationships
     donated_copies = db.relationship('DonatedBook', backref='book', lazy=True)
     borrowed_copies = db.relationship('BorrowedBook', backref='book', lazy=True)
     
-    def to_dict(self):
+    def to_dict(self, available_copies=None):
+        # Batched serializers pass the copy count in to avoid loading donated_copies per book
+        if available_copies is None:
+            available_copies = len([copy for copy in self.donated_copies if copy.is_available])
+        
         return {
             'id': self.id,
             'title': self.title,
@@ -59,34 +86,56 @@ class Book(db.Model):
             'category': self.category,
             'description': self.description,
             'image_url': self.image_url,
+            'cover_id': self.cover_id,
+            'thumbnails': thumbnail_urls(self.cover_id),
             'is_available': self.is_available,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'available_copies': len([db for db in self.donated_copies if db.is_available])
+            'created_at': self.created_at,
+            'available_copies': available_copies
         }
 
 class DonatedBook(db.Model):
+    __table_args__ = (
+        db.Index('ix_donated_book_book_available', 'book_id', 'is_available'),
+        db.Index('ix_donated_book_donor_available', 'donor_id', 'is_available'),
+        db.Index('ix_donated_book_barcode', 'barcode', unique=True),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
     donor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Label on the physical copy; generated from the id unless given (barcodes.py)
+    barcode = db.Column(db.String(32))
     condition = db.Column(db.String(20), default='Good')  # New, Good, Fair, Poor
     is_available = db.Column(db.Boolean, default=True)
     notes = db.Column(db.Text)
     donated_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    def to_dict(self):
-        return {
+    def to_dict(self, include_related=True):
+        data = {
             'id': self.id,
             'book_id': self.book_id,
             'donor_id': self.donor_id,
+            'barcode': self.barcode,
             'condition': self.condition,
             'is_available': self.is_available,
             'notes': self.notes,
-            'donated_at': self.donated_at.isoformat() if self.donated_at else None,
-            'book': self.book.to_dict() if self.book else None,
-            'donor': self.donor.to_dict() if self.donor else None
+            'donated_at': self.donated_at
         }
+        
+        if include_related:
+            data['book'] = self.book.to_dict() if self.book else None
+            data['donor'] = self.donor.to_dict() if self.donor else None
+        
+        return data
 
 class BorrowedBook(db.Model):
+    __table_args__ = (
+        db.Index('ix_borrowed_book_borrower_active', 'borrower_id', 'is_returned', 'due_date'),
+        db.Index('ix_borrowed_book_book_active', 'book_id', 'is_returned'),
+        db.Index('ix_borrowed_book_returned_due', 'is_returned', 'due_date'),
+        db.Index('ix_borrowed_book_overdue', 'is_overdue', 'borrower_id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
     borrower_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -95,20 +144,142 @@ class BorrowedBook(db.Model):
     due_date = db.Column(db.DateTime, nullable=False)
     returned_at = db.Column(db.DateTime)
     is_returned = db.Column(db.Boolean, default=False)
+    # Set in bulk by the overdue job (overdue.py) and cleared on return
+    is_overdue = db.Column(db.Boolean, default=False, nullable=False, server_default='0')
     
     # Relationship
     donated_book = db.relationship('DonatedBook', backref='borrowings')
     
-    def to_dict(self):
-        return {
+    def to_dict(self, include_related=True):
+        data = {
             'id': self.id,
             'book_id': self.book_id,
             'borrower_id': self.borrower_id,
             'donated_book_id': self.donated_book_id,
-            'borrowed_at': self.borrowed_at.isoformat() if self.borrowed_at else None,
-            'due_date': self.due_date.isoformat() if self.due_date else None,
-            'returned_at': self.returned_at.isoformat() if self.returned_at else None,
+            'borrowed_at': self.borrowed_at,
+            'due_date': self.due_date,
+            'returned_at': self.returned_at,
             'is_returned': self.is_returned,
-            'book': self.book.to_dict() if self.book else None,
-            'borrower': self.borrower.to_dict() if self.borrower else None
+            'is_overdue': self.is_overdue
+        }
+        
+        if include_related:
+            data['book'] = self.book.to_dict() if self.book else None
+            data['borrower'] = self.borrower.to_dict() if self.borrower else None
+        
+        return data
+
+class Reminder(db.Model):
+    # Due-soon and overdue notices, queued at most once per borrowing and kind
+    # by the overdue job and sent in batches through the configured notifier
+    __table_args__ = (
+        db.UniqueConstraint('borrowing_id', 'kind', name='uq_reminder_borrowing_kind'),
+        db.Index('ix_reminder_pending', 'sent_at', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    borrowing_id = db.Column(db.Integer, db.ForeignKey('borrowed_book.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # due_soon, overdue
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    last_error = db.Column(db.Text)
+
+class Hold(db.Model):
+    # A reader's place in the waitlist for a title with no free copy. The
+    # queue is served by priority (higher first), then first come first
+    # served; see holds.py
+    __table_args__ = (
+        db.Index('ix_hold_queue', 'book_id', 'status', db.desc('priority'), 'id'),
+        db.Index('ix_hold_user', 'user_id', 'status'),
+        db.Index('ix_hold_expiry', 'status', 'expires_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    priority = db.Column(db.Integer, default=0, nullable=False)
+    status = db.Column(db.String(20), default='waiting', nullable=False)  # waiting, ready, fulfilled, cancelled, expired
+    # Copy set aside for the holder once the hold is ready
+    donated_book_id = db.Column(db.Integer, db.ForeignKey('donated_book.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    ready_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime)
+    closed_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'book_id': self.book_id,
+            'user_id': self.user_id,
+            'priority': self.priority,
+            'status': self.status,
+            'donated_book_id': self.donated_book_id,
+            'created_at': self.created_at,
+            'ready_at': self.ready_at,
+            'expires_at': self.expires_at,
+            'closed_at': self.closed_at
+        }
+
+class HoldQueue(db.Model):
+    # One row per title with holds: the number waiting, and a version bumped
+    # whenever the waiting set changes so cached queue orders can be reused
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), primary_key=True)
+    waiting = db.Column(db.Integer, default=0, nullable=False)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+class BookChange(db.Model):
+    # Append-only log of created, edited and deleted books, read by each
+    # process to keep its in-memory suggestion index current (suggest.py)
+    __table_args__ = (
+        db.Index('ix_book_change_changed_at', 'changed_at'),
+        {'sqlite_autoincrement': True},
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, nullable=False)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class AvailabilityEvent(db.Model):
+    # Append-only log of copies donated, lent, returned or removed, written
+    # by triggers on donated_book (availability.py) and pushed to live
+    # subscribers by events_server.py
+    __table_args__ = (
+        db.Index('ix_availability_event_created_at', 'created_at'),
+        {'sqlite_autoincrement': True},
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, nullable=False)
+    donated_book_id = db.Column(db.Integer)
+    kind = db.Column(db.String(20), nullable=False)  # donation, availability
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class LibraryStats(db.Model):
+    # Single row of dashboard counters, kept current by stats.bump() in the
+    # same transaction as each write and periodically reconciled from the tables
+    id = db.Column(db.Integer, primary_key=True)
+    total_users = db.Column(db.Integer, default=0, nullable=False)
+    total_books = db.Column(db.Integer, default=0, nullable=False)
+    total_donations = db.Column(db.Integer, default=0, nullable=False)
+    total_borrowings = db.Column(db.Integer, default=0, nullable=False)
+    active_borrowings = db.Column(db.Integer, default=0, nullable=False)
+    overdue_borrowings = db.Column(db.Integer, default=0, nullable=False)
+    reconciled_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        return {
+            'total_users': self.total_users,
+            'total_books': self.total_books,
+            'total_donations': self.total_donations,
+            'total_borrowings': self.total_borrowings,
+            'active_borrowings': self.active_borrowings,
+            'overdue_borrowings': self.overdue_borrowings
         }
+
+class CatalogVersion(db.Model):
+    # Single row bumped by every transaction that changes books, copies or
+    # borrowings; cached catalog responses and their ETags are keyed on it
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
@@ -0,0 +1,294 @@
+import argparse
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from urllib.parse import urlsplit, parse_qs
+from app import create_app
+from database import db
+from json_provider import dumps
+import availability
+
+# Live copy availability over Server-Sent Events.
+#
+#   python events_server.py --port 9002
+#   GET /api/events?books=12,40&categories=Fiction,कविता
+#
+# A standalone asyncio server, run next to the WSGI server and routed to by
+# the reverse proxy. Subscribers are coroutines, not threads, so thousands
+# of idle connections cost a socket and a little memory each and never
+# occupy a gunicorn/waitress worker. One poller reads new rows from the
+# availability_event log (see availability.py) every EVENTS_POLL_INTERVAL
+# seconds, looks up the current counts of the books they name in a single
+# query, and pushes one message per changed book to the subscribers of that
+# book or its category. Database work runs on a thread so the loop never
+# blocks.
+#
+# On connect, subscribers receive the current state of their books. The
+# browser EventSource reconnects with Last-Event-ID; books changed since then
+# in the subscribed categories are replayed, and a 'reset' event tells the
+# client to refetch when that history has been pruned.
+
+logger = logging.getLogger('pustakalay.events')
+
+EVENTS_PATH = '/api/events'
+MAX_HEAD_BYTES = 8192
+EVENT_BATCH = 1000
+RETRY_MS = 5000
+
+CORS_HEADERS = (
+    'Access-Control-Allow-Origin: *\r\n'
+    'Access-Control-Allow-Headers: Last-Event-ID, Cache-Control\r\n'
+    'Access-Control-Allow-Methods: GET, OPTIONS\r\n'
+)
+
+def format_event(event_id, name, payload):
+    return f'id: {event_id}\nevent: {name}\ndata: {dumps(payload)}\n\n'.encode('utf-8')
+
+class Subscriber:
+    def __init__(self, books, categories, queue_size):
+        self.books = books
+        self.categories = categories
+        self.queue = asyncio.Queue(queue_size)
+        self.overflowed = False
+
+    def offer(self, message):
+        # A client too slow to keep up is disconnected and resyncs on reconnect
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+class EventHub:
+    def __init__(self, app):
+        self.app = app
+        self.config = app.config
+        self.by_book = defaultdict(set)
+        self.by_category = defaultdict(set)
+        self.connections = 0
+        self.last_id = 0
+
+    async def run_db(self, func, *args):
+        def call():
+            with self.app.app_context():
+                try:
+                    return func(*args)
+                finally:
+                    db.session.remove()
+
+        return await asyncio.to_thread(call)
+
+    def add(self, subscriber):
+        for book_id in subscriber.books:
+            self.by_book[book_id].add(subscriber)
+        for category in subscriber.categories:
+            self.by_category[category].add(subscriber)
+
+    def remove(self, subscriber):
+        for index, keys in ((self.by_book, subscriber.books), (self.by_category, subscriber.categories)):
+            for key in keys:
+                index[key].discard(subscriber)
+                if not index[key]:
+                    del index[key]
+
+    async def poll(self):
+        self.last_id = await self.run_db(availability.last_event_id)
+        interval = self.config.get('EVENTS_POLL_INTERVAL', 1.0)
+
+        while True:
+            try:
+                events = await self.run_db(availability.events_after, self.last_id, EVENT_BATCH)
+                if events:
+                    self.last_id = events[-1][0]
+                    if self.by_book or self.by_category:
+                        await self.dispatch(events)
+            except Exception:
+                logger.exception('Reading availability events failed')
+                events = []
+
+            # A full batch means more are waiting
+            if len(events) < EVENT_BATCH:
+                await asyncio.sleep(interval)
+
+    async def dispatch(self, events):
+        # One message per book, carrying its latest event id and current counts
+        changed = {}
+        for event_id, book_id, kind in events:
+            previous = changed.get(book_id)
+            donated = kind == 'donation' or (previous is not None and previous[1])
+            changed[book_id] = (event_id, donated)
+
+        wanted = changed if self.by_category else [book_id for book_id in changed if book_id in self.by_book]
+        books = await self.run_db(availability.book_availability, list(wanted))
+
+        for book_id, state in books.items():
+            subscribers = self.by_book.get(book_id, set()) | self.by_category.get((state['category'] or '').casefold(), set())
+            if not subscribers:
+                continue
+
+            event_id, donated = changed[book_id]
+            message = format_event(event_id, 'donation' if donated else 'availability', state)
+            for subscriber in subscribers:
+                subscriber.offer(message)
+
+    async def initial_messages(self, subscriber, last_event_id):
+        position = self.last_id
+        messages = []
+
+        replay = set(subscriber.books)
+        if last_event_id is not None and subscriber.categories:
+            oldest = await self.run_db(availability.oldest_event_id)
+            events = await self.run_db(
+                availability.events_after, last_event_id, EVENT_BATCH, list(subscriber.categories)
+            )
+            if (oldest is not None and oldest > last_event_id + 1) or len(events) == EVENT_BATCH:
+                messages.append(format_event(position, 'reset', {}))
+            else:
+                replay |= {book_id for _, book_id, _ in events}
+
+        books = await self.run_db(availability.book_availability, list(replay))
+        messages += [format_event(position, 'availability', state) for state in books.values()]
+        return messages
+
+    async def handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=10)
+            method, target, headers = parse_head(head)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            writer.close()
+            return
+
+        try:
+            await self.serve(method, target, headers, writer)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, method, target, headers, writer):
+        url = urlsplit(target)
+        if method == 'OPTIONS':
+            await respond(writer, 204, None)
+            return
+        if url.path.rstrip('/') != EVENTS_PATH:
+            await respond(writer, 404, {'error': 'Not found'})
+            return
+        if method != 'GET':
+            await respond(writer, 405, {'error': 'Method not allowed'})
+            return
+
+        query = parse_qs(url.query)
+        try:
+            books = {int(value) for value in _split(query.get('books'))}
+            last_event_id = headers.get('last-event-id') or (query.get('last_event_id') or [None])[0]
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            await respond(writer, 400, {'error': 'books and Last-Event-ID must be integers'})
+            return
+        categories = {value.casefold() for value in _split(query.get('categories'))}
+
+        max_books = self.config.get('EVENTS_MAX_BOOKS', 100)
+        if not books and not categories:
+            await respond(writer, 400, {'error': 'Subscribe to at least one of books or categories'})
+            return
+        if len(books) + len(categories) > max_books:
+            await respond(writer, 400, {'error': f'At most {max_books} books and categories per subscription'})
+            return
+        if self.connections >= self.config.get('EVENTS_MAX_CONNECTIONS', 10000):
+            await respond(writer, 503, {'error': 'Too many subscribers, please retry later'})
+            return
+
+        subscriber = Subscriber(books, categories, self.config.get('EVENTS_QUEUE_SIZE', 100))
+        self.connections += 1
+        self.add(subscriber)
+        try:
+            writer.write((
+                'HTTP/1.1 200 OK\r\n'
+                'Content-Type: text/event-stream; charset=utf-8\r\n'
+                'Cache-Control: no-cache, no-store\r\n'
+                'Connection: keep-alive\r\n'
+                'X-Accel-Buffering: no\r\n'
+                f'{CORS_HEADERS}\r\n'
+                f'retry: {RETRY_MS}\n\n'
+            ).encode())
+            for message in await self.initial_messages(subscriber, last_event_id):
+                writer.write(message)
+            await writer.drain()
+
+            heartbeat = self.config.get('EVENTS_HEARTBEAT_INTERVAL', 15)
+            while not subscriber.overflowed:
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing idle streams and finds dead clients
+                    message = b': ping\n\n'
+                writer.write(message)
+                await writer.drain()
+        finally:
+            self.remove(subscriber)
+            self.connections -= 1
+
+def _split(values):
+    return [part.strip() for value in values or [] for part in value.split(',') if part.strip()]
+
+def parse_head(head):
+    lines = head.decode('latin-1').split('\r\n')
+    method, target, _ = lines[0].split(' ', 2)
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    return method.upper(), target, headers
+
+async def respond(writer, status, payload):
+    reasons = {204: 'No Content', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               503: 'Service Unavailable'}
+    body = dumps(payload).encode('utf-8') if payload is not None else b''
+    writer.write((
+        f'HTTP/1.1 {status} {reasons[status]}\r\n'
+        'Content-Type: application/json; charset=utf-8\r\n'
+        f'Content-Length: {len(body)}\r\n'
+        'Connection: close\r\n'
+        f'{CORS_HEADERS}\r\n'
+    ).encode() + body)
+    await writer.drain()
+
+def raise_open_file_limit():
+    # Each subscriber holds a socket; lift the soft limit to the hard one
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+async def serve_events(app, host, port):
+    with app.app_context():
+        # The API server normally prepares the schema; make sure the log exists
+        db.create_all(bind_key=None)
+        if not availability.ensure_availability_events():
+            raise SystemExit('Live availability events need SQLite')
+
+    hub = EventHub(app)
+    server = await asyncio.start_server(hub.handle, host, port, limit=MAX_HEAD_BYTES, backlog=1024)
+    logger.info('Serving availability events on %s:%s', host, port)
+
+    async with server:
+        await asyncio.gather(server.serve_forever(), hub.poll())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve live copy availability as Server-Sent Events')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('EVENTS_PORT', 9002)))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    raise_open_file_limit()
+    app = create_app(config_name=os.environ.get('FLASK_CONFIG', 'production'))
+
+    try:
+        asyncio.run(serve_events(app, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,143 @@
+import csv
+from datetime import datetime, timedelta
+from sqlalchemy import select, and_
+from database import db, User, Book, DonatedBook, BorrowedBook
+from json_provider import dumps
+
+# Streaming admin exports.
+#
+# Each dataset is a single flat SELECT (related book/user columns joined in)
+# executed with yield_per, so rows are fetched from the cursor in fixed-size
+# chunks and written to the response as they arrive. Nothing builds ORM
+# objects or holds the whole table, so memory stays flat however large the
+# export gets.
+#
+# CSV exports are opened in spreadsheets, which run a cell starting with
+# =, +, -, @, tab or CR as a formula. Such text is prefixed with a ' so it
+# shows as typed (CSV injection); NDJSON is written unchanged.
+
+EXPORT_CHUNK_SIZE = 1000
+FORMATS = ('ndjson', 'csv')
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+def _books_query():
+    return select(
+        Book.id, Book.title, Book.author, Book.isbn, Book.category,
+        Book.description, Book.image_url, Book.is_available, Book.created_at
+    ), Book.created_at, {
+        'available': Book.is_available == True,
+        'unavailable': Book.is_available == False
+    }
+
+def _donations_query():
+    return select(
+        DonatedBook.id, DonatedBook.book_id,
+        Book.title.label('book_title'), Book.author.label('book_author'), Book.isbn.label('book_isbn'),
+        DonatedBook.donor_id, User.username.label('donor_username'), User.email.label('donor_email'),
+        DonatedBook.barcode, DonatedBook.condition, DonatedBook.is_available, DonatedBook.notes, DonatedBook.donated_at
+    ).join(Book, Book.id == DonatedBook.book_id).join(User, User.id == DonatedBook.donor_id), DonatedBook.donated_at, {
+        'available': DonatedBook.is_available == True,
+        'borrowed': DonatedBook.is_available == False
+    }
+
+def _borrowings_query():
+    return select(
+        BorrowedBook.id, BorrowedBook.book_id, Book.title.label('book_title'),
+        BorrowedBook.donated_book_id, BorrowedBook.borrower_id, User.username.label('borrower_username'),
+        BorrowedBook.borrowed_at, BorrowedBook.due_date, BorrowedBook.returned_at, BorrowedBook.is_returned,
+        BorrowedBook.is_overdue
+    ).join(Book, Book.id == BorrowedBook.book_id).join(User, User.id == BorrowedBook.borrower_id), BorrowedBook.borrowed_at, {
+        'active': BorrowedBook.is_returned == False,
+        'returned': BorrowedBook.is_returned == True,
+        'overdue': and_(BorrowedBook.is_returned == False, BorrowedBook.is_overdue == True)
+    }
+
+DATASETS = {
+    'books': (_books_query, Book.id),
+    'donations': (_donations_query, DonatedBook.id),
+    'borrowings': (_borrowings_query, BorrowedBook.id),
+}
+
+def _parse_date(value, name):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid '{name}' date, expected ISO format (YYYY-MM-DD)")
+
+def build_export_query(dataset, status=None, date_from=None, date_to=None):
+    # Raises ValueError for unknown datasets and bad filters, before any streaming starts
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown export '{dataset}', expected one of: {', '.join(DATASETS)}")
+
+    build, key_column = DATASETS[dataset]
+    query, date_column, statuses = build()
+
+    if status and status != 'all':
+        if status not in statuses:
+            raise ValueError(f"Invalid status '{status}', expected one of: all, {', '.join(statuses)}")
+        query = query.where(statuses[status])
+
+    if date_from:
+        query = query.where(date_column >= _parse_date(date_from, 'from'))
+    if date_to:
+        end = _parse_date(date_to, 'to')
+        # A bare date includes that whole day
+        if len(date_to) == 10:
+            query = query.where(date_column < end + timedelta(days=1))
+        else:
+            query = query.where(date_column <= end)
+
+    return query.order_by(key_column)
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _csv_value(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return _value(value)
+
+def columns(query):
+    return [column.key for column in query.selected_columns]
+
+def iter_rows(query, chunk_size=EXPORT_CHUNK_SIZE):
+    # Server-side cursor where the driver supports it, fetched chunk_size rows at a time
+    return db.session.execute(query.execution_options(yield_per=chunk_size))
+
+def _chunked(lines, chunk_size=EXPORT_CHUNK_SIZE):
+    # One write per chunk of rows rather than per row
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+def stream_ndjson(query):
+    names = columns(query)
+
+    def lines():
+        for row in iter_rows(query):
+            yield dumps(dict(zip(names, row))) + '\n'
+
+    return _chunked(lines())
+
+class _LineBuffer:
+    # csv.writer target that keeps only the last formatted line
+    def write(self, line):
+        self.line = line
+
+def stream_csv(query):
+    buffer = _LineBuffer()
+    writer = csv.writer(buffer)
+
+    def lines():
+        writer.writerow(columns(query))
+        yield buffer.line
+        for row in iter_rows(query):
+            writer.writerow([_csv_value(value) for value in row])
+            yield buffer.line
+
+    return _chunked(lines())
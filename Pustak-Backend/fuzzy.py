@@ -0,0 +1,219 @@
+import re
+import unicodedata
+from flask import current_app
+from sqlalchemy import event, inspect, text, column, func
+from database import Book
+from search import TOKEN_PATTERN, ensure_fts_table
+
+# Typo-tolerant, transliteration-aware title/author matching.
+#
+# Every book stores two precomputed keys over "title author":
+#
+#   search_key    case-folded, Latin diacritics stripped, Devanagari spelling
+#                 variants folded (nukta, long/short i and u, chandrabindu,
+#                 half nasal consonant vs anusvara)
+#   search_latin  the key transliterated to plain Latin ("रामायण" -> "ramayan")
+#                 with common romanisation variants folded (aa, ee, oo, doubled
+#                 letters)
+#
+# Both are indexed by an FTS5 trigram table kept in sync by triggers. A query
+# is folded the same way and matched trigram by trigram: each trigram is one
+# index lookup, and a book's similarity is the share of the query's trigrams
+# it contains, so the cost follows the posting lists of the query's trigrams
+# rather than the size of the catalog. Latin queries are matched against the
+# transliteration, Devanagari queries against both keys.
+#
+# ORM writes get their keys from the hooks below. Core bulk inserts
+# (importer.py, seed_data.py) add search_keys() to their rows themselves.
+
+TRIGRAM_TABLE = 'book_trigram'
+
+TRIGRAM_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE {TRIGRAM_TABLE} USING fts5(
+        search_key, search_latin,
+        content='book', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER {TRIGRAM_TABLE}_ai AFTER INSERT ON book BEGIN
+        INSERT INTO {TRIGRAM_TABLE}(rowid, search_key, search_latin)
+        VALUES (new.id, new.search_key, new.search_latin);
+    END""",
+    f"""CREATE TRIGGER {TRIGRAM_TABLE}_ad AFTER DELETE ON book BEGIN
+        INSERT INTO {TRIGRAM_TABLE}({TRIGRAM_TABLE}, rowid, search_key, search_latin)
+        VALUES ('delete', old.id, old.search_key, old.search_latin);
+    END""",
+    f"""CREATE TRIGGER {TRIGRAM_TABLE}_au AFTER UPDATE OF search_key, search_latin ON book BEGIN
+        INSERT INTO {TRIGRAM_TABLE}({TRIGRAM_TABLE}, rowid, search_key, search_latin)
+        VALUES ('delete', old.id, old.search_key, old.search_latin);
+        INSERT INTO {TRIGRAM_TABLE}(rowid, search_key, search_latin)
+        VALUES (new.id, new.search_key, new.search_latin);
+    END""",
+    f"INSERT INTO {TRIGRAM_TABLE}({TRIGRAM_TABLE}) VALUES ('rebuild')"
+]
+
+# Longest query (in folded characters) that is matched; the rest is ignored
+MAX_QUERY_LENGTH = 64
+
+HALANT = '्'
+ANUSVARA = 'ं'
+NUKTA = '़'
+NASALS = set('ङञणनम')
+
+# Spelling variants readers use interchangeably
+DEVANAGARI_FOLDS = str.maketrans({
+    'ई': 'इ', 'ऊ': 'उ', 'ी': 'ि', 'ू': 'ु',
+    'ँ': ANUSVARA, 'ऑ': 'ओ', 'ॉ': 'ो', 'ॅ': 'े', 'ऍ': 'ए',
+    NUKTA: None, '‌': None, '‍': None,
+})
+
+CONSONANTS = {
+    'क': 'k', 'ख': 'kh', 'ग': 'g', 'घ': 'gh', 'ङ': 'n',
+    'च': 'ch', 'छ': 'chh', 'ज': 'j', 'झ': 'jh', 'ञ': 'n',
+    'ट': 't', 'ठ': 'th', 'ड': 'd', 'ढ': 'dh', 'ण': 'n',
+    'त': 't', 'थ': 'th', 'द': 'd', 'ध': 'dh', 'न': 'n',
+    'प': 'p', 'फ': 'ph', 'ब': 'b', 'भ': 'bh', 'म': 'm',
+    'य': 'y', 'र': 'r', 'ल': 'l', 'ळ': 'l', 'व': 'v',
+    'श': 'sh', 'ष': 'sh', 'स': 's', 'ह': 'h',
+}
+
+VOWELS = {
+    'अ': 'a', 'आ': 'a', 'इ': 'i', 'उ': 'u', 'ऋ': 'ri',
+    'ए': 'e', 'ऐ': 'ai', 'ओ': 'o', 'औ': 'au',
+}
+
+VOWEL_SIGNS = {
+    'ा': 'a', 'ि': 'i', 'ु': 'u', 'ृ': 'ri',
+    'े': 'e', 'ै': 'ai', 'ो': 'o', 'ौ': 'au',
+}
+
+DIGITS = {chr(0x0966 + digit): str(digit) for digit in range(10)}
+
+LATIN_FOLDS = [
+    (re.compile('ee'), 'i'),
+    (re.compile('oo'), 'u'),
+    (re.compile(r'([a-z])\1+'), r'\1'),
+]
+
+def _is_devanagari(char):
+    return 'ऀ' <= char <= 'ॿ'
+
+def fold(value):
+    value = unicodedata.normalize('NFKD', value or '').casefold()
+    # Drop Latin accents but keep Devanagari signs, which NFKD also exposes
+    value = ''.join(
+        char for char in value if not unicodedata.combining(char) or _is_devanagari(char)
+    ).translate(DEVANAGARI_FOLDS)
+
+    # A half nasal before a consonant is the same sound as the anusvara
+    value = re.sub(f"[{''.join(NASALS)}]{HALANT}(?=[क-ह])", ANUSVARA, value)
+    return ' '.join(TOKEN_PATTERN.findall(unicodedata.normalize('NFC', value)))
+
+INHERENT = 'ə'
+
+def _syllables(word):
+    # [consonant, vowel, coda]; vowel None after a halant
+    syllables = []
+    for char in word:
+        if char in CONSONANTS:
+            syllables.append([CONSONANTS[char], INHERENT, ''])
+        elif char in VOWELS:
+            syllables.append(['', VOWELS[char], ''])
+        elif char in VOWEL_SIGNS and syllables:
+            syllables[-1][1] = VOWEL_SIGNS[char]
+        elif char == HALANT and syllables:
+            syllables[-1][1] = None
+        elif char == ANUSVARA and syllables:
+            syllables[-1][2] += 'n'
+        elif char == 'ः' and syllables:
+            syllables[-1][2] += 'h'
+        elif char in DIGITS:
+            syllables.append([DIGITS[char], None, ''])
+    return syllables
+
+def _transliterate(word):
+    syllables = _syllables(word)
+    inherent = lambda index: syllables[index][0] and syllables[index][1] == INHERENT and not syllables[index][2]
+
+    # Hindi drops the inherent vowel at the end of a word ("राम" -> "ram", but
+    # not after a conjunct: "रहस्य" -> "rahasya") and between a vowel and a
+    # pronounced syllable ("प्रेमचंद" -> "premchand")
+    if len(syllables) > 1 and inherent(-1) and syllables[-2][1]:
+        syllables[-1][1] = None
+    for index in range(len(syllables) - 2, 0, -1):
+        before, after = syllables[index - 1], syllables[index + 1]
+        if inherent(index) and before[1] and after[0] and after[1]:
+            syllables[index][1] = None
+
+    latin = ''.join(consonant + (vowel or '') + coda for consonant, vowel, coda in syllables)
+    return re.sub(r'n(?=[pbm])', 'm', latin.replace(INHERENT, 'a'))
+
+def latinize(key):
+    words = [_transliterate(word) if any(map(_is_devanagari, word)) else word for word in key.split()]
+    latin = ' '.join(word for word in words if word)
+    for pattern, replacement in LATIN_FOLDS:
+        latin = pattern.sub(replacement, latin)
+    return latin
+
+def search_keys(title, author):
+    key = fold(f'{title or ""} {author or ""}')
+    return {'search_key': key, 'search_latin': latinize(key)}
+
+def trigrams(value):
+    return sorted({value[index:index + 3] for index in range(len(value) - 2)})
+
+def ensure_fuzzy_index():
+    return ensure_fts_table(TRIGRAM_TABLE, TRIGRAM_SCHEMA)
+
+def apply_fuzzy(query, search):
+    # Books ranked by similarity to the search, or None when fuzzy matching is unavailable
+    if not ensure_fuzzy_index():
+        return None
+
+    key = fold(search)[:MAX_QUERY_LENGTH]
+    columns = {'search_latin': trigrams(latinize(key))}
+    if any(map(_is_devanagari, key)):
+        columns['search_key'] = trigrams(key)
+
+    # One index lookup per trigram; a book's share is how many of them found it
+    lookups = []
+    shares = []
+    params = {
+        'threshold': current_app.config.get('FUZZY_THRESHOLD', 0.5),
+        'candidates': current_app.config.get('FUZZY_CANDIDATES', 200),
+    }
+    for column_name, grams in columns.items():
+        if not grams:
+            continue
+        for gram in grams:
+            name = f'g{len(params)}'
+            params[name] = f'{column_name} : "{gram}"'
+            lookups.append(f"SELECT rowid, '{column_name}' AS col FROM {TRIGRAM_TABLE} WHERE {TRIGRAM_TABLE} MATCH :{name}")
+        shares.append(f"SUM(col = '{column_name}') * 1.0 / {len(grams)}")
+
+    if not lookups:
+        return query.filter(False)
+
+    similarity = shares[0] if len(shares) == 1 else f"MAX({', '.join(shares)})"
+    matches = text(
+        f"SELECT rowid, {similarity} AS similarity FROM ({' UNION ALL '.join(lookups)}) "
+        "GROUP BY rowid HAVING similarity >= :threshold "
+        "ORDER BY similarity DESC LIMIT :candidates"
+    ).bindparams(**params).columns(
+        column('rowid'), column('similarity')
+    ).subquery('fuzzy_matches')
+
+    # Equal shares: the shorter key is the closer match
+    return query.join(matches, Book.id == matches.c.rowid).order_by(
+        matches.c.similarity.desc(), func.length(Book.search_latin), Book.id
+    )
+
+@event.listens_for(Book, 'before_insert')
+def _key_new_book(mapper, connection, target):
+    for name, value in search_keys(target.title, target.author).items():
+        setattr(target, name, value)
+
+@event.listens_for(Book, 'before_update')
+def _rekey_book(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.title.history.has_changes() or state.attrs.author.history.has_changes():
+        for name, value in search_keys(target.title, target.author).items():
+            setattr(target, name, value)
@@ -0,0 +1,44 @@
+import multiprocessing
+import os
+
+# Gunicorn settings for `gunicorn -c gunicorn.conf.py wsgi:app` (serve.py uses
+# this file too). Every value can be overridden from the environment.
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', 9001)}")
+
+# Processes x threads. Each worker has its own connection pool
+# (DB_POOL_SIZE + DB_MAX_OVERFLOW) and its own password hashing pool.
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 4))
+
+# Import the app (and run migrations) once in the master, then fork
+preload_app = True
+
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then to cap memory growth
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get('ACCESS_LOG', '-') or None  # empty disables
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+def post_worker_init(worker):
+    # One set of background jobs for the whole server, in whichever worker
+    # holds the scheduler lock. Never in the master: every later fork
+    # (including max_requests recycling) would copy a multi-threaded process.
+    from wsgi import app
+    from scheduler import claim_scheduler, start_background_jobs
+    if claim_scheduler(os.path.join(app.instance_path, 'scheduler.lock')):
+        start_background_jobs(app)
+
+def post_fork(server, worker):
+    # Connections opened in the master must not be shared with the children
+    from wsgi import app
+    from database import db
+    with app.app_context():
+        db.engine.dispose(close=False)
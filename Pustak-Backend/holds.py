@@ -0,0 +1,230 @@
+import bisect
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from database import db, Hold, HoldQueue, DonatedBook
+from circulation import claim_available_copy
+from http_cache import bump_catalog_version
+
+# Waitlist (holds) for titles with no free copy.
+#
+# A reader places one hold per title; holds are served by priority (higher
+# first, admins can raise it) and then in the order they were placed. When a
+# copy frees up - a return, a forced return, a new donation or an expired
+# pickup - it goes straight to the head of the queue: the hold becomes
+# 'ready', the copy stays unavailable to everyone else, and the holder has
+# HOLD_PICKUP_HOURS to borrow it before the expire-holds job passes it on.
+#
+# Queue positions come from a per-process sorted list of the title's waiting
+# holds, found with a binary search. Every change to the waiting set bumps
+# the title's HoldQueue.version, so a cached list is reused until the queue
+# actually changes and a position lookup costs a primary key read plus a
+# bisect.
+
+ACTIVE_STATUSES = ('waiting', 'ready')
+QUEUE_ORDER = (Hold.priority.desc(), Hold.id)
+QUEUE_CACHE_ENTRIES = 1024
+
+_queues = OrderedDict()
+_queues_lock = threading.Lock()
+
+def _queue_changed(book_id, waiting_delta=0):
+    values = {'version': HoldQueue.version + 1}
+    if waiting_delta:
+        values['waiting'] = HoldQueue.waiting + waiting_delta
+
+    result = db.session.execute(
+        update(HoldQueue).where(HoldQueue.book_id == book_id).values(**values),
+        execution_options={'synchronize_session': False}
+    )
+    if result.rowcount:
+        return
+
+    # First hold on this title
+    try:
+        with db.session.begin_nested():
+            db.session.add(HoldQueue(book_id=book_id, waiting=max(waiting_delta, 0), version=1))
+    except IntegrityError:
+        # Created concurrently by another request
+        _queue_changed(book_id, waiting_delta)
+
+def _next_waiting(book_id):
+    return db.session.execute(
+        select(Hold.id).where(Hold.book_id == book_id, Hold.status == 'waiting')
+        .order_by(*QUEUE_ORDER).limit(1)
+    ).scalar()
+
+def _set_aside(hold_id, book_id, copy_id):
+    now = datetime.utcnow()
+    pickup_hours = current_app.config.get('HOLD_PICKUP_HOURS', 72)
+
+    result = db.session.execute(
+        update(Hold).where(Hold.id == hold_id, Hold.status == 'waiting').values(
+            status='ready',
+            donated_book_id=copy_id,
+            ready_at=now,
+            expires_at=now + timedelta(hours=pickup_hours)
+        ),
+        execution_options={'synchronize_session': False}
+    )
+    if result.rowcount:
+        _queue_changed(book_id, -1)
+    return result.rowcount == 1
+
+def place_hold(book_id, user_id):
+    hold = Hold(book_id=book_id, user_id=user_id, status='waiting')
+    db.session.add(hold)
+    db.session.flush()
+    _queue_changed(book_id, 1)
+
+    # A copy may be free already (e.g. returned while the reader was deciding)
+    fill_holds(book_id)
+    return hold
+
+def fill_holds(book_id):
+    # Set aside free copies of the title for waiting holders
+    filled = 0
+    while True:
+        hold_id = _next_waiting(book_id)
+        if hold_id is None:
+            break
+
+        copy_id = claim_available_copy(book_id)
+        if copy_id is None:
+            break
+
+        if _set_aside(hold_id, book_id, copy_id):
+            filled += 1
+        else:
+            # The hold was cancelled under us; put the copy back
+            db.session.execute(
+                update(DonatedBook).where(DonatedBook.id == copy_id).values(is_available=True),
+                execution_options={'synchronize_session': False}
+            )
+
+    if filled:
+        bump_catalog_version()
+    return filled
+
+def fill_waiting(book_ids):
+    # fill_holds() for whichever of these titles have anyone waiting
+    if not book_ids:
+        return 0
+
+    waiting = db.session.execute(
+        select(HoldQueue.book_id).where(HoldQueue.book_id.in_(book_ids), HoldQueue.waiting > 0)
+    ).scalars().all()
+    return sum(fill_holds(book_id) for book_id in waiting)
+
+def release_copy(copy):
+    # Hand a copy coming back into circulation to the next holder, or shelve it
+    while True:
+        hold_id = _next_waiting(copy.book_id)
+        if hold_id is None:
+            copy.is_available = True
+            return None
+
+        if _set_aside(hold_id, copy.book_id, copy.id):
+            return hold_id
+
+def ready_hold(book_id, user_id):
+    return Hold.query.filter(
+        Hold.book_id == book_id,
+        Hold.user_id == user_id,
+        Hold.status == 'ready',
+        Hold.expires_at >= datetime.utcnow()
+    ).first()
+
+def collect(hold):
+    # Borrowing a ready hold; returns its copy, or None if it expired meanwhile
+    result = db.session.execute(
+        update(Hold).where(Hold.id == hold.id, Hold.status == 'ready').values(
+            status='fulfilled', closed_at=datetime.utcnow()
+        ),
+        execution_options={'synchronize_session': False}
+    )
+    return hold.donated_book_id if result.rowcount == 1 else None
+
+def cancel_hold(hold, status='cancelled'):
+    previous = hold.status
+    if previous not in ACTIVE_STATUSES:
+        return False
+
+    result = db.session.execute(
+        update(Hold).where(Hold.id == hold.id, Hold.status == previous).values(
+            status=status, closed_at=datetime.utcnow()
+        ),
+        execution_options={'synchronize_session': False}
+    )
+    if result.rowcount == 0:
+        return False
+
+    if previous == 'waiting':
+        _queue_changed(hold.book_id, -1)
+    else:
+        copy = db.session.get(DonatedBook, hold.donated_book_id)
+        if copy:
+            release_copy(copy)
+    return True
+
+def set_priority(hold, priority):
+    hold.priority = priority
+    db.session.flush()
+    _queue_changed(hold.book_id)
+
+def expire_holds():
+    # Scheduled: pass copies whose pickup window ran out to the next holder
+    expired = Hold.query.filter(
+        Hold.status == 'ready',
+        Hold.expires_at < datetime.utcnow()
+    ).order_by(Hold.expires_at).all()
+
+    count = sum(1 for hold in expired if cancel_hold(hold, status='expired'))
+    db.session.commit()
+    return count
+
+def _waiting_keys(book_id):
+    version = db.session.execute(
+        select(HoldQueue.version).where(HoldQueue.book_id == book_id)
+    ).scalar()
+
+    with _queues_lock:
+        cached = _queues.get(book_id)
+        if cached is not None and cached[0] == version:
+            _queues.move_to_end(book_id)
+            return cached[1]
+
+    keys = [
+        (-priority, hold_id) for priority, hold_id in db.session.execute(
+            select(Hold.priority, Hold.id).where(Hold.book_id == book_id, Hold.status == 'waiting')
+            .order_by(*QUEUE_ORDER)
+        )
+    ]
+
+    with _queues_lock:
+        _queues[book_id] = (version, keys)
+        _queues.move_to_end(book_id)
+        while len(_queues) > QUEUE_CACHE_ENTRIES:
+            _queues.popitem(last=False)
+    return keys
+
+def queue_position(hold):
+    # 1-based place among the title's waiting holds; None once it is not waiting
+    if hold.status != 'waiting':
+        return None
+
+    keys = _waiting_keys(hold.book_id)
+    return bisect.bisect_left(keys, (-hold.priority, hold.id)) + 1
+
+def queue_length(book_id):
+    queue = db.session.get(HoldQueue, book_id, populate_existing=True)
+    return queue.waiting if queue else 0
+
+def hold_details(hold):
+    data = hold.to_dict()
+    data['position'] = queue_position(hold)
+    data['queue_length'] = queue_length(hold.book_id)
+    return data
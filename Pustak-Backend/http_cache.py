@@ -0,0 +1,107 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import request, current_app, make_response
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+from database import db, Book, DonatedBook, BorrowedBook, CatalogVersion
+
+# Server-side response cache and conditional GET for public catalog reads.
+#
+# Every transaction that touches books, donated copies or borrowings bumps a
+# single catalog version row (see the after_flush hook below), so all workers
+# agree on when cached data went stale. Responses are cached per process,
+# keyed on (version, URL), and carry an ETag derived from the same pair;
+# a client presenting a current ETag gets 304 without the view running.
+
+CATALOG_VERSION_ID = 1
+CATALOG_MODELS = (Book, DonatedBook, BorrowedBook)
+
+_responses = OrderedDict()
+_responses_lock = threading.Lock()
+
+def current_version():
+    row = db.session.get(CatalogVersion, CATALOG_VERSION_ID, populate_existing=True)
+    return row.version if row else None
+
+def bump_catalog_version(session=None):
+    # Core-level writes (bulk imports, raw UPDATEs) must call this themselves
+    session = session or db.session
+    result = session.execute(
+        update(CatalogVersion).where(CatalogVersion.id == CATALOG_VERSION_ID).values(
+            version=CatalogVersion.version + 1
+        ),
+        execution_options={'synchronize_session': False}
+    )
+    if result.rowcount == 0:
+        session.add(CatalogVersion(id=CATALOG_VERSION_ID, version=1))
+
+@event.listens_for(Session, 'after_flush')
+def _bump_on_catalog_change(session, flush_context):
+    changed = (session.new | session.dirty | session.deleted)
+    if any(isinstance(obj, CATALOG_MODELS) for obj in changed):
+        session.connection().execute(
+            update(CatalogVersion).where(CatalogVersion.id == CATALOG_VERSION_ID).values(
+                version=CatalogVersion.version + 1
+            )
+        )
+
+def _remember(key, response):
+    limit = current_app.config.get('CATALOG_CACHE_ENTRIES', 512)
+
+    with _responses_lock:
+        _responses[key] = (response.get_data(), response.mimetype)
+        _responses.move_to_end(key)
+        while len(_responses) > limit:
+            _responses.popitem(last=False)
+
+def _recall(key):
+    with _responses_lock:
+        entry = _responses.get(key)
+        if entry is not None:
+            _responses.move_to_end(key)
+        return entry
+
+def _cache_headers(response, etag):
+    max_age = current_app.config.get('CATALOG_CACHE_MAX_AGE', 0)
+    response.set_etag(etag)
+    if max_age:
+        response.headers['Cache-Control'] = f'public, max-age={max_age}'
+    else:
+        response.headers['Cache-Control'] = 'public, no-cache'
+    return response
+
+def cached_catalog_response(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        version = current_version()
+        if version is None:
+            # No version row yet (see ensure_catalog_version), so nothing can be invalidated
+            return view(*args, **kwargs)
+
+        url = request.full_path
+        etag = '{}-{}'.format(version, hashlib.sha1(url.encode('utf-8')).hexdigest()[:16])
+
+        if etag in request.if_none_match:
+            return _cache_headers(make_response('', 304), etag)
+
+        key = (version, url)
+        cached = _recall(key)
+        if cached is not None:
+            body, mimetype = cached
+            return _cache_headers(current_app.response_class(body, 200, mimetype=mimetype), etag)
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code != 200:
+            return response
+
+        _remember(key, response)
+        return _cache_headers(response, etag)
+
+    return wrapper
+
+def ensure_catalog_version():
+    if not db.session.get(CatalogVersion, CATALOG_VERSION_ID):
+        db.session.add(CatalogVersion(id=CATALOG_VERSION_ID, version=0))
+        db.session.commit()
@@ -0,0 +1,82 @@
+import threading
+import time
+from flask import g, current_app
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from database import db, User
+from replica import on_primary
+
+# Request identity helpers.
+#
+# Tokens carry the user's role ('is_admin') and token version ('tv') as
+# claims, so admin checks need no database access. Changing a user's role
+# bumps their token_version; tokens minted with an older version are
+# rejected by the blocklist check below. That check reads a per-process map
+# of {user_id: token_version} (only users whose version was ever bumped),
+# refreshed from the database at most once every TOKEN_VERSION_TTL seconds.
+
+_versions = {}
+_versions_loaded_at = None
+_versions_lock = threading.Lock()
+
+def token_claims(user):
+    return {
+        'is_admin': bool(user.is_admin),
+        'tv': user.token_version or 0
+    }
+
+def current_user():
+    # Loaded at most once per request, only by routes that need the row
+    if 'current_user' not in g:
+        g.current_user = db.session.get(User, get_jwt_identity())
+    return g.current_user
+
+def is_admin():
+    claims = get_jwt()
+    if 'is_admin' in claims:
+        return bool(claims['is_admin'])
+
+    # Tokens issued before role claims existed
+    user = current_user()
+    return bool(user and user.is_admin)
+
+def _token_versions():
+    global _versions, _versions_loaded_at
+
+    ttl = current_app.config.get('TOKEN_VERSION_TTL', 30)
+    now = time.monotonic()
+
+    if _versions_loaded_at is None or now - _versions_loaded_at > ttl:
+        with _versions_lock:
+            if _versions_loaded_at is None or now - _versions_loaded_at > ttl:
+                # Revocations must not wait for a lagging replica
+                with on_primary():
+                    rows = db.session.query(User.id, User.token_version).filter(
+                        User.token_version > 0
+                    ).all()
+                _versions = {user_id: version for user_id, version in rows}
+                _versions_loaded_at = now
+
+    return _versions
+
+def token_is_revoked(jwt_header, jwt_payload):
+    version = jwt_payload.get('tv')
+    if version is None:
+        return False
+
+    return _token_versions().get(jwt_payload['sub'], 0) > version
+
+def bump_token_version(user):
+    user.token_version = (user.token_version or 0) + 1
+    # This process sees the change once it commits, others within TOKEN_VERSION_TTL
+    session = object_session(user) or db.session
+    session.info.setdefault('token_versions', {})[user.id] = user.token_version
+
+@event.listens_for(Session, 'after_commit')
+def _apply_token_versions(session):
+    _versions.update(session.info.pop('token_versions', {}))
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_token_versions(session):
+    session.info.pop('token_versions', None)
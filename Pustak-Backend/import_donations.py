@@ -0,0 +1,41 @@
+import argparse
+from app import create_app
+from database import User
+from importer import import_donations, iter_csv, iter_ndjson, DEFAULT_BATCH_SIZE
+
+# Bulk-import donated books from a CSV or NDJSON file.
+#
+#   python import_donations.py drive.csv --donor admin
+#   python import_donations.py drive.ndjson --donor admin --batch-size 5000
+#
+# CSV files need a header row. Recognised columns/keys: title, author (required),
+# isbn, genre or category, description, image_url, condition, notes.
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk-import donated books')
+    parser.add_argument('path')
+    parser.add_argument('--donor', default='admin', help='username credited with the donations')
+    parser.add_argument('--format', choices=['csv', 'ndjson'])
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+    
+    file_format = args.format or ('csv' if args.path.endswith('.csv') else 'ndjson')
+    
+    app = create_app()
+    
+    with app.app_context():
+        donor = User.query.filter_by(username=args.donor).first()
+        if not donor:
+            print(f"Donor '{args.donor}' not found!")
+            exit(1)
+        
+        with open(args.path, 'rb') as stream:
+            rows = iter_csv(stream) if file_format == 'csv' else iter_ndjson(stream)
+            report = import_donations(rows, donor.id, batch_size=args.batch_size)
+        
+        print(f"Rows read: {report.rows}")
+        print(f"Donations imported: {report.imported}")
+        print(f"New books created: {report.books_created}")
+        print(f"Rows with errors: {report.error_count}")
+        for error in report.errors[:20]:
+            print(f"  line {error['line']}: {error['error']}")
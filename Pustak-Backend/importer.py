@@ -0,0 +1,274 @@
+import csv
+import io
+import json
+import re
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from database import db, Book, DonatedBook
+from http_cache import bump_catalog_version
+from holds import fill_waiting
+from barcodes import normalize, validate_custom, assign_missing
+from suggest import log_book_changes
+from fuzzy import search_keys
+from isbn import book_keys, normalize_isbn
+import stats
+
+# Bulk donation import for donation drives.
+#
+# Rows are streamed from CSV or NDJSON, matched against an in-memory index of
+# existing books (ISBN first, then normalized title/author, like donate_book),
+# and written in batches: one multi-row INSERT for new books and one for the
+# donations, then a single commit. A bad row is reported with its line number
+# and never aborts the rest of the import; if a batch fails in the database
+# it is retried row by row so only the offending rows are rejected. Bytes
+# that are not UTF-8 likewise reject just the rows containing them.
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+INVALID_UTF8 = 'Line is not valid UTF-8'
+UNDECODABLE = re.compile('[\udc80-\udcff]')
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.books_created = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'imported': self.imported,
+            'books_created': self.books_created,
+            'error_count': self.error_count,
+            'errors': self.errors
+        }
+
+class BookIndex:
+    # In-memory copy of the keys isbn.find_book() looks up, for whole batches
+    def __init__(self):
+        self.by_title_author = {}
+        self.by_isbn = {}
+
+        rows = db.session.query(
+            Book.id, Book.title_author_key, Book.isbn_key, Book.isbn
+        ).order_by(Book.id).yield_per(5000)
+        for book_id, title_author, key, isbn in rows:
+            self.add(book_id, title_author, key, isbn)
+
+    def add(self, book_id, title_author, key, isbn):
+        # The oldest book wins a title/author, as in find_book()
+        self.by_title_author.setdefault(title_author, (book_id, key))
+        # ISBNs failing their check digit are matched as stored; such a string
+        # never equals a valid key, so both kinds share one dict
+        if key:
+            self.by_isbn[key] = book_id
+        elif isbn:
+            self.by_isbn.setdefault(isbn, book_id)
+
+    def find(self, title_author, key, isbn=None):
+        identity = key or isbn
+        if identity and identity in self.by_isbn:
+            return self.by_isbn[identity]
+        book_id, book_key = self.by_title_author.get(title_author, (None, None))
+        if book_id is not None and (not key or book_key in (None, key)):
+            return book_id
+        return None
+
+def _undecodable(value):
+    # Bytes that were not UTF-8 come through as lone surrogates (surrogateescape)
+    return UNDECODABLE.search(value) is not None
+
+def iter_csv(stream):
+    # Invalid UTF-8 fails only the rows it is in, instead of the whole stream
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='surrogateescape', newline='')
+    # Line 1 is the header
+    for line, row in enumerate(csv.DictReader(text), start=2):
+        # Extra fields beyond the header are collected in a list under None
+        fields = [value for value in row.values() if isinstance(value, str)] + (row.get(None) or [])
+        if any(map(_undecodable, fields)):
+            yield line, ValueError(INVALID_UTF8)
+            continue
+        yield line, row
+
+def iter_ndjson(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8', errors='surrogateescape')
+    for line, raw in enumerate(text, start=1):
+        raw = raw.strip()
+        if not raw:
+            continue
+        if _undecodable(raw):
+            yield line, ValueError(INVALID_UTF8)
+            continue
+        try:
+            row = json.loads(raw)
+        except ValueError as e:
+            yield line, ValueError(f'Invalid JSON: {e}')
+            continue
+        if not isinstance(row, dict):
+            yield line, ValueError('Each line must be a JSON object')
+            continue
+        yield line, row
+
+def _text(row, *names):
+    for name in names:
+        value = row.get(name)
+        if value is not None:
+            return str(value).strip()
+    return ''
+
+def parse_row(row):
+    title = _text(row, 'title')
+    author = _text(row, 'author')
+
+    if not all([title, author]):
+        raise ValueError('Title and author are required')
+
+    # Copies that already carry a label keep it; the rest get one generated
+    barcode = normalize(_text(row, 'barcode')) or None
+    if barcode:
+        error = validate_custom(barcode)
+        if error:
+            raise ValueError(error)
+
+    return {
+        'title': title,
+        'author': author,
+        # Compact, and None when empty so books without one do not collide
+        'isbn': normalize_isbn(_text(row, 'isbn')),
+        'category': _text(row, 'genre', 'category') or 'General',
+        'description': _text(row, 'description'),
+        'image_url': _text(row, 'image_url'),
+        'condition': _text(row, 'condition') or 'Good',
+        'notes': _text(row, 'notes'),
+        'barcode': barcode
+    }
+
+def _write_batch(batch, index, donor_id):
+    # Resolve every row to an existing book or to a book created in this batch
+    new_books = []
+    pending = {}
+    targets = []
+
+    for line, data in batch:
+        keys = book_keys(data['title'], data['author'], data['isbn'])
+        book_id = index.find(keys['title_author_key'], keys['isbn_key'], keys['isbn'])
+        identity = keys['isbn_key'] or keys['isbn']
+
+        if book_id is not None:
+            targets.append(('existing', book_id))
+            continue
+
+        position = None
+        if identity:
+            position = pending.get(('isbn', identity))
+        if position is None:
+            candidate = pending.get(keys['title_author_key'])
+            # Same rule as BookIndex.find(): a different ISBN is another edition
+            if candidate is not None and (
+                not keys['isbn_key'] or new_books[candidate]['isbn_key'] in (None, keys['isbn_key'])
+            ):
+                position = candidate
+
+        if position is None:
+            position = len(new_books)
+            new_books.append({
+                'title': data['title'],
+                'author': data['author'],
+                'category': data['category'],
+                'description': data['description'],
+                'image_url': data['image_url'],
+                **keys,
+                **search_keys(data['title'], data['author'])
+            })
+            pending.setdefault(keys['title_author_key'], position)
+            if identity:
+                pending[('isbn', identity)] = position
+
+        targets.append(('new', position))
+
+    new_ids = []
+    if new_books:
+        new_ids = list(db.session.execute(
+            insert(Book).returning(Book.id, sort_by_parameter_order=True),
+            new_books
+        ).scalars())
+        log_book_changes(new_ids)
+
+    donations = []
+    for (line, data), (kind, ref) in zip(batch, targets):
+        donations.append({
+            'book_id': ref if kind == 'existing' else new_ids[ref],
+            'donor_id': donor_id,
+            'condition': data['condition'],
+            'notes': data['notes'],
+            'barcode': data['barcode']
+        })
+
+    db.session.execute(insert(DonatedBook), donations)
+    assign_missing(db.session)
+    # New copies of titles with a waitlist go to the first holders
+    fill_waiting({ref for kind, ref in targets if kind == 'existing'})
+
+    stats.bump(total_books=len(new_books), total_donations=len(donations))
+    bump_catalog_version()
+    db.session.commit()
+
+    # Only index books once they are committed
+    for book, book_id in zip(new_books, new_ids):
+        index.add(book_id, book['title_author_key'], book['isbn_key'], book['isbn'])
+
+    return len(donations), len(new_books)
+
+def _flush(batch, index, donor_id, report):
+    if not batch:
+        return
+
+    try:
+        imported, created = _write_batch(batch, index, donor_id)
+    except SQLAlchemyError:
+        db.session.rollback()
+        if len(batch) == 1:
+            raise
+        # Isolate the rows the database rejected
+        for item in batch:
+            try:
+                _flush([item], index, donor_id, report)
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                report.add_error(item[0], str(e.orig) if getattr(e, 'orig', None) else str(e))
+        return
+
+    report.imported += imported
+    report.books_created += created
+
+def import_donations(rows, donor_id, batch_size=DEFAULT_BATCH_SIZE):
+    report = ImportReport()
+    index = BookIndex()
+    batch = []
+
+    for line, row in rows:
+        report.rows += 1
+
+        if isinstance(row, Exception):
+            report.add_error(line, str(row))
+            continue
+
+        try:
+            batch.append((line, parse_row(row)))
+        except ValueError as e:
+            report.add_error(line, str(e))
+            continue
+
+        if len(batch) >= batch_size:
+            _flush(batch, index, donor_id, report)
+            batch = []
+
+    _flush(batch, index, donor_id, report)
+    return report
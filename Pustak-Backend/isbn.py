@@ -0,0 +1,173 @@
+import logging
+import re
+import unicodedata
+from sqlalchemy import event, inspect, text
+from database import Book
+
+# Book identity: ISBN normalization and the keys donations are matched on.
+#
+# Every book stores two indexed keys next to what was entered:
+#
+#   isbn_key          the ISBN as 13 digits (ISBN-10s converted), only when
+#                     its check digit is valid; unique, so one book per ISBN
+#                     (NULL otherwise; see below)
+#   title_author_key  title and author case-folded, punctuation dropped and
+#                     whitespace collapsed
+#
+# isbn itself is stored compact (no hyphens or spaces, upper-case X), and
+# an empty ISBN is stored as NULL so that books without one no longer
+# collide on the unique constraint.
+#
+# An ISBN whose check digit is wrong is still accepted, as the bundled
+# catalog is full of them: it is stored compact with no key, and matched on
+# that compact form instead. Every intake path (books, donations, imports)
+# follows this one rule.
+#
+# find_book() resolves a donation with one indexed lookup on the ISBN key
+# (or the compact ISBN), falling back to the title/author key. A
+# title/author match carrying a different valid ISBN is another edition and
+# does not count.
+#
+# ORM writes get their keys from the hooks below. Core bulk inserts
+# (importer.py, seed_data.py) add book_keys() to their rows themselves.
+# Existing rows are normalized by migration 8 (normalize_existing_books()).
+
+logger = logging.getLogger(__name__)
+
+SEPARATORS = re.compile(r'[\s\-‐‑‒–—.]')
+PREFIX = re.compile(r'^ISBN(?:1[03])?:?')
+ISBN_PATTERN = re.compile(r'^(\d{9}[\dX]|\d{13})$')
+
+def normalize_isbn(value):
+    # Compact form, or None for an empty value; does not check the digits
+    if value is None:
+        return None
+    value = SEPARATORS.sub('', unicodedata.normalize('NFKC', str(value))).upper()
+    return PREFIX.sub('', value) or None
+
+def _isbn10_valid(digits):
+    total = sum((10 - index) * (10 if char == 'X' else int(char)) for index, char in enumerate(digits))
+    return 'X' not in digits[:9] and total % 11 == 0
+
+def _isbn13_check(digits):
+    total = sum(int(char) * (1 if index % 2 == 0 else 3) for index, char in enumerate(digits[:12]))
+    return str((10 - total % 10) % 10)
+
+def isbn_key(value):
+    # ISBN-13 digits for a valid ISBN-10 or ISBN-13, else None
+    compact = normalize_isbn(value)
+    if not compact or not ISBN_PATTERN.match(compact):
+        return None
+
+    if len(compact) == 10:
+        if not _isbn10_valid(compact):
+            return None
+        compact = '978' + compact[:9]
+        return compact + _isbn13_check(compact)
+
+    if not compact.startswith(('978', '979')) or compact[12] != _isbn13_check(compact):
+        return None
+    return compact
+
+def _books_with_isbn(value):
+    key = isbn_key(value)
+    if key:
+        return Book.query.filter_by(isbn_key=key)
+    return Book.query.filter_by(isbn=normalize_isbn(value))
+
+def _fold(value):
+    value = unicodedata.normalize('NFKC', value or '').casefold()
+    # Punctuation goes; combining marks stay (Devanagari vowel signs are marks)
+    value = ''.join(' ' if unicodedata.category(char).startswith('P') else char for char in value)
+    return ' '.join(value.split())
+
+def title_author_key(title, author):
+    # Whitespace is collapsed, so the tab cannot occur inside either part
+    return f'{_fold(title)}\t{_fold(author)}'
+
+def book_keys(title, author, isbn):
+    compact = normalize_isbn(isbn)
+    return {
+        'isbn': compact,
+        'isbn_key': isbn_key(compact),
+        'title_author_key': title_author_key(title, author),
+    }
+
+def find_book(title, author, isbn=None):
+    # The book a donation belongs to: same ISBN, else same title/author and no other ISBN
+    key = isbn_key(isbn)
+    if normalize_isbn(isbn):
+        book = _books_with_isbn(isbn).first()
+        if book:
+            return book
+
+    # Editions of one title are few; filtering them here keeps the lookup on the key index
+    books = Book.query.filter_by(title_author_key=title_author_key(title, author)).order_by(Book.id)
+    for book in books:
+        if not key or book.isbn_key in (None, key):
+            return book
+    return None
+
+def isbn_taken(isbn, book_id=None):
+    # Whether another book already has this ISBN
+    if not normalize_isbn(isbn):
+        return False
+    query = _books_with_isbn(isbn)
+    if book_id is not None:
+        query = query.filter(Book.id != book_id)
+    return query.first() is not None
+
+def normalize_existing_books(conn, batch_size=1000):
+    # Backfill for rows written before the keys existed. A later book with the
+    # same ISBN as an earlier one keeps its ISBN but gets no key; it is logged
+    # for an admin to merge or correct.
+    taken = {isbn for (isbn,) in conn.execute(text('SELECT isbn FROM book WHERE isbn IS NOT NULL'))}
+    seen_keys = set()
+    duplicates = []
+    last_id = 0
+
+    while True:
+        rows = conn.execute(text(
+            'SELECT id, title, author, isbn FROM book WHERE id > :last_id ORDER BY id LIMIT :size'
+        ), {'last_id': last_id, 'size': batch_size}).all()
+        if not rows:
+            break
+
+        updates = []
+        for book_id, title, author, isbn in rows:
+            keys = book_keys(title, author, isbn)
+            if keys['isbn'] != isbn and keys['isbn'] is not None:
+                if keys['isbn'] in taken:
+                    # Another row already holds the compact form
+                    keys['isbn'] = isbn
+                else:
+                    taken.discard(isbn)
+                    taken.add(keys['isbn'])
+            if keys['isbn_key'] in seen_keys:
+                duplicates.append(book_id)
+                keys['isbn_key'] = None
+            elif keys['isbn_key']:
+                seen_keys.add(keys['isbn_key'])
+            updates.append({'book_id': book_id, **keys})
+
+        conn.execute(text(
+            'UPDATE book SET isbn = :isbn, isbn_key = :isbn_key, title_author_key = :title_author_key '
+            'WHERE id = :book_id'
+        ), updates)
+        last_id = rows[-1][0]
+
+    if duplicates:
+        logger.warning('Books sharing an ISBN with an earlier book, left without an ISBN key: %s', duplicates)
+    return duplicates
+
+@event.listens_for(Book, 'before_insert')
+def _key_new_book(mapper, connection, target):
+    for name, value in book_keys(target.title, target.author, target.isbn).items():
+        setattr(target, name, value)
+
+@event.listens_for(Book, 'before_update')
+def _rekey_book(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ('title', 'author', 'isbn')):
+        for name, value in book_keys(target.title, target.author, target.isbn).items():
+            setattr(target, name, value)
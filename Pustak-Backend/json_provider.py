@@ -0,0 +1,102 @@
+import dataclasses
+import decimal
+import json
+import logging
+import uuid
+from datetime import date, datetime, time
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON encoding for every response.
+#
+# JSON_ENCODER picks the encoder: 'auto' (default) uses orjson when it is
+# installed and the standard library otherwise, 'orjson' asks for it
+# explicitly (falling back with a warning if it is missing) and 'stdlib'
+# forces the standard library. Both encoders write datetimes and dates as
+# ISO 8601 (the same text as .isoformat()), so models can hand datetime
+# objects straight to jsonify. Keys stay sorted like Flask's default.
+#
+# orjson writes non-ASCII text as UTF-8 rather than \u escapes, so the
+# Content-Type declares the charset for clients that would otherwise
+# assume Latin-1.
+
+logger = logging.getLogger(__name__)
+
+def _default(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    default = staticmethod(_default)
+    mimetype = 'application/json; charset=utf-8'
+
+class OrjsonJSONProvider(StdlibJSONProvider):
+    def _options(self, indent=False):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def _encode(self, obj, indent=False):
+        try:
+            return orjson.dumps(obj, default=_default, option=self._options(indent))
+        except TypeError:
+            # Values orjson rejects (e.g. integers beyond 64 bits) go through the stdlib
+            return None
+
+    def dumps(self, obj, **kwargs):
+        # Callers asking for stdlib options (indent, separators, ...) get the stdlib encoder
+        if not kwargs:
+            encoded = self._encode(obj)
+            if encoded is not None:
+                return encoded.decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+
+        encoded = self._encode(obj, indent)
+        if encoded is None:
+            return super().response(obj)
+
+        return self._app.response_class(encoded + b'\n', mimetype=self.mimetype)
+
+def provider_class(name):
+    if name == 'stdlib':
+        return StdlibJSONProvider
+    if orjson is None:
+        if name == 'orjson':
+            logger.warning('JSON_ENCODER is orjson but it is not installed; using the standard library')
+        return StdlibJSONProvider
+    return OrjsonJSONProvider
+
+def init_json(app):
+    app.json = provider_class(app.config.get('JSON_ENCODER', 'auto'))(app)
+
+def dumps(obj):
+    # Unsorted, non-escaped encoding for streamed output (exports)
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        except TypeError:
+            pass
+    return json.dumps(obj, default=_default, ensure_ascii=False)
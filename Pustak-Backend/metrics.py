@@ -0,0 +1,210 @@
+import hmac
+import logging
+import threading
+import time
+from flask import g, request, current_app, has_request_context, jsonify
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from replica import request_route
+
+# Per-request latency and SQL instrumentation.
+#
+# Every request records its latency and, through SQLAlchemy cursor events,
+# how many statements it ran and how long they took. Totals and histograms
+# are kept per endpoint (the Flask endpoint name, not the URL, so the label
+# set stays bounded) and served in Prometheus text format at /api/metrics.
+# Figures are per process: with several workers, scrape each one or sum them.
+#
+# Requests are also counted by the database engines they used (replica,
+# primary, both or none; see replica.py), so read routing can be checked.
+#
+# The production config only serves /api/metrics with METRICS_TOKEN set.
+#
+# With SLOW_REQUEST_THRESHOLD set, requests slower than that many seconds are
+# logged together with their slowest statements. Statement parameters are
+# never captured since they can hold passwords and personal data.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger('pustakalay.slow_requests')
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+class EndpointMetrics:
+    def __init__(self):
+        self.responses = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.sql_seconds = 0.0
+        self.routes = {}
+
+_endpoints = {}
+_lock = threading.Lock()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record_statement(conn.info['query_started'].pop(), statement)
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute; without this pop
+    # its start time would stay on the connection's stack for good
+    conn = exception_context.connection
+    started = conn.info.get('query_started') if conn is not None else None
+    if started and exception_context.execution_context is not None:
+        # Counted too: a lock timeout is often why a request was slow
+        _record_statement(started.pop(), exception_context.statement)
+
+def _record_statement(started, statement):
+    # Statements from background jobs and scripts are not attributed to a request
+    if not has_request_context() or 'sql_count' not in g:
+        return
+
+    elapsed = time.perf_counter() - started
+    g.sql_count += 1
+    g.sql_seconds += elapsed
+    if g.sql_statements is not None:
+        g.sql_statements.append((elapsed, statement))
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    g.sql_count = 0
+    g.sql_seconds = 0.0
+    g.sql_statements = [] if current_app.config.get('SLOW_REQUEST_THRESHOLD', 0) else None
+
+def _remember_status(response):
+    g.response_status = response.status_code
+    return response
+
+def _finish_request(error=None):
+    # Runs after streamed responses have finished, so their SQL is included
+    if 'request_started' not in g:
+        return
+
+    elapsed = time.perf_counter() - g.request_started
+    status = g.get('response_status', 500)
+    key = (request.endpoint or 'unmatched', request.method)
+    route = request_route()
+
+    with _lock:
+        metrics = _endpoints.get(key)
+        if metrics is None:
+            metrics = _endpoints[key] = EndpointMetrics()
+        metrics.responses[status] = metrics.responses.get(status, 0) + 1
+        metrics.latency.observe(elapsed)
+        metrics.statements.observe(g.sql_count)
+        metrics.sql_seconds += g.sql_seconds
+        metrics.routes[route] = metrics.routes.get(route, 0) + 1
+
+    threshold = current_app.config.get('SLOW_REQUEST_THRESHOLD', 0)
+    if threshold and elapsed >= threshold:
+        _log_slow_request(elapsed, status, route)
+
+def _log_slow_request(elapsed, status, route):
+    limit = current_app.config.get('SLOW_REQUEST_MAX_STATEMENTS', 20)
+    slowest = sorted(g.sql_statements, key=lambda item: item[0], reverse=True)[:limit]
+
+    lines = [
+        f'{request.method} {request.full_path.rstrip("?")} -> {status} took {elapsed * 1000:.1f}ms '
+        f'({g.sql_count} statements, {g.sql_seconds * 1000:.1f}ms in SQL, database: {route})'
+    ]
+    lines += [f'  {seconds * 1000:8.1f}ms  {" ".join(statement.split())}' for seconds, statement in slowest]
+    slow_logger.warning('\n'.join(lines))
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _histogram_lines(name, labels, histogram):
+    lines = []
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram.total}')
+    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return lines
+
+def render_metrics():
+    requests_total = [
+        '# HELP pustakalay_http_requests_total Requests handled, by endpoint and status.',
+        '# TYPE pustakalay_http_requests_total counter'
+    ]
+    latency = [
+        '# HELP pustakalay_http_request_duration_seconds Request latency.',
+        '# TYPE pustakalay_http_request_duration_seconds histogram'
+    ]
+    statements = [
+        '# HELP pustakalay_sql_statements_per_request SQL statements executed per request.',
+        '# TYPE pustakalay_sql_statements_per_request histogram'
+    ]
+    sql_total = [
+        '# HELP pustakalay_sql_statements_total SQL statements executed.',
+        '# TYPE pustakalay_sql_statements_total counter'
+    ]
+    sql_seconds = [
+        '# HELP pustakalay_sql_duration_seconds_total Time spent executing SQL.',
+        '# TYPE pustakalay_sql_duration_seconds_total counter'
+    ]
+    routes = [
+        '# HELP pustakalay_db_route_requests_total Requests by the database engines they used.',
+        '# TYPE pustakalay_db_route_requests_total counter'
+    ]
+
+    with _lock:
+        for (endpoint, method), metrics in sorted(_endpoints.items()):
+            labels = f'endpoint="{_label(endpoint)}",method="{method}"'
+            for status, count in sorted(metrics.responses.items()):
+                requests_total.append(f'pustakalay_http_requests_total{{{labels},status="{status}"}} {count}')
+            latency += _histogram_lines('pustakalay_http_request_duration_seconds', labels, metrics.latency)
+            statements += _histogram_lines('pustakalay_sql_statements_per_request', labels, metrics.statements)
+            sql_total.append(f'pustakalay_sql_statements_total{{{labels}}} {metrics.statements.total}')
+            sql_seconds.append(f'pustakalay_sql_duration_seconds_total{{{labels}}} {metrics.sql_seconds}')
+            for route, count in sorted(metrics.routes.items()):
+                routes.append(f'pustakalay_db_route_requests_total{{{labels},route="{route}"}} {count}')
+
+    return '\n'.join(requests_total + latency + statements + sql_total + sql_seconds + routes) + '\n'
+
+def reset_metrics():
+    with _lock:
+        _endpoints.clear()
+
+def metrics_endpoint():
+    # Prometheus scrapers cannot log in, so the endpoint takes an optional static token instead of a JWT
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            return jsonify({'error': 'Invalid metrics token'}), 401
+
+    return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+def init_metrics(app):
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+
+    app.before_request(_start_request)
+    app.after_request(_remember_status)
+    app.teardown_request(_finish_request)
+
+    # Production never serves metrics without a token; slow request logging still works
+    if app.config.get('METRICS_REQUIRE_TOKEN') and not app.config.get('METRICS_TOKEN'):
+        logger.warning('METRICS_TOKEN is not set, so /api/metrics is disabled')
+        return
+    app.add_url_rule('/api/metrics', 'metrics', metrics_endpoint)
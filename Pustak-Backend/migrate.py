@@ -0,0 +1,31 @@
+import argparse
+from app import create_app
+from database import db
+from migrations import MIGRATIONS, applied_versions, upgrade
+
+# Bring an existing database up to the current schema.
+#
+#   python migrate.py            # create missing tables, apply pending migrations
+#   python migrate.py --status   # show which migrations have been applied
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Apply database schema migrations')
+    parser.add_argument('--status', action='store_true', help='list migrations without applying them')
+    args = parser.parse_args()
+    
+    app = create_app()
+    
+    with app.app_context():
+        if args.status:
+            done = applied_versions()
+            for version, name, _ in MIGRATIONS:
+                print(f"[{'x' if version in done else ' '}] {version}: {name}")
+            exit()
+        
+        db.create_all(bind_key=None)
+        applied = upgrade()
+        
+        if not applied:
+            print("Database is up to date!")
+        for version, name in applied:
+            print(f"Applied migration {version}: {name}")
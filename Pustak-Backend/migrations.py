@@ -0,0 +1,146 @@
+from datetime import datetime
+from sqlalchemy import inspect, text
+from database import db
+
+# Versioned schema migrations.
+#
+# db.create_all() creates missing tables (with the indexes declared on the
+# models) but never alters a table that already exists. Every change to an
+# existing table is therefore recorded here as a numbered migration, and
+# upgrade() applies the ones a database has not seen yet, recording each in
+# schema_migrations. Migrations are written to be idempotent so they are
+# also safe on a fresh database that create_all() has already built.
+#
+#   python migrate.py            # apply pending migrations
+#   python migrate.py --status   # list applied and pending migrations
+
+def _columns(conn, table):
+    return {column['name'] for column in inspect(conn).get_columns(table)}
+
+def _add_column(conn, table, column, ddl):
+    if column not in _columns(conn, table):
+        conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+
+def _create_index(conn, name, table, columns, unique=False):
+    existing = {index['name'] for index in inspect(conn).get_indexes(table)}
+    if name not in existing:
+        kind = 'UNIQUE INDEX' if unique else 'INDEX'
+        conn.execute(text(f'CREATE {kind} {name} ON "{table}" ({", ".join(columns)})'))
+
+def add_user_token_version(conn):
+    _add_column(conn, 'user', 'token_version', 'INTEGER NOT NULL DEFAULT 0')
+
+def widen_password_hash(conn):
+    # SQLite does not enforce VARCHAR lengths
+    dialect = conn.dialect.name
+    if dialect == 'postgresql':
+        conn.execute(text('ALTER TABLE "user" ALTER COLUMN password_hash TYPE VARCHAR(255)'))
+    elif dialect in ('mysql', 'mariadb'):
+        conn.execute(text('ALTER TABLE user MODIFY password_hash VARCHAR(255)'))
+
+def add_query_pattern_indexes(conn):
+    _create_index(conn, 'ix_book_title_author', 'book', ['title', 'author'])
+    _create_index(conn, 'ix_donated_book_book_available', 'donated_book', ['book_id', 'is_available'])
+    _create_index(conn, 'ix_donated_book_donor_available', 'donated_book', ['donor_id', 'is_available'])
+    _create_index(conn, 'ix_borrowed_book_borrower_active', 'borrowed_book', ['borrower_id', 'is_returned', 'due_date'])
+    _create_index(conn, 'ix_borrowed_book_book_active', 'borrowed_book', ['book_id', 'is_returned'])
+    _create_index(conn, 'ix_borrowed_book_returned_due', 'borrowed_book', ['is_returned', 'due_date'])
+
+    # Give the SQLite planner statistics for the new indexes
+    if conn.dialect.name == 'sqlite':
+        conn.execute(text('ANALYZE'))
+
+def add_borrowing_overdue_flag(conn):
+    # Existing overdue borrowings are flagged by overdue.mark_overdue() at startup
+    _add_column(conn, 'borrowed_book', 'is_overdue', 'BOOLEAN NOT NULL DEFAULT FALSE')
+    _create_index(conn, 'ix_borrowed_book_overdue', 'borrowed_book', ['is_overdue', 'borrower_id'])
+
+def add_copy_barcodes(conn):
+    from barcodes import assign_missing
+
+    _add_column(conn, 'donated_book', 'barcode', 'VARCHAR(32)')
+    assign_missing(conn)
+    _create_index(conn, 'ix_donated_book_barcode', 'donated_book', ['barcode'], unique=True)
+
+def add_book_search_keys(conn, batch_size=5000):
+    from fuzzy import search_keys
+
+    _add_column(conn, 'book', 'search_key', 'TEXT')
+    _add_column(conn, 'book', 'search_latin', 'TEXT')
+
+    # The trigram index is built from these by fuzzy.ensure_fuzzy_index() at startup
+    last_id = 0
+    while True:
+        rows = conn.execute(text(
+            'SELECT id, title, author FROM book WHERE id > :last_id AND search_key IS NULL ORDER BY id LIMIT :size'
+        ), {'last_id': last_id, 'size': batch_size}).all()
+        if not rows:
+            return
+
+        conn.execute(
+            text('UPDATE book SET search_key = :search_key, search_latin = :search_latin WHERE id = :book_id'),
+            [{'book_id': book_id, **search_keys(title, author)} for book_id, title, author in rows]
+        )
+        last_id = rows[-1][0]
+
+def add_book_cover_id(conn):
+    _add_column(conn, 'book', 'cover_id', 'VARCHAR(64)')
+
+def add_book_identity_keys(conn):
+    from isbn import normalize_existing_books
+
+    _add_column(conn, 'book', 'isbn_key', 'VARCHAR(13)')
+    _add_column(conn, 'book', 'title_author_key', 'VARCHAR(320)')
+    # Compact ISBNs, empty ones to NULL, and keys for every book; the unique
+    # index goes on once duplicates have been left without a key
+    normalize_existing_books(conn)
+    _create_index(conn, 'ix_book_isbn_key', 'book', ['isbn_key'], unique=True)
+    _create_index(conn, 'ix_book_title_author_key', 'book', ['title_author_key'])
+
+# (version, name, function) - append only, never renumber
+MIGRATIONS = [
+    (1, 'add user.token_version', add_user_token_version),
+    (2, 'widen user.password_hash', widen_password_hash),
+    (3, 'add indexes for query patterns', add_query_pattern_indexes),
+    (4, 'add borrowed_book.is_overdue', add_borrowing_overdue_flag),
+    (5, 'add donated_book.barcode', add_copy_barcodes),
+    (6, 'add book search keys', add_book_search_keys),
+    (7, 'add book.cover_id', add_book_cover_id),
+    (8, 'add book identity keys', add_book_identity_keys),
+]
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'version INTEGER PRIMARY KEY, '
+        'name VARCHAR(200) NOT NULL, '
+        'applied_at DATETIME NOT NULL)'
+    ))
+
+def applied_versions():
+    with db.engine.begin() as conn:
+        _ensure_version_table(conn)
+        return {row[0] for row in conn.execute(text('SELECT version FROM schema_migrations'))}
+
+def pending_migrations():
+    done = applied_versions()
+    return [(version, name) for version, name, _ in MIGRATIONS if version not in done]
+
+def upgrade():
+    done = applied_versions()
+    applied = []
+
+    for version, name, migrate in MIGRATIONS:
+        if version in done:
+            continue
+
+        # Each migration commits together with its version record
+        with db.engine.begin() as conn:
+            migrate(conn)
+            conn.execute(
+                text('INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)'),
+                {'version': version, 'name': name, 'applied_at': datetime.utcnow()}
+            )
+        applied.append((version, name))
+
+    return applied
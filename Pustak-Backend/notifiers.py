@@ -0,0 +1,112 @@
+import json
+import os
+import smtplib
+import ssl
+import threading
+from datetime import datetime
+from email.message import EmailMessage
+from werkzeug.utils import import_string
+
+# Delivery backends for borrower reminders (see overdue.py).
+#
+# NOTIFIER selects one:
+#   file  - append each message as a JSON line to REMINDER_FILE (default:
+#           instance/reminders.ndjson); for development and tests
+#   smtp  - send email through SMTP_HOST, one connection per batch; point
+#           it at a local catcher such as MailHog while testing
+#   module:Class - any class taking the app config, with send_batch()
+#
+# send_batch(messages) returns one entry per message: None when it was
+# delivered, or an error string so that reminder is retried later.
+
+class Notifier:
+    def send_batch(self, messages):
+        raise NotImplementedError
+
+class FileNotifier(Notifier):
+    _lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+
+    def send_batch(self, messages):
+        lines = [
+            json.dumps(dict(message, sent_at=datetime.utcnow().isoformat()), ensure_ascii=False) + '\n'
+            for message in messages
+        ]
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as sink:
+                sink.writelines(lines)
+        return [None] * len(messages)
+
+class SMTPNotifier(Notifier):
+    def __init__(self, host, port=25, username=None, password=None, sender='library@pustakalay.com',
+                 use_tls=False, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender
+        self.use_tls = use_tls
+        self.timeout = timeout
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            host=config.get('SMTP_HOST', 'localhost'),
+            port=config.get('SMTP_PORT', 25),
+            username=config.get('SMTP_USERNAME'),
+            password=config.get('SMTP_PASSWORD'),
+            sender=config.get('SMTP_SENDER', 'library@pustakalay.com'),
+            use_tls=config.get('SMTP_USE_TLS', False)
+        )
+
+    def _email(self, message):
+        email = EmailMessage()
+        email['From'] = self.sender
+        email['To'] = message['to']
+        email['Subject'] = message['subject']
+        email.set_content(message['body'])
+        return email
+
+    def send_batch(self, messages):
+        try:
+            connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        except (OSError, smtplib.SMTPException) as e:
+            return [f'SMTP connection failed: {e}'] * len(messages)
+
+        results = []
+        try:
+            if self.use_tls:
+                connection.starttls(context=ssl.create_default_context())
+            if self.username:
+                connection.login(self.username, self.password)
+
+            for message in messages:
+                try:
+                    connection.send_message(self._email(message))
+                    results.append(None)
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError, smtplib.SMTPSenderRefused) as e:
+                    results.append(str(e))
+        except (OSError, smtplib.SMTPException) as e:
+            # The connection broke; whatever was not sent yet is retried next time
+            results += [str(e)] * (len(messages) - len(results))
+        finally:
+            try:
+                connection.quit()
+            except (OSError, smtplib.SMTPException):
+                connection.close()
+
+        return results
+
+def get_notifier(app):
+    name = app.config.get('NOTIFIER', 'file')
+
+    if name == 'file':
+        path = app.config.get('REMINDER_FILE') or os.path.join(app.instance_path, 'reminders.ndjson')
+        return FileNotifier(path)
+    if name == 'smtp':
+        return SMTPNotifier.from_config(app.config)
+
+    return import_string(name.replace(':', '.'))(app.config)
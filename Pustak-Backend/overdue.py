@@ -0,0 +1,155 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import update, select, insert, and_, exists, literal
+from database import db, User, Book, BorrowedBook, Reminder
+import stats
+
+# Background overdue engine, run by the scheduler every OVERDUE_SCAN_INTERVAL
+# seconds (and mark_overdue() once at startup):
+#
+# 1. mark_overdue() flags active borrowings past their due date with one bulk
+#    UPDATE, so routes filter on the indexed is_overdue column instead of
+#    comparing due dates against the clock. Returning a book clears the flag
+#    (stats.record_return), and the overdue counter moves with the flag.
+# 2. queue_reminders() inserts at most one 'due_soon' (due within
+#    REMINDER_DUE_SOON_HOURS) and one 'overdue' reminder per borrowing; the
+#    unique (borrowing_id, kind) constraint backs the NOT EXISTS check.
+# 3. dispatch_reminders() sends pending reminders through the configured
+#    notifier (notifiers.py) in batches of REMINDER_BATCH_SIZE, committing
+#    after each batch. Failed sends are retried on later cycles until
+#    REMINDER_MAX_ATTEMPTS.
+
+SUBJECTS = {
+    'due_soon': 'Reminder: "{title}" is due on {due}',
+    'overdue': 'Overdue: please return "{title}"',
+}
+
+BODIES = {
+    'due_soon': ('Hello {username},\n\nThe book "{title}" you borrowed from Pustakalay is due on {due}. '
+                 'Please return it on time so other readers can borrow it.\n'),
+    'overdue': ('Hello {username},\n\nThe book "{title}" you borrowed from Pustakalay was due on {due} '
+                'and is now overdue. Please return it as soon as possible; you cannot borrow other '
+                'books until it is returned.\n'),
+}
+
+def mark_overdue(now=None):
+    now = now or datetime.utcnow()
+
+    result = db.session.execute(
+        update(BorrowedBook).where(
+            BorrowedBook.is_returned == False,
+            BorrowedBook.is_overdue == False,
+            BorrowedBook.due_date < now
+        ).values(is_overdue=True),
+        execution_options={'synchronize_session': False}
+    )
+    stats.bump(overdue_borrowings=result.rowcount)
+    db.session.commit()
+
+    return result.rowcount
+
+def _queue(kind, condition, now):
+    pending = exists().where(
+        Reminder.borrowing_id == BorrowedBook.id,
+        Reminder.kind == kind
+    )
+    rows = select(
+        BorrowedBook.id, BorrowedBook.borrower_id, literal(kind), literal(now), literal(0)
+    ).where(BorrowedBook.is_returned == False, condition, ~pending)
+
+    result = db.session.execute(
+        insert(Reminder).from_select(['borrowing_id', 'user_id', 'kind', 'created_at', 'attempts'], rows)
+    )
+    return result.rowcount
+
+def queue_reminders(now=None):
+    now = now or datetime.utcnow()
+    due_soon_hours = current_app.config.get('REMINDER_DUE_SOON_HOURS', 48)
+
+    queued = {
+        'due_soon': _queue('due_soon', and_(
+            BorrowedBook.is_overdue == False,
+            BorrowedBook.due_date >= now,
+            BorrowedBook.due_date < now + timedelta(hours=due_soon_hours)
+        ), now) if due_soon_hours else 0,
+        'overdue': _queue('overdue', BorrowedBook.is_overdue == True, now),
+    }
+    db.session.commit()
+
+    return queued
+
+def _message(row):
+    fields = {'username': row.username, 'title': row.title, 'due': row.due_date.strftime('%d %b %Y')}
+    return {
+        'reminder_id': row.id,
+        'kind': row.kind,
+        'to': row.email,
+        'subject': SUBJECTS[row.kind].format(**fields),
+        'body': BODIES[row.kind].format(**fields),
+    }
+
+def dispatch_reminders(notifier=None):
+    from notifiers import get_notifier
+
+    notifier = notifier or get_notifier(current_app)
+    batch_size = current_app.config.get('REMINDER_BATCH_SIZE', 100)
+    max_attempts = current_app.config.get('REMINDER_MAX_ATTEMPTS', 5)
+
+    sent = failed = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(
+                Reminder.id, Reminder.kind, BorrowedBook.is_returned, BorrowedBook.due_date,
+                User.username, User.email, Book.title
+            ).join(BorrowedBook, BorrowedBook.id == Reminder.borrowing_id)
+            .join(User, User.id == Reminder.user_id)
+            .join(Book, Book.id == BorrowedBook.book_id)
+            .where(Reminder.sent_at.is_(None), Reminder.attempts < max_attempts, Reminder.id > last_id)
+            .order_by(Reminder.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        now = datetime.utcnow()
+        # Books returned since the reminder was queued need no notice
+        returned = [row.id for row in rows if row.is_returned]
+        outgoing = [row for row in rows if not row.is_returned]
+
+        errors = notifier.send_batch([_message(row) for row in outgoing]) if outgoing else []
+        delivered = [row.id for row, error in zip(outgoing, errors) if error is None]
+
+        if returned:
+            db.session.execute(
+                update(Reminder).where(Reminder.id.in_(returned))
+                .values(sent_at=now, last_error='returned before sending'),
+                execution_options={'synchronize_session': False}
+            )
+        if delivered:
+            db.session.execute(
+                update(Reminder).where(Reminder.id.in_(delivered)).values(sent_at=now),
+                execution_options={'synchronize_session': False}
+            )
+        for row, error in zip(outgoing, errors):
+            if error is not None:
+                db.session.execute(
+                    update(Reminder).where(Reminder.id == row.id)
+                    .values(attempts=Reminder.attempts + 1, last_error=str(error)[:1000]),
+                    execution_options={'synchronize_session': False}
+                )
+        db.session.commit()
+
+        sent += len(delivered)
+        failed += len(outgoing) - len(delivered)
+
+    return {'sent': sent, 'failed': failed}
+
+def run_overdue_cycle():
+    now = datetime.utcnow()
+    marked = mark_overdue(now)
+    queued = queue_reminders(now)
+    dispatched = dispatch_reminders()
+
+    return {'marked_overdue': marked, 'queued': queued, **dispatched}
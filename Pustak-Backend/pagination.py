@@ -0,0 +1,127 @@
+import base64
+import binascii
+import json
+from flask import request
+
+# Shared pagination for list endpoints.
+#
+# Offset mode (default): ?page=N&per_page=M, same response fields as before,
+# but always ordered by a stable key so pages do not shift under inserts.
+#
+# Cursor mode (opt-in): ?cursor= for the first page, then ?cursor=<next_cursor>.
+# Pages are fetched with a keyset condition (key > last key) on an indexed
+# column, so every page costs the same no matter how deep it is. The total is
+# only counted when ?include_total=true is passed.
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(payload):
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise InvalidCursor('Invalid cursor')
+
+    if not isinstance(payload, dict):
+        raise InvalidCursor('Invalid cursor')
+
+    return payload
+
+class Page:
+    def __init__(self, items, per_page, page=None, total=None, pages=None,
+                 has_next=False, has_prev=False, next_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.page = page
+        self.total = total
+        self.pages = pages
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.next_cursor = next_cursor
+
+    def meta(self):
+        return {
+            'total': self.total,
+            'pages': self.pages,
+            'current_page': self.page,
+            'per_page': self.per_page,
+            'has_next': self.has_next,
+            'has_prev': self.has_prev,
+            'next_cursor': self.next_cursor
+        }
+
+def _key_of(item, key_column):
+    return getattr(item, key_column.key)
+
+def paginate(query, key_column=None):
+    # key_column must be unique and indexed (normally the primary key).
+    # Queries that are already ordered (e.g. by search relevance) pass None
+    # and get an opaque offset cursor instead of a keyset one.
+    per_page = max(request.args.get('per_page', 10, type=int), 1)
+    cursor = request.args.get('cursor')
+
+    if key_column is not None:
+        query = query.order_by(key_column)
+
+    if cursor is None:
+        page = max(request.args.get('page', 1, type=int), 1)
+        result = query.paginate(page=page, per_page=per_page, error_out=False)
+
+        next_cursor = None
+        if result.has_next and result.items:
+            if key_column is not None:
+                next_cursor = encode_cursor({'k': _key_of(result.items[-1], key_column)})
+            else:
+                next_cursor = encode_cursor({'o': page * per_page})
+
+        return Page(
+            result.items, per_page,
+            page=page,
+            total=result.total,
+            pages=result.pages,
+            has_next=result.has_next,
+            has_prev=result.has_prev,
+            next_cursor=next_cursor
+        )
+
+    payload = decode_cursor(cursor) if cursor else {}
+    include_total = request.args.get('include_total', 'false').lower() == 'true'
+    total = query.order_by(None).count() if include_total else None
+
+    # Fetch one extra row to learn whether another page exists without counting
+    if key_column is not None:
+        last_key = payload.get('k')
+        if last_key is not None:
+            if not isinstance(last_key, (int, str)):
+                raise InvalidCursor('Invalid cursor')
+            query = query.filter(key_column > last_key)
+        rows = query.limit(per_page + 1).all()
+    else:
+        offset = payload.get('o', 0)
+        if not isinstance(offset, int) or offset < 0:
+            raise InvalidCursor('Invalid cursor')
+        rows = query.offset(offset).limit(per_page + 1).all()
+
+    items = rows[:per_page]
+    has_next = len(rows) > per_page
+
+    next_cursor = None
+    if has_next:
+        if key_column is not None:
+            next_cursor = encode_cursor({'k': _key_of(items[-1], key_column)})
+        else:
+            next_cursor = encode_cursor({'o': offset + per_page})
+
+    return Page(
+        items, per_page,
+        total=total,
+        pages=None,
+        has_next=has_next,
+        has_prev=bool(payload),
+        next_cursor=next_cursor
+    )
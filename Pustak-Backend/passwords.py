@@ -0,0 +1,102 @@
+import base64
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+from flask import current_app, has_app_context
+from werkzeug.security import check_password_hash
+
+# Password hashing off the request thread.
+#
+# Hashes are bcrypt with a configurable work factor (PASSWORD_HASH_ROUNDS).
+# The hashing runs in a bounded process pool (PASSWORD_HASH_WORKERS
+# processes), so a burst of logins can occupy at most that many cores and
+# the remaining CPU stays free for other requests. Setting the worker count
+# to 0 hashes inline, which is handy for scripts.
+#
+# Hashes created by werkzeug (pbkdf2/scrypt) still verify, and
+# needs_rehash() reports them so login can upgrade them to bcrypt.
+
+DEFAULT_ROUNDS = 12
+DEFAULT_WORKERS = 2
+BCRYPT_PREFIXES = ('$2a$', '$2b$', '$2y$')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _setting(name, default):
+    if has_app_context():
+        return current_app.config.get(name, default)
+    return default
+
+def _prehash(password):
+    # bcrypt only reads the first 72 bytes; pre-hashing keeps long passphrases significant
+    digest = hashlib.sha256(password.encode('utf-8')).digest()
+    return base64.b64encode(digest)
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(_prehash(password), bcrypt.gensalt(rounds)).decode('ascii')
+
+def _verify(password_hash, password):
+    if password_hash.startswith(BCRYPT_PREFIXES):
+        return bcrypt.checkpw(_prehash(password), password_hash.encode('ascii'))
+    return check_password_hash(password_hash, password)
+
+def _get_pool(workers):
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a multi-threaded server process is not safe
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+def _reset_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def _run(func, *args):
+    workers = _setting('PASSWORD_HASH_WORKERS', DEFAULT_WORKERS)
+    if not workers:
+        return func(*args)
+
+    try:
+        return _get_pool(workers).submit(func, *args).result()
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed); start a fresh pool next time
+        _reset_pool()
+        return func(*args)
+
+def hash_password(password):
+    return _run(_hash, password, _setting('PASSWORD_HASH_ROUNDS', DEFAULT_ROUNDS))
+
+def verify_password(password_hash, password):
+    if not password_hash:
+        return False
+    return _run(_verify, password_hash, password)
+
+def needs_rehash(password_hash):
+    if not password_hash or not password_hash.startswith(BCRYPT_PREFIXES):
+        return True
+
+    rounds = int(password_hash.split('$')[2])
+    return rounds < _setting('PASSWORD_HASH_ROUNDS', DEFAULT_ROUNDS)
+
+def warm_up():
+    # Start the worker processes before the first login rather than during it
+    workers = _setting('PASSWORD_HASH_WORKERS', DEFAULT_WORKERS)
+    if workers:
+        pool = _get_pool(workers)
+        for future in [pool.submit(os.getpid) for _ in range(workers)]:
+            future.result()
@@ -0,0 +1,86 @@
+from contextlib import contextmanager
+from flask import g, request, current_app, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql import Select, CompoundSelect
+
+# Read/write routing to an optional read replica.
+#
+# With DATABASE_REPLICA_URL set, the app gets a second engine (the 'replica'
+# bind) and db.session routes each statement:
+#
+#   - GET and HEAD requests read from the replica: catalog pages, donation
+#     feeds, exports and the serializers they call.
+#   - Everything else uses the primary, as do statements outside a request
+#     (startup, background jobs, scripts).
+#   - A GET view that shows the reader their own recent changes is marked
+#     @reads_own_writes and stays on the primary, since the replica may lag.
+#   - A write during a replica request (a flush, INSERT/UPDATE/DELETE or a
+#     SELECT ... FOR UPDATE) goes to the primary, and the rest of that
+#     request then reads from the primary too.
+#
+# Which engines each request used is recorded per endpoint in /api/metrics.
+# Without a replica URL nothing changes: there is only the primary.
+
+REPLICA = 'replica'
+PRIMARY = 'primary'
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context() and 'db_route' in g:
+            if self._flushing or _is_write(clause):
+                # Later reads in this request must see the write
+                g.db_route = PRIMARY
+                g.db_wrote = True
+            elif g.db_route == REPLICA and clause is not None:
+                g.db_binds.add(REPLICA)
+                return self._db.engines[REPLICA]
+            g.db_binds.add(PRIMARY)
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def _is_write(clause):
+    # Anything but a plain SELECT counts, raw SQL included
+    if clause is None:
+        return False
+    return not isinstance(clause, (Select, CompoundSelect)) or clause._for_update_arg is not None
+
+def reads_own_writes(view):
+    # GET views whose data the caller may have just changed read from the primary
+    view.reads_own_writes = True
+    return view
+
+@contextmanager
+def on_primary():
+    # Run a block of reads against the primary, whatever the request's route
+    if not has_request_context() or 'db_route' not in g:
+        yield
+        return
+
+    route = g.db_route
+    g.db_route = PRIMARY
+    try:
+        yield
+    finally:
+        if not g.db_wrote:
+            g.db_route = route
+
+def _choose_route():
+    view = current_app.view_functions.get(request.endpoint)
+    reads = request.method in ('GET', 'HEAD') and not getattr(view, 'reads_own_writes', False)
+    g.db_route = REPLICA if reads and current_app.config.get('DATABASE_REPLICA_URL') else PRIMARY
+    g.db_binds = set()
+    g.db_wrote = False
+
+def request_route():
+    # Engines the current request used: replica, primary, both or none
+    binds = g.get('db_binds') or set()
+    if len(binds) == 2:
+        return 'both'
+    return next(iter(binds), 'none')
+
+def init_replica(app):
+    # Before db.init_app(), which creates the engines
+    url = app.config.get('DATABASE_REPLICA_URL')
+    if url:
+        app.config.setdefault('SQLALCHEMY_BINDS', {})[REPLICA] = url
+    app.before_request(_choose_route)
@@ -1,6 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from database import db, User, Book, DonatedBook, BorrowedBook
+from database import db, User, Book, DonatedBook, BorrowedBook, Hold
+from serializers import serialize_borrowings
+from pagination import paginate, InvalidCursor
+from stats import get_stats, record_return
+from holds import release_copy, set_priority, hold_details
+from identity import is_admin, bump_token_version
+from replica import reads_own_writes
+from exports import build_export_query, stream_ndjson, stream_csv, FORMATS
 from datetime import datetime
 
 admin_bp = Blueprint('admin', __name__)
@@ -9,32 +16,12 @@ admin_bp = Blueprint('admin', __name__)
 @jwt_required()
 def admin_dashboard():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user.is_admin:
+        if not is_admin():
             return jsonify({'error': 'Admin access required'}), 403
         
-        # Get statistics
-        total_users = User.query.count()
-        total_books = Book.query.count()
-        total_donations = DonatedBook.query.count()
-        total_borrowings = BorrowedBook.query.count()
-        active_borrowings = BorrowedBook.query.filter_by(is_returned=False).count()
-        overdue_borrowings = BorrowedBook.query.filter(
-            BorrowedBook.is_returned == False,
-            BorrowedBook.due_date < datetime.utcnow()
-        ).count()
-        
+        # Single-row read of the maintained counters (see stats.py)
         return jsonify({
-            'stats': {
-                'total_users': total_users,
-                'total_books': total_books,
-                'total_donations': total_donations,
-                'total_borrowings': total_borrowings,
-                'active_borrowings': active_borrowings,
-                'overdue_borrowings': overdue_borrowings
-            }
+            'stats': get_stats()
         }), 200
         
     except Exception as e:
@@ -42,33 +29,21 @@ def admin_dashboard():
 
 @admin_bp.route('/users', methods=['GET'])
 @jwt_required()
+@reads_own_writes
 def get_all_users():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user.is_admin:
+        if not is_admin():
             return jsonify({'error': 'Admin access required'}), 403
         
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
-        
-        users = User.query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
+        users = paginate(User.query, User.id)
         
         return jsonify({
             'users': [user.to_dict() for user in users.items],
-            'total': users.total,
-            'pages': users.pages,
-            'current_page': page,
-            'per_page': per_page,
-            'has_next': users.has_next,
-            'has_prev': users.has_prev
+            **users.meta()
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -76,10 +51,7 @@ def get_all_users():
 @jwt_required()
 def make_admin(user_id):
     try:
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
-        
-        if not current_user.is_admin:
+        if not is_admin():
             return jsonify({'error': 'Admin access required'}), 403
         
         target_user = User.query.get(user_id)
@@ -88,6 +60,7 @@ def make_admin(user_id):
             return jsonify({'error': 'User not found'}), 404
         
         target_user.is_admin = True
+        bump_token_version(target_user)
         db.session.commit()
         
         return jsonify({
@@ -102,9 +75,8 @@ def make_admin(user_id):
 def remove_admin(user_id):
     try:
         current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
         
-        if not current_user.is_admin:
+        if not is_admin():
             return jsonify({'error': 'Admin access required'}), 403
         
         if current_user_id == user_id:
@@ -116,6 +88,7 @@ def remove_admin(user_id):
             return jsonify({'error': 'User not found'}), 404
         
         target_user.is_admin = False
+        bump_token_version(target_user)
         db.session.commit()
         
         return jsonify({
@@ -127,16 +100,12 @@ def remove_admin(user_id):
 
 @admin_bp.route('/borrowings', methods=['GET'])
 @jwt_required()
+@reads_own_writes
 def get_all_borrowings():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user.is_admin:
+        if not is_admin():
             return jsonify({'error': 'Admin access required'}), 403
         
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
         status = request.args.get('status', 'all')  # all, active, returned, overdue
         
         query = BorrowedBook.query
@@ -146,27 +115,17 @@ def get_all_borrowings():
         elif status == 'returned':
             query = query.filter_by(is_returned=True)
         elif status == 'overdue':
-            query = query.filter(
-                BorrowedBook.is_returned == False,
-                BorrowedBook.due_date < datetime.utcnow()
-            )
+            query = query.filter_by(is_returned=False, is_overdue=True)
         
-        borrowings = query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
+        borrowings = paginate(query, BorrowedBook.id)
         
         return jsonify({
-            'borrowings': [borrowing.to_dict() for borrowing in borrowings.items],
-            'total': borrowings.total,
-            'pages': borrowings.pages,
-            'current_page': page,
-            'per_page': per_page,
-            'has_next': borrowings.has_next,
-            'has_prev': borrowings.has_prev
+            'borrowings': serialize_borrowings(borrowings.items),
+            **borrowings.meta()
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -174,10 +133,7 @@ def get_all_borrowings():
 @jwt_required()
 def force_return_book(borrowing_id):
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user.is_admin:
+        if not is_admin():
             return jsonify({'error': 'Admin access required'}), 403
         
         borrowing = BorrowedBook.query.get(borrowing_id)
@@ -192,11 +148,12 @@ def force_return_book(borrowing_id):
         borrowing.is_returned = True
         borrowing.returned_at = datetime.utcnow()
         
-        # Make the donated copy available again
+        # Pass the donated copy to the next holder or make it available again
         donated_copy = DonatedBook.query.get(borrowing.donated_book_id)
         if donated_copy:
-            donated_copy.is_available = True
+            release_copy(donated_copy)
         
+        record_return(borrowing)
         db.session.commit()
         
         return jsonify({
@@ -206,3 +163,106 @@ def force_return_book(borrowing_id):
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/books/<int:book_id>/holds', methods=['GET'])
+@jwt_required()
+@reads_own_writes
+def get_book_holds(book_id):
+    try:
+        if not is_admin():
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        if not Book.query.get(book_id):
+            return jsonify({'error': 'Book not found'}), 404
+        
+        rows = db.session.query(Hold, User.username).join(User, User.id == Hold.user_id).filter(
+            Hold.book_id == book_id,
+            Hold.status.in_(('waiting', 'ready'))
+        ).order_by(Hold.status, Hold.priority.desc(), Hold.id).all()
+        
+        queue, ready = [], []
+        for hold, username in rows:
+            data = hold.to_dict()
+            data['username'] = username
+            if hold.status == 'waiting':
+                data['position'] = len(queue) + 1
+                queue.append(data)
+            else:
+                ready.append(data)
+        
+        return jsonify({'queue': queue, 'ready': ready}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/holds/<int:hold_id>', methods=['PUT'])
+@jwt_required()
+def update_hold(hold_id):
+    try:
+        if not is_admin():
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        hold = Hold.query.get(hold_id)
+        
+        if not hold:
+            return jsonify({'error': 'Hold not found'}), 404
+        
+        if hold.status != 'waiting':
+            return jsonify({'error': 'Only waiting holds can be reprioritised'}), 400
+        
+        data = request.get_json() or {}
+        priority = data.get('priority')
+        
+        if not isinstance(priority, int) or isinstance(priority, bool):
+            return jsonify({'error': 'priority must be an integer'}), 400
+        
+        set_priority(hold, priority)
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Hold updated successfully',
+            'hold': hold_details(hold)
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/export/<dataset>', methods=['GET'])
+@jwt_required()
+def export_data(dataset):
+    try:
+        if not is_admin():
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in FORMATS:
+            return jsonify({'error': f"Invalid format, expected one of: {', '.join(FORMATS)}"}), 400
+        
+        # dataset: books, donations, borrowings; from/to filter on the creation date
+        try:
+            query = build_export_query(
+                dataset,
+                status=request.args.get('status'),
+                date_from=request.args.get('from'),
+                date_to=request.args.get('to')
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if export_format == 'csv':
+            body, mimetype = stream_csv(query), 'text/csv'
+        else:
+            body, mimetype = stream_ndjson(query), 'application/x-ndjson'
+        
+        filename = f"{dataset}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{export_format}"
+        
+        # Rows are written as they are read, so the response has no Content-Length
+        return Response(
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
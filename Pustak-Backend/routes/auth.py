@@ -1,6 +1,9 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, create_access_token, get_jwt_identity
+from flask_jwt_extended import jwt_required, create_access_token
 from database import db, User
+from identity import current_user, token_claims
+from replica import reads_own_writes
+import stats
 import re
 
 auth_bp = Blueprint('auth', __name__)
@@ -57,10 +60,11 @@ def register():
         user.set_password(password)
         
         db.session.add(user)
+        stats.bump(total_users=1)
         db.session.commit()
         
-        # Create access token
-        access_token = create_access_token(identity=user.id)
+        # Create access token (role claims let routes skip the user lookup)
+        access_token = create_access_token(identity=user.id, additional_claims=token_claims(user))
         
         return jsonify({
             'message': 'User registered successfully',
@@ -94,8 +98,13 @@ def login():
         if not user or not user.check_password(password):
             return jsonify({'error': 'Invalid credentials'}), 401
         
-        # Create access token
-        access_token = create_access_token(identity=user.id)
+        # Upgrade legacy or weaker hashes while we have the plaintext
+        if user.password_needs_rehash():
+            user.set_password(password)
+            db.session.commit()
+        
+        # Create access token (role claims let routes skip the user lookup)
+        access_token = create_access_token(identity=user.id, additional_claims=token_claims(user))
         
         return jsonify({
             'message': 'Login successful',
@@ -108,10 +117,10 @@ def login():
 
 @auth_bp.route('/profile', methods=['GET'])
 @jwt_required()
+@reads_own_writes
 def get_profile():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
@@ -127,8 +136,7 @@ def get_profile():
 @jwt_required()
 def update_profile():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
@@ -184,8 +192,7 @@ def update_profile():
 @jwt_required()
 def change_password():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
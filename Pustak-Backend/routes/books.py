@@ -1,31 +1,38 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from database import db, Book, DonatedBook, BorrowedBook, User
-from datetime import datetime, timedelta
-from sqlalchemy import or_
+from database import db, Book, DonatedBook, BorrowedBook, User, Hold, HoldQueue
+from serializers import serialize_books, serialize_borrowings, serialize_donations
+from search import apply_search
+from fuzzy import apply_fuzzy
+from suggest import suggest, KINDS
+from pagination import paginate, InvalidCursor
+import stats
+from circulation import claim_available_copy, LOAN_PERIOD
+import holds
+from identity import is_admin
+from replica import reads_own_writes
+from http_cache import cached_catalog_response
+from isbn import find_book, isbn_taken, normalize_isbn
+from covers import save_cover, queue_thumbnails, cover_url, thumbnail_urls, InvalidCover
+from datetime import datetime
+from sqlalchemy.exc import OperationalError
+from werkzeug.exceptions import RequestEntityTooLarge
 
 books_bp = Blueprint('books', __name__)
 
 @books_bp.route('/', methods=['GET'])
+@cached_catalog_response
 def get_books():
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
         search = request.args.get('search', '').strip()
         category = request.args.get('category', '').strip()
         available_only = request.args.get('available_only', 'false').lower() == 'true'
         
-        query = Book.query
+        fuzzy = request.args.get('fuzzy', 'auto').lower()
+        if fuzzy not in ('auto', 'true', 'false'):
+            return jsonify({'error': 'fuzzy must be auto, true or false'}), 400
         
-        # Search filter
-        if search:
-            query = query.filter(
-                or_(
-                    Book.title.ilike(f'%{search}%'),
-                    Book.author.ilike(f'%{search}%'),
-                    Book.isbn.ilike(f'%{search}%')
-                )
-            )
+        query = Book.query
         
         # Category filter
         if category:
@@ -35,27 +42,53 @@ def get_books():
         if available_only:
             query = query.filter(Book.is_available == True)
         
-        # Pagination
-        books = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
+        # Search filter (full-text index, ranked by relevance); when no word
+        # matches, fall back to typo-tolerant matching ranked by similarity
+        matched_fuzzy = False
+        if search:
+            exact = apply_search(query, search)
+            if fuzzy == 'true' or (fuzzy == 'auto' and exact.with_entities(Book.id).first() is None):
+                fuzzy_query = apply_fuzzy(query, search)
+                matched_fuzzy = fuzzy_query is not None
+            query = fuzzy_query if matched_fuzzy else exact
+        
+        # Pagination (search results keep their relevance order)
+        books = paginate(query, None if search else Book.id)
         
         return jsonify({
-            'books': [book.to_dict() for book in books.items],
-            'total': books.total,
-            'pages': books.pages,
-            'current_page': page,
-            'per_page': per_page,
-            'has_next': books.has_next,
-            'has_prev': books.has_prev
+            'books': serialize_books(books.items),
+            'fuzzy': matched_fuzzy,
+            **books.meta()
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@books_bp.route('/suggest', methods=['GET'])
+def suggest_books():
+    try:
+        query = request.args.get('q', '').strip()
+        max_results = current_app.config.get('SUGGEST_MAX_RESULTS', 20)
+        limit = min(max(request.args.get('limit', 8, type=int), 1), max_results)
+        
+        kinds = tuple(kind for kind in KINDS if kind in request.args.get('kind', ','.join(KINDS)).split(','))
+        if not kinds:
+            return jsonify({'error': f"kind must be one of {', '.join(KINDS)}"}), 400
+        
+        # Served from the in-memory index (suggest.py), without a database query
+        response = jsonify({'query': query, 'suggestions': suggest(query, limit, kinds) if query else []})
+        max_age = current_app.config.get('SUGGEST_CACHE_MAX_AGE', 30)
+        if max_age:
+            response.headers['Cache-Control'] = f'public, max-age={max_age}'
+        return response, 200
+        
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @books_bp.route('/<int:book_id>', methods=['GET'])
+@cached_catalog_response
 def get_book(book_id):
     try:
         book = Book.query.get(book_id)
@@ -69,8 +102,8 @@ def get_book(book_id):
             is_available=True
         ).all()
         
-        book_data = book.to_dict()
-        book_data['available_copies_detail'] = [copy.to_dict() for copy in available_copies]
+        book_data = book.to_dict(available_copies=len(available_copies))
+        book_data['available_copies_detail'] = serialize_donations(available_copies)
         
         return jsonify({'book': book_data}), 200
         
@@ -81,10 +114,7 @@ def get_book(book_id):
 @jwt_required()
 def create_book():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user.is_admin:
+        if not is_admin():
             return jsonify({'error': 'Admin access required'}), 403
         
         data = request.get_json()
@@ -98,21 +128,24 @@ def create_book():
         if not all([title, author]):
             return jsonify({'error': 'Title and author are required'}), 400
         
-        # Check if book already exists (by title and author)
-        existing_book = Book.query.filter_by(title=title, author=author).first()
+        isbn = normalize_isbn(data.get('isbn'))
+        
+        # Check if book already exists (same ISBN, or same title and author)
+        existing_book = find_book(title, author, isbn)
         if existing_book:
-            return jsonify({'error': 'Book already exists'}), 400
+            return jsonify({'error': 'Book already exists', 'book_id': existing_book.id}), 400
         
         book = Book(
             title=title,
             author=author,
-            isbn=data.get('isbn', '').strip(),
+            isbn=isbn,
             category=data.get('category', '').strip(),
             description=data.get('description', '').strip(),
             image_url=data.get('image_url', '').strip()
         )
         
         db.session.add(book)
+        stats.bump(total_books=1)
         db.session.commit()
         
         return jsonify({
@@ -127,10 +160,7 @@ def create_book():
 @jwt_required()
 def update_book(book_id):
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user.is_admin:
+        if not is_admin():
             return jsonify({'error': 'Admin access required'}), 403
         
         book = Book.query.get(book_id)
@@ -149,13 +179,20 @@ def update_book(book_id):
         if 'author' in data:
             book.author = data['author'].strip()
         if 'isbn' in data:
-            book.isbn = data['isbn'].strip()
+            isbn = normalize_isbn(data['isbn'])
+            if isbn != book.isbn and isbn_taken(isbn, book_id):
+                return jsonify({'error': 'Another book has this ISBN'}), 400
+            book.isbn = isbn
         if 'category' in data:
             book.category = data['category'].strip()
         if 'description' in data:
             book.description = data['description'].strip()
         if 'image_url' in data:
-            book.image_url = data['image_url'].strip()
+            image_url = data['image_url'].strip()
+            # Another URL replaces an uploaded cover
+            if image_url != book.image_url:
+                book.cover_id = None
+            book.image_url = image_url
         if 'is_available' in data:
             book.is_available = bool(data['is_available'])
         
@@ -169,14 +206,84 @@ def update_book(book_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@books_bp.route('/<int:book_id>/cover', methods=['POST'])
+@jwt_required()
+def upload_cover(book_id):
+    try:
+        if not is_admin():
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        book = Book.query.get(book_id)
+        
+        if not book:
+            return jsonify({'error': 'Book not found'}), 404
+        
+        # The raw image as the request body, or a multipart form with a "file" field
+        if request.mimetype == 'multipart/form-data':
+            upload = request.files.get('file')
+            if upload is None:
+                return jsonify({'error': 'No file provided'}), 400
+            stream, filename = upload.stream, upload.filename
+        else:
+            stream, filename = request.stream, None
+        
+        cover_id, name, width, height, created = save_cover(stream, filename)
+        queue_thumbnails(name)
+        
+        book.cover_id = cover_id
+        book.image_url = cover_url(name)
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Cover uploaded successfully',
+            'cover': {
+                'id': cover_id,
+                'url': book.image_url,
+                'width': width,
+                'height': height,
+                'thumbnails': thumbnail_urls(cover_id),
+                'deduplicated': not created
+            },
+            'book': book.to_dict()
+        }), 201
+        
+    except InvalidCover as e:
+        return jsonify({'error': str(e)}), 400
+    except RequestEntityTooLarge:
+        return jsonify({'error': f'Cover is larger than {current_app.config["MAX_CONTENT_LENGTH"]} bytes'}), 413
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@books_bp.route('/<int:book_id>/cover', methods=['DELETE'])
+@jwt_required()
+def delete_cover(book_id):
+    try:
+        if not is_admin():
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        book = Book.query.get(book_id)
+        
+        if not book:
+            return jsonify({'error': 'Book not found'}), 404
+        
+        # The stored files stay; other books may use the same image
+        book.cover_id = None
+        book.image_url = ''
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Cover removed successfully',
+            'book': book.to_dict()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @books_bp.route('/<int:book_id>', methods=['DELETE'])
 @jwt_required()
 def delete_book(book_id):
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user.is_admin:
+        if not is_admin():
             return jsonify({'error': 'Admin access required'}), 403
         
         book = Book.query.get(book_id)
@@ -193,7 +300,12 @@ def delete_book(book_id):
         if active_borrowings > 0:
             return jsonify({'error': 'Cannot delete book with active borrowings'}), 400
         
+        # Nobody can pick up a deleted title
+        Hold.query.filter_by(book_id=book_id).delete(synchronize_session=False)
+        HoldQueue.query.filter_by(book_id=book_id).delete(synchronize_session=False)
+        
         db.session.delete(book)
+        stats.bump(total_books=-1)
         db.session.commit()
         
         return jsonify({'message': 'Book deleted successfully'}), 200
@@ -206,18 +318,18 @@ def delete_book(book_id):
 def borrow_book(book_id):
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
         
         book = Book.query.get(book_id)
         
         if not book:
             return jsonify({'error': 'Book not found'}), 404
         
-        # Check if user has any overdue books
-        overdue_books = BorrowedBook.query.filter(
-            BorrowedBook.borrower_id == user_id,
-            BorrowedBook.is_returned == False,
-            BorrowedBook.due_date < datetime.utcnow()
+        # Check if user has any overdue books (flagged by the overdue job, at
+        # most OVERDUE_SCAN_INTERVAL after the due date passes)
+        overdue_books = BorrowedBook.query.filter_by(
+            borrower_id=user_id,
+            is_returned=False,
+            is_overdue=True
         ).count()
         
         if overdue_books > 0:
@@ -233,29 +345,31 @@ def borrow_book(book_id):
         if existing_borrow:
             return jsonify({'error': 'You have already borrowed this book'}), 400
         
-        # Find an available donated copy
-        available_copy = DonatedBook.query.filter_by(
-            book_id=book_id,
-            is_available=True
-        ).first()
+        # A copy set aside for this reader's hold, otherwise atomically claim
+        # an available donated copy (marks it unavailable)
+        copy_id = None
+        hold = holds.ready_hold(book_id, user_id)
+        if hold:
+            copy_id = holds.collect(hold)
+        if not copy_id:
+            copy_id = claim_available_copy(book_id)
         
-        if not available_copy:
-            return jsonify({'error': 'No copies available for borrowing'}), 400
+        if not copy_id:
+            db.session.rollback()
+            return jsonify({'error': 'No copies available for borrowing', 'can_hold': True}), 400
         
         # Create borrowing record
-        due_date = datetime.utcnow() + timedelta(days=14)  # 2 weeks borrowing period
+        due_date = datetime.utcnow() + LOAN_PERIOD  # 2 weeks borrowing period
         
         borrowing = BorrowedBook(
             book_id=book_id,
             borrower_id=user_id,
-            donated_book_id=available_copy.id,
+            donated_book_id=copy_id,
             due_date=due_date
         )
         
-        # Mark the donated copy as unavailable
-        available_copy.is_available = False
-        
         db.session.add(borrowing)
+        stats.bump(total_borrowings=1, active_borrowings=1)
         db.session.commit()
         
         return jsonify({
@@ -263,11 +377,17 @@ def borrow_book(book_id):
             'borrowing': borrowing.to_dict()
         }), 201
         
+    except OperationalError:
+        # Lock wait timed out under heavy contention; safe for the client to retry
+        db.session.rollback()
+        return jsonify({'error': 'Library is busy, please try again'}), 503
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @books_bp.route('/borrowed', methods=['GET'])
 @jwt_required()
+@reads_own_writes
 def get_borrowed_books():
     try:
         user_id = get_jwt_identity()
@@ -278,7 +398,7 @@ def get_borrowed_books():
         ).all()
         
         return jsonify({
-            'borrowed_books': [book.to_dict() for book in borrowed_books]
+            'borrowed_books': serialize_borrowings(borrowed_books)
         }), 200
         
     except Exception as e:
@@ -305,11 +425,12 @@ def return_book(borrowing_id):
         borrowing.is_returned = True
         borrowing.returned_at = datetime.utcnow()
         
-        # Make the donated copy available again
+        # Pass the donated copy to the next holder or make it available again
         donated_copy = DonatedBook.query.get(borrowing.donated_book_id)
         if donated_copy:
-            donated_copy.is_available = True
+            holds.release_copy(donated_copy)
         
+        stats.record_return(borrowing)
         db.session.commit()
         
         return jsonify({
@@ -320,7 +441,111 @@ def return_book(borrowing_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@books_bp.route('/<int:book_id>/hold', methods=['POST'])
+@jwt_required()
+def place_hold(book_id):
+    try:
+        user_id = get_jwt_identity()
+        
+        book = Book.query.get(book_id)
+        
+        if not book:
+            return jsonify({'error': 'Book not found'}), 404
+        
+        existing_borrow = BorrowedBook.query.filter_by(
+            book_id=book_id,
+            borrower_id=user_id,
+            is_returned=False
+        ).first()
+        
+        if existing_borrow:
+            return jsonify({'error': 'You have already borrowed this book'}), 400
+        
+        active_holds = Hold.query.filter(
+            Hold.user_id == user_id,
+            Hold.status.in_(holds.ACTIVE_STATUSES)
+        ).all()
+        
+        if any(hold.book_id == book_id for hold in active_holds):
+            return jsonify({'error': 'You already have a hold on this book'}), 400
+        
+        if len(active_holds) >= current_app.config.get('HOLD_LIMIT', 5):
+            return jsonify({'error': 'Hold limit reached, cancel a hold first'}), 400
+        
+        hold = holds.place_hold(book_id, user_id)
+        db.session.commit()
+        
+        ready = hold.status == 'ready'
+        return jsonify({
+            'message': 'A copy is ready for pickup' if ready else 'Hold placed',
+            'hold': holds.hold_details(hold)
+        }), 201
+        
+    except OperationalError:
+        db.session.rollback()
+        return jsonify({'error': 'Library is busy, please try again'}), 503
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@books_bp.route('/<int:book_id>/hold', methods=['DELETE'])
+@jwt_required()
+def cancel_hold(book_id):
+    try:
+        user_id = get_jwt_identity()
+        
+        hold = Hold.query.filter(
+            Hold.book_id == book_id,
+            Hold.user_id == user_id,
+            Hold.status.in_(holds.ACTIVE_STATUSES)
+        ).first()
+        
+        if not hold:
+            return jsonify({'error': 'No active hold on this book'}), 404
+        
+        if not holds.cancel_hold(hold):
+            db.session.rollback()
+            return jsonify({'error': 'Hold changed, please try again'}), 409
+        
+        db.session.commit()
+        
+        return jsonify({'message': 'Hold cancelled'}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@books_bp.route('/holds', methods=['GET'])
+@jwt_required()
+@reads_own_writes
+def get_my_holds():
+    try:
+        user_id = get_jwt_identity()
+        
+        active_holds = Hold.query.filter(
+            Hold.user_id == user_id,
+            Hold.status.in_(holds.ACTIVE_STATUSES)
+        ).order_by(Hold.id).all()
+        
+        book_ids = {hold.book_id for hold in active_holds}
+        books = {
+            data['id']: data for data in
+            serialize_books(Book.query.filter(Book.id.in_(book_ids)).all())
+        } if book_ids else {}
+        
+        result = []
+        for hold in active_holds:
+            data = holds.hold_details(hold)
+            data['book'] = books.get(hold.book_id)
+            result.append(data)
+        
+        return jsonify({'holds': result}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @books_bp.route('/categories', methods=['GET'])
+@cached_catalog_response
 def get_categories():
     try:
         categories = db.session.query(Book.category).distinct().filter(
@@ -0,0 +1,33 @@
+from flask import Blueprint, jsonify, send_file, current_app
+from covers import find_cover, content_type
+
+# Cover images and thumbnails (see covers.py).
+#
+# Names are content hashes, so a URL always returns the same bytes. Browsers
+# and proxies may keep them for a year without revalidating. send_file()
+# answers If-None-Match and Range requests, so a download cut off on a slow
+# connection resumes where it stopped. Behind a proxy, USE_X_SENDFILE hands
+# the file transfer to the proxy.
+
+covers_bp = Blueprint('covers', __name__)
+
+@covers_bp.route('/<name>', methods=['GET'])
+def get_cover(name):
+    try:
+        path = find_cover(name)
+    except OSError as e:
+        return jsonify({'error': str(e)}), 500
+
+    if path is None:
+        return jsonify({'error': 'Cover not found'}), 404
+
+    response = send_file(
+        path,
+        mimetype=content_type(name),
+        conditional=True,
+        etag=name.split('.')[0],
+        max_age=current_app.config.get('COVER_CACHE_MAX_AGE', 31536000)
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1,295 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required
+from sqlalchemy import update
+from sqlalchemy.exc import OperationalError
+from database import db, Book, DonatedBook, BorrowedBook, User, Hold, HoldQueue
+from circulation import LOAN_PERIOD
+from barcodes import normalize
+from holds import release_copy, cancel_hold
+from http_cache import bump_catalog_version
+from identity import is_admin
+from replica import reads_own_writes
+import stats
+from datetime import datetime
+
+# Lending desk: batch check-out and check-in by copy barcode.
+#
+# A batch resolves all its barcodes with one query, applies every state
+# change with set-based statements in a single transaction and reports a
+# result per barcode, in request order. A barcode that cannot be processed
+# fails on its own; the rest of the batch still goes through.
+
+desk_bp = Blueprint('desk', __name__)
+
+def _requested_barcodes(data):
+    barcodes = data.get('barcodes')
+    if not isinstance(barcodes, list) or not barcodes:
+        return None, 'barcodes must be a non-empty list'
+
+    limit = current_app.config.get('DESK_BATCH_LIMIT', 200)
+    if len(barcodes) > limit:
+        return None, f'At most {limit} barcodes per request'
+
+    return [normalize(code) for code in barcodes], None
+
+def _copies_by_barcode(barcodes):
+    rows = db.session.query(DonatedBook, Book.title).join(Book, Book.id == DonatedBook.book_id).filter(
+        DonatedBook.barcode.in_(set(barcodes))
+    ).all()
+    return {copy.barcode: (copy, title) for copy, title in rows}
+
+def _failed(barcode, error):
+    return {'barcode': barcode, 'ok': False, 'error': error}
+
+def _find_borrower(data):
+    if data.get('user_id') is not None:
+        return db.session.get(User, data['user_id'])
+    if data.get('username'):
+        return User.query.filter_by(username=data['username'].strip()).first()
+    return None
+
+@desk_bp.route('/checkout', methods=['POST'])
+@jwt_required()
+def checkout():
+    try:
+        if not is_admin():
+            return jsonify({'error': 'Admin access required'}), 403
+
+        data = request.get_json() or {}
+
+        barcodes, error = _requested_barcodes(data)
+        if error:
+            return jsonify({'error': error}), 400
+
+        borrower = _find_borrower(data)
+        if not borrower:
+            return jsonify({'error': 'Borrower not found'}), 404
+
+        overdue_books = BorrowedBook.query.filter_by(
+            borrower_id=borrower.id,
+            is_returned=False,
+            is_overdue=True
+        ).count()
+
+        if overdue_books > 0:
+            return jsonify({'error': 'Borrower must return overdue books first'}), 400
+
+        copies = _copies_by_barcode(barcodes)
+
+        # Titles the borrower already has, and copies set aside for their holds
+        borrowed_titles = {book_id for (book_id,) in db.session.query(BorrowedBook.book_id).filter(
+            BorrowedBook.borrower_id == borrower.id,
+            BorrowedBook.is_returned == False,
+            BorrowedBook.book_id.in_({copy.book_id for copy, _ in copies.values()})
+        )}
+        ready_holds = {hold.book_id: hold for hold in Hold.query.filter(
+            Hold.user_id == borrower.id,
+            Hold.status == 'ready',
+            Hold.book_id.in_({copy.book_id for copy, _ in copies.values()})
+        )}
+        held = {hold.donated_book_id: hold.id for hold in ready_holds.values()}
+
+        results = []
+        accepted = []
+        seen = set()
+        for barcode in barcodes:
+            entry = copies.get(barcode)
+            if barcode in seen:
+                results.append(_failed(barcode, 'Duplicate barcode in request'))
+            elif not entry:
+                results.append(_failed(barcode, 'Unknown barcode'))
+            elif entry[0].book_id in borrowed_titles:
+                results.append(_failed(barcode, 'Borrower already has this book'))
+            elif entry[0].id not in held and not entry[0].is_available:
+                results.append(_failed(barcode, 'Copy is checked out or reserved'))
+            else:
+                results.append({'barcode': barcode, 'ok': True})
+                accepted.append((results[-1], entry))
+                borrowed_titles.add(entry[0].book_id)
+            seen.add(barcode)
+
+        # Claim shelf copies and collect held ones; a copy taken by a
+        # concurrent request since it was read is reported as unavailable
+        shelf_ids = [copy.id for _, (copy, _) in accepted if copy.id not in held]
+        claimed = set(db.session.execute(
+            update(DonatedBook).where(
+                DonatedBook.id.in_(shelf_ids),
+                DonatedBook.is_available == True
+            ).values(is_available=False).returning(DonatedBook.id),
+            execution_options={'synchronize_session': False}
+        ).scalars()) if shelf_ids else set()
+
+        now = datetime.utcnow()
+        hold_ids = [held[copy.id] for _, (copy, _) in accepted if copy.id in held]
+        collected = set(db.session.execute(
+            update(Hold).where(
+                Hold.id.in_(hold_ids),
+                Hold.status == 'ready'
+            ).values(status='fulfilled', closed_at=now).returning(Hold.donated_book_id),
+            execution_options={'synchronize_session': False}
+        ).scalars()) if hold_ids else set()
+
+        borrowings = []
+        for result, (copy, title) in accepted:
+            if copy.id not in claimed and copy.id not in collected:
+                result.update(_failed(result['barcode'], 'Copy is checked out or reserved'))
+                continue
+
+            # Another copy of a title they were holding: the hold is done and
+            # its copy passes to the next reader
+            hold = ready_holds.get(copy.book_id)
+            if hold and copy.id in claimed:
+                cancel_hold(hold, status='fulfilled')
+
+            borrowing = BorrowedBook(
+                book_id=copy.book_id,
+                borrower_id=borrower.id,
+                donated_book_id=copy.id,
+                borrowed_at=now,
+                due_date=now + LOAN_PERIOD
+            )
+            borrowings.append((result, borrowing, title))
+
+        db.session.add_all([borrowing for _, borrowing, _ in borrowings])
+        stats.bump(total_borrowings=len(borrowings), active_borrowings=len(borrowings))
+        db.session.commit()
+
+        for result, borrowing, title in borrowings:
+            result.update(
+                borrowing_id=borrowing.id,
+                book_id=borrowing.book_id,
+                title=title,
+                due_date=borrowing.due_date
+            )
+
+        return jsonify({
+            'borrower_id': borrower.id,
+            'results': results,
+            'checked_out': len(borrowings),
+            'failed': len(results) - len(borrowings)
+        }), 200
+
+    except OperationalError:
+        db.session.rollback()
+        return jsonify({'error': 'Library is busy, please try again'}), 503
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@desk_bp.route('/checkin', methods=['POST'])
+@jwt_required()
+def checkin():
+    try:
+        if not is_admin():
+            return jsonify({'error': 'Admin access required'}), 403
+
+        data = request.get_json() or {}
+
+        barcodes, error = _requested_barcodes(data)
+        if error:
+            return jsonify({'error': error}), 400
+
+        copies = _copies_by_barcode(barcodes)
+        active = {borrowing.donated_book_id: borrowing for borrowing in BorrowedBook.query.filter(
+            BorrowedBook.donated_book_id.in_([copy.id for copy, _ in copies.values()]),
+            BorrowedBook.is_returned == False
+        )}
+
+        results = []
+        accepted = []
+        seen = set()
+        for barcode in barcodes:
+            entry = copies.get(barcode)
+            if barcode in seen:
+                results.append(_failed(barcode, 'Duplicate barcode in request'))
+            elif not entry:
+                results.append(_failed(barcode, 'Unknown barcode'))
+            elif entry[0].id not in active:
+                results.append(_failed(barcode, 'Copy is not checked out'))
+            else:
+                results.append({'barcode': barcode, 'ok': True})
+                accepted.append((results[-1], entry, active[entry[0].id]))
+            seen.add(barcode)
+
+        now = datetime.utcnow()
+        returned = set(db.session.execute(
+            update(BorrowedBook).where(
+                BorrowedBook.id.in_([borrowing.id for _, _, borrowing in accepted]),
+                BorrowedBook.is_returned == False
+            ).values(is_returned=True, returned_at=now).returning(BorrowedBook.id),
+            execution_options={'synchronize_session': False}
+        ).scalars()) if accepted else set()
+
+        if returned:
+            stats.record_returns(list(returned))
+
+        # Copies of titles with a waitlist go to the next holders (the desk
+        # puts them on the hold shelf); the rest go back on the shelf at once
+        waitlisted = {book_id for (book_id,) in db.session.query(HoldQueue.book_id).filter(
+            HoldQueue.book_id.in_({copy.book_id for _, (copy, _), _ in accepted}),
+            HoldQueue.waiting > 0
+        )} if returned else set()
+
+        shelved = []
+        for result, (copy, title), borrowing in accepted:
+            if borrowing.id not in returned:
+                result.update(_failed(result['barcode'], 'Copy is not checked out'))
+                continue
+
+            result.update(
+                borrowing_id=borrowing.id,
+                borrower_id=borrowing.borrower_id,
+                book_id=copy.book_id,
+                title=title,
+                was_overdue=bool(borrowing.is_overdue),
+                hold_id=release_copy(copy) if copy.book_id in waitlisted else None
+            )
+            if copy.book_id not in waitlisted:
+                shelved.append(copy.id)
+
+        if shelved:
+            db.session.execute(
+                update(DonatedBook).where(DonatedBook.id.in_(shelved)).values(is_available=True),
+                execution_options={'synchronize_session': False}
+            )
+        if returned:
+            bump_catalog_version()
+        db.session.commit()
+
+        return jsonify({
+            'results': results,
+            'checked_in': len(returned),
+            'failed': len(results) - len(returned)
+        }), 200
+
+    except OperationalError:
+        db.session.rollback()
+        return jsonify({'error': 'Library is busy, please try again'}), 503
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@desk_bp.route('/copies/<barcode>', methods=['GET'])
+@jwt_required()
+@reads_own_writes
+def get_copy(barcode):
+    try:
+        if not is_admin():
+            return jsonify({'error': 'Admin access required'}), 403
+
+        copy = DonatedBook.query.filter_by(barcode=normalize(barcode)).first()
+
+        if not copy:
+            return jsonify({'error': 'Unknown barcode'}), 404
+
+        borrowing = BorrowedBook.query.filter_by(donated_book_id=copy.id, is_returned=False).first()
+        hold = Hold.query.filter_by(donated_book_id=copy.id, status='ready').first()
+
+        return jsonify({
+            'copy': copy.to_dict(),
+            'borrowing': borrowing.to_dict(include_related=False) if borrowing else None,
+            'hold': hold.to_dict() if hold else None
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -1,10 +1,27 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from database import db, DonatedBook, Book, User
+from database import db, DonatedBook, Book, User, Hold
+from serializers import serialize_donations, donations_feed_query, serialize_donations_feed
+from pagination import paginate, InvalidCursor
+import stats
+from holds import fill_waiting
+from barcodes import normalize, validate_custom
+from identity import is_admin
+from isbn import find_book, normalize_isbn
+from replica import reads_own_writes
+from importer import import_donations, iter_csv, iter_ndjson, DEFAULT_BATCH_SIZE
 from datetime import datetime
 
 donations_bp = Blueprint('donations', __name__)
 
+def _feed_query():
+    # Optional ?genre=, ?condition= and ?donor_id= filters shared by both feeds
+    return donations_feed_query(
+        genre=request.args.get('genre', request.args.get('category', '')).strip(),
+        condition=request.args.get('condition', '').strip(),
+        donor_id=request.args.get('donor_id', type=int)
+    )
+
 # Test endpoint without authentication - enhanced for mobile
 @donations_bp.route('/test', methods=['GET', 'OPTIONS'])
 def test_donations():
@@ -14,56 +31,25 @@ def test_donations():
     
     try:
         print(f"[BACKEND] Test donations endpoint hit at {datetime.now()}")
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
-        
-        donations = DonatedBook.query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
+        donations = paginate(_feed_query(), DonatedBook.id)
         
         print(f"[BACKEND] Found {donations.total} total donations in database")
         
         # Format the response to match frontend expectations
-        donations_data = []
-        for donation in donations.items:
-            donation_dict = {
-                'id': donation.id,
-                'donationId': f"DON{donation.id:06d}",
-                'bookTitle': donation.book.title if donation.book else '',
-                'bookAuthor': donation.book.author if donation.book else '',
-                'bookGenre': donation.book.category if donation.book else 'General',
-                'bookDescription': donation.book.description if donation.book else '',
-                'bookCondition': donation.condition,
-                'bookIsbn': donation.book.isbn if donation.book else '',
-                'bookLanguage': 'Hindi',  # Default language
-                'status': 'approved',  # Default status
-                'createdAt': donation.donated_at.isoformat() if donation.donated_at else None,
-                'donor': {
-                    'name': donation.donor.username if donation.donor else 'Unknown',
-                    'email': donation.donor.email if donation.donor else ''
-                }
-            }
-            donations_data.append(donation_dict)
+        donations_data = serialize_donations_feed(donations.items)
         
         response_data = {
             'status': 'success',
             'message': f'Successfully fetched {len(donations_data)} donations',
             'data': donations_data,
-            'meta': {
-                'total': donations.total,
-                'pages': donations.pages,
-                'current_page': page,
-                'per_page': per_page,
-                'has_next': donations.has_next,
-                'has_prev': donations.has_prev
-            }
+            'meta': donations.meta()
         }
         
         print(f"[BACKEND] Returning {len(donations_data)} donations to frontend")
         return jsonify(response_data), 200
         
+    except InvalidCursor as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         print(f"[BACKEND] Error in test_donations: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -73,7 +59,6 @@ def test_donations():
 def donate_book():
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
         
         data = request.get_json()
         
@@ -86,30 +71,46 @@ def donate_book():
         if not all([title, author]):
             return jsonify({'error': 'Title and author are required'}), 400
         
-        # Check if book exists, if not create it
-        book = Book.query.filter_by(title=title, author=author).first()
+        # A copy that already carries a label keeps it; otherwise one is generated
+        barcode = normalize(data.get('barcode') or '') or None
+        if barcode:
+            error = validate_custom(barcode)
+            if error:
+                return jsonify({'error': error}), 400
+            if DonatedBook.query.filter_by(barcode=barcode).first():
+                return jsonify({'error': 'Barcode is already in use'}), 400
+        
+        isbn = normalize_isbn(data.get('isbn'))
+        
+        # Same ISBN, else same title and author; otherwise a new book
+        book = find_book(title, author, isbn)
         
         if not book:
             book = Book(
                 title=title,
                 author=author,
-                isbn=data.get('isbn', '').strip(),
+                isbn=isbn,
                 category=data.get('genre', data.get('category', 'General')).strip(),
                 description=data.get('description', '').strip(),
                 image_url=data.get('image_url', '').strip()
             )
             db.session.add(book)
             db.session.flush()  # To get the book ID
+            stats.bump(total_books=1)
         
         # Create donation record
         donation = DonatedBook(
             book_id=book.id,
             donor_id=user_id,
             condition=data.get('condition', 'Good'),
-            notes=data.get('notes', '').strip()
+            notes=data.get('notes', '').strip(),
+            barcode=barcode
         )
         
         db.session.add(donation)
+        stats.bump(total_donations=1)
+        # A new copy of a title with a waitlist goes to the first holder
+        fill_waiting([book.id])
         db.session.commit()
         
         return jsonify({
@@ -122,31 +123,68 @@ def donate_book():
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@donations_bp.route('/import', methods=['POST'])
+@jwt_required()
+def import_donations_bulk():
+    try:
+        if not is_admin():
+            return jsonify({'success': False, 'error': 'Admin access required'}), 403
+        
+        # Donations are credited to the given donor, or to the importing admin
+        donor_id = request.args.get('donor_id', type=int) or get_jwt_identity()
+        if not db.session.get(User, donor_id):
+            return jsonify({'success': False, 'error': 'Donor not found'}), 404
+        
+        # Accept a multipart upload (field "file") or the raw request body
+        upload = request.files.get('file')
+        if upload:
+            stream, filename, content_type = upload.stream, upload.filename or '', upload.mimetype
+        else:
+            stream, filename, content_type = request.stream, '', request.mimetype
+        
+        file_format = request.args.get('format', '').lower()
+        if not file_format:
+            if filename.endswith('.csv') or content_type == 'text/csv':
+                file_format = 'csv'
+            elif filename.endswith(('.ndjson', '.jsonl')) or content_type in ('application/x-ndjson', 'application/jsonl'):
+                file_format = 'ndjson'
+        
+        if file_format == 'csv':
+            rows = iter_csv(stream)
+        elif file_format == 'ndjson':
+            rows = iter_ndjson(stream)
+        else:
+            return jsonify({'success': False, 'error': 'Unsupported format, use csv or ndjson'}), 400
+        
+        batch_size = request.args.get('batch_size', DEFAULT_BATCH_SIZE, type=int)
+        report = import_donations(rows, donor_id, batch_size=max(batch_size, 1))
+        
+        return jsonify({
+            'success': True,
+            'message': f'Imported {report.imported} of {report.rows} rows',
+            'report': report.to_dict()
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @donations_bp.route('/my-donations', methods=['GET'])
 @jwt_required()
+@reads_own_writes
 def get_my_donations():
     try:
         user_id = get_jwt_identity()
         
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
-        
-        donations = DonatedBook.query.filter_by(donor_id=user_id).paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
+        donations = paginate(DonatedBook.query.filter_by(donor_id=user_id), DonatedBook.id)
         
         return jsonify({
-            'donations': [donation.to_dict() for donation in donations.items],
-            'total': donations.total,
-            'pages': donations.pages,
-            'current_page': page,
-            'per_page': per_page,
-            'has_next': donations.has_next,
-            'has_prev': donations.has_prev
+            'donations': serialize_donations(donations.items),
+            **donations.meta()
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -154,61 +192,29 @@ def get_my_donations():
 @jwt_required()
 def get_all_donations():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
         # Allow both admin and regular users to view donations
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
-        
-        donations = DonatedBook.query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
+        donations = paginate(_feed_query(), DonatedBook.id)
         
         # Format the response to match frontend expectations
-        donations_data = []
-        for donation in donations.items:
-            donation_dict = {
-                'id': donation.id,
-                'donationId': f"DON{donation.id:06d}",
-                'bookTitle': donation.book.title if donation.book else '',
-                'bookAuthor': donation.book.author if donation.book else '',
-                'bookGenre': donation.book.category if donation.book else 'General',
-                'bookDescription': donation.book.description if donation.book else '',
-                'bookCondition': donation.condition,
-                'bookIsbn': donation.book.isbn if donation.book else '',
-                'bookLanguage': 'Hindi',  # Default language
-                'status': 'approved',  # Default status
-                'createdAt': donation.donated_at.isoformat() if donation.donated_at else None,
-                'donor': {
-                    'name': donation.donor.username if donation.donor else 'Unknown',
-                    'email': donation.donor.email if donation.donor else ''
-                }
-            }
-            donations_data.append(donation_dict)
+        donations_data = serialize_donations_feed(donations.items)
         
         return jsonify({
             'success': True,
             'data': donations_data,
-            'total': donations.total,
-            'pages': donations.pages,
-            'current_page': page,
-            'per_page': per_page,
-            'has_next': donations.has_next,
-            'has_prev': donations.has_prev
+            **donations.meta()
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @donations_bp.route('/<int:donation_id>', methods=['GET'])
 @jwt_required()
+@reads_own_writes
 def get_donation(donation_id):
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
         
         donation = DonatedBook.query.get(donation_id)
         
@@ -216,7 +222,7 @@ def get_donation(donation_id):
             return jsonify({'error': 'Donation not found'}), 404
         
         # Check if user can access this donation
-        if not user.is_admin and donation.donor_id != user_id:
+        if not is_admin() and donation.donor_id != user_id:
             return jsonify({'error': 'Unauthorized'}), 403
         
         return jsonify({'donation': donation.to_dict()}), 200
@@ -229,7 +235,6 @@ def get_donation(donation_id):
 def update_donation(donation_id):
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
         
         donation = DonatedBook.query.get(donation_id)
         
@@ -237,7 +242,7 @@ def update_donation(donation_id):
             return jsonify({'error': 'Donation not found'}), 404
         
         # Check if user can update this donation
-        if not user.is_admin and donation.donor_id != user_id:
+        if not is_admin() and donation.donor_id != user_id:
             return jsonify({'error': 'Unauthorized'}), 403
         
         data = request.get_json()
@@ -250,8 +255,20 @@ def update_donation(donation_id):
             donation.condition = data['condition']
         if 'notes' in data:
             donation.notes = data['notes'].strip()
-        if 'is_available' in data and user.is_admin:
+        if 'is_available' in data and is_admin():
             donation.is_available = bool(data['is_available'])
+            if donation.is_available:
+                fill_waiting([donation.book_id])
+        if 'barcode' in data and is_admin():
+            # Relabelling a copy whose label was lost or damaged
+            barcode = normalize(data['barcode'] or '')
+            if barcode != donation.barcode:
+                error = validate_custom(barcode)
+                if error:
+                    return jsonify({'error': error}), 400
+                if DonatedBook.query.filter_by(barcode=barcode).first():
+                    return jsonify({'error': 'Barcode is already in use'}), 400
+                donation.barcode = barcode
         
         db.session.commit()
         
@@ -268,7 +285,6 @@ def update_donation(donation_id):
 def delete_donation(donation_id):
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
         
         donation = DonatedBook.query.get(donation_id)
         
@@ -276,14 +292,18 @@ def delete_donation(donation_id):
             return jsonify({'error': 'Donation not found'}), 404
         
         # Check if user can delete this donation
-        if not user.is_admin and donation.donor_id != user_id:
+        if not is_admin() and donation.donor_id != user_id:
             return jsonify({'error': 'Unauthorized'}), 403
         
         # Check if donation is currently borrowed
         if donation.borrowings and any(not b.is_returned for b in donation.borrowings):
             return jsonify({'error': 'Cannot delete donation that is currently borrowed'}), 400
         
+        if Hold.query.filter_by(donated_book_id=donation_id, status='ready').first():
+            return jsonify({'error': 'Cannot delete donation that is set aside for a hold'}), 400
+        
         db.session.delete(donation)
+        stats.bump(total_donations=-1)
         db.session.commit()
         
         return jsonify({'message': 'Donation deleted successfully'}), 200
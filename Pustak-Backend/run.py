@@ -1,13 +1,21 @@
-from app import create_app, db
+import os
+from app import create_app, prepare_database, db
+from scheduler import start_background_jobs
+import stats
+
+# Development server with the reloader and debugger. For production use
+# serve.py (gunicorn or waitress, see the README).
 
 if __name__ == '__main__':
     app = create_app()
     
+    # Create tables, apply migrations, build the search index and refresh the dashboard counters
+    applied = prepare_database(app)
+    print("Database tables created successfully!")
+    for version, name in applied:
+        print(f"Applied migration {version}: {name}")
+    
     with app.app_context():
-        # Create all database tables
-        db.create_all()
-        print("Database tables created successfully!")
-        
         # Create a default admin user
         from database import User
         
@@ -20,6 +28,7 @@ if __name__ == '__main__':
             )
             admin_user.set_password('admin123')
             db.session.add(admin_user)
+            stats.bump(total_users=1)
             db.session.commit()
             print("Default admin user created!")
             print("Username: admin")
@@ -28,5 +37,9 @@ if __name__ == '__main__':
         else:
             print("Admin user already exists!")
     
+    # The reloader runs this script twice; only start jobs in the serving process
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_jobs(app)
+    
     print("Starting server on http://localhost:9001")
     app.run(debug=True, host='0.0.0.0', port=9001)
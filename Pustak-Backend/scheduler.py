@@ -0,0 +1,87 @@
+import logging
+import os
+import threading
+from database import db
+
+# Minimal in-process scheduler for periodic maintenance jobs.
+# Each job runs on its own daemon thread inside an app context; the interval
+# comes from app config and a value of 0 disables the job.
+
+logger = logging.getLogger(__name__)
+
+class PeriodicJob(threading.Thread):
+    def __init__(self, app, name, interval, func):
+        super().__init__(name=f'job-{name}', daemon=True)
+        self.app = app
+        self.job_name = name
+        self.interval = interval
+        self.func = func
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.run_once()
+
+    def run_once(self):
+        with self.app.app_context():
+            try:
+                self.func()
+            except Exception:
+                logger.exception('Background job %s failed', self.job_name)
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+    def stop(self):
+        self._stopped.set()
+
+def _jobs():
+    from stats import reconcile
+    from overdue import run_overdue_cycle
+    from holds import expire_holds
+    from suggest import prune_book_changes
+    from availability import prune_availability_events
+
+    # (name, interval config key, default seconds, function)
+    return [
+        ('reconcile-stats', 'STATS_RECONCILE_INTERVAL', 300, reconcile),
+        ('overdue-reminders', 'OVERDUE_SCAN_INTERVAL', 60, run_overdue_cycle),
+        ('expire-holds', 'HOLD_EXPIRY_INTERVAL', 300, expire_holds),
+        ('prune-book-changes', 'BOOK_CHANGE_PRUNE_INTERVAL', 3600, prune_book_changes),
+        ('prune-availability-events', 'AVAILABILITY_EVENT_PRUNE_INTERVAL', 3600, prune_availability_events),
+    ]
+
+# Open lock file of the process that runs the jobs, kept for its lifetime
+_lock_file = None
+
+def claim_scheduler(path):
+    # Under gunicorn every worker asks; only the one holding the lock runs the
+    # jobs. The lock goes with the process, so a recycled worker's
+    # replacement picks it up.
+    global _lock_file
+    import fcntl
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle = open(path, 'a')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+
+    _lock_file = handle
+    return True
+
+def start_background_jobs(app):
+    started = []
+
+    for name, config_key, default, func in _jobs():
+        interval = app.config.get(config_key, default)
+        if not interval:
+            continue
+
+        job = PeriodicJob(app, name, interval, func)
+        job.start()
+        started.append(job)
+
+    return started
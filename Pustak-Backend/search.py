@@ -0,0 +1,127 @@
+import re
+from sqlalchemy import text, column, false
+from sqlalchemy.exc import OperationalError
+from database import db, Book
+from isbn import normalize_isbn, isbn_key, ISBN_PATTERN
+
+# Full-text catalog search backed by an SQLite FTS5 index over book.
+# The index is an external-content table kept in sync by triggers, so every
+# write path (routes, donations, scripts) updates it in the same transaction.
+
+FTS_TABLE = 'book_fts'
+
+# Keep Devanagari vowel signs (category M*) inside tokens; the default
+# unicode61 categories treat them as separators and split words apart.
+FTS_TOKENIZER = "unicode61 remove_diacritics 2 categories 'L* N* Co M*'"
+
+# Column weights for bm25(): title, author, isbn, category
+FTS_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+FTS_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, author, isbn, category,
+        content='book', content_rowid='id',
+        tokenize="{FTS_TOKENIZER}", prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON book BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, author, isbn, category)
+        VALUES (new.id, new.title, new.author, new.isbn, new.category);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, isbn, category)
+        VALUES ('delete', old.id, old.title, old.author, old.isbn, old.category);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, isbn, category)
+        VALUES ('delete', old.id, old.title, old.author, old.isbn, old.category);
+        INSERT INTO {FTS_TABLE}(rowid, title, author, isbn, category)
+        VALUES (new.id, new.title, new.author, new.isbn, new.category);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+]
+
+# Word characters plus the Devanagari block, minus the danda punctuation marks
+TOKEN_PATTERN = re.compile(r'[\w\u0900-\u0963\u0966-\u097f]+')
+
+# (engine URL, table) -> whether that FTS index is usable on the database
+_index_ready = {}
+
+def ensure_fts_table(name, schema):
+    # Create an FTS5 table (and its sync triggers) on first use
+    engine = db.engine
+    key = (str(engine.url), name)
+
+    if key in _index_ready:
+        return _index_ready[key]
+
+    if engine.dialect.name != 'sqlite':
+        _index_ready[key] = False
+        return False
+
+    try:
+        with engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': name}
+            ).first()
+
+            if not exists:
+                for statement in schema:
+                    conn.execute(text(statement))
+
+        _index_ready[key] = True
+    except OperationalError:
+        # SQLite built without FTS5 (or the tokenizer) - callers fall back
+        _index_ready[key] = False
+
+    return _index_ready[key]
+
+def ensure_search_index():
+    return ensure_fts_table(FTS_TABLE, FTS_SCHEMA)
+
+def rebuild_search_index():
+    if not ensure_search_index():
+        return False
+
+    with db.engine.begin() as conn:
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+    return True
+
+def match_expression(search):
+    tokens = TOKEN_PATTERN.findall(search)
+    if not tokens:
+        return None
+
+    # Every token is a quoted prefix term so partially typed words still match
+    return ' '.join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+
+def apply_search(query, search):
+    # An ISBN, typed with or without hyphens, is an indexed lookup on the stored forms
+    compact = normalize_isbn(search)
+    if compact and ISBN_PATTERN.match(compact):
+        return query.filter(db.or_(Book.isbn == compact, Book.isbn_key == (isbn_key(compact) or compact)))
+
+    expression = match_expression(search)
+    if expression is None:
+        # Only punctuation or symbols: nothing can match, rather than everything
+        return query.filter(false()) if search.strip() else query
+
+    if not ensure_search_index():
+        return query.filter(
+            db.or_(
+                Book.title.ilike(f'%{search}%'),
+                Book.author.ilike(f'%{search}%'),
+                Book.isbn.ilike(f'%{search}%')
+            )
+        )
+
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    matches = text(
+        f"SELECT rowid, bm25({FTS_TABLE}, {weights}) AS rank "
+        f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :expression"
+    ).bindparams(expression=expression).columns(
+        column('rowid'), column('rank')
+    ).subquery('matches')
+
+    return query.join(matches, Book.id == matches.c.rowid).order_by(matches.c.rank, Book.id)
@@ -0,0 +1,116 @@
+from sqlalchemy import func
+from database import db, Book, DonatedBook, User
+
+# Page-level serializers. Each one loads everything a page of rows needs
+# (books, users, available copy counts) with a fixed number of IN / GROUP BY
+# queries, instead of walking lazy relationships row by row in to_dict().
+
+def available_copy_counts(book_ids):
+    book_ids = {book_id for book_id in book_ids if book_id is not None}
+    if not book_ids:
+        return {}
+
+    rows = db.session.query(DonatedBook.book_id, func.count(DonatedBook.id)).filter(
+        DonatedBook.book_id.in_(book_ids),
+        DonatedBook.is_available == True
+    ).group_by(DonatedBook.book_id).all()
+
+    return {book_id: count for book_id, count in rows}
+
+def load_by_id(model, ids):
+    ids = {obj_id for obj_id in ids if obj_id is not None}
+    if not ids:
+        return {}
+
+    return {obj.id: obj for obj in model.query.filter(model.id.in_(ids)).all()}
+
+def serialize_books(books):
+    counts = available_copy_counts(book.id for book in books)
+    return [book.to_dict(available_copies=counts.get(book.id, 0)) for book in books]
+
+def _book_dicts(book_ids):
+    books = load_by_id(Book, book_ids)
+    return {book['id']: book for book in serialize_books(list(books.values()))}
+
+def _user_dicts(user_ids):
+    return {user_id: user.to_dict() for user_id, user in load_by_id(User, user_ids).items()}
+
+def serialize_donations(donations):
+    books = _book_dicts(donation.book_id for donation in donations)
+    donors = _user_dicts(donation.donor_id for donation in donations)
+
+    result = []
+    for donation in donations:
+        data = donation.to_dict(include_related=False)
+        data['book'] = books.get(donation.book_id)
+        data['donor'] = donors.get(donation.donor_id)
+        result.append(data)
+
+    return result
+
+def serialize_borrowings(borrowings):
+    books = _book_dicts(borrowing.book_id for borrowing in borrowings)
+    borrowers = _user_dicts(borrowing.borrower_id for borrowing in borrowings)
+
+    result = []
+    for borrowing in borrowings:
+        data = borrowing.to_dict(include_related=False)
+        data['book'] = books.get(borrowing.book_id)
+        data['borrower'] = borrowers.get(borrowing.borrower_id)
+        result.append(data)
+
+    return result
+
+# Donations feed (the frontend's flat donation shape). One joined query that
+# selects only the columns the feed shows, so a page is a single SELECT with
+# no ORM objects built and no per-row book/donor lookups.
+
+def donations_feed_query(genre=None, condition=None, donor_id=None):
+    query = db.session.query(
+        DonatedBook.id,
+        DonatedBook.condition,
+        DonatedBook.donated_at,
+        Book.id.label('book_id'),
+        Book.title,
+        Book.author,
+        Book.category,
+        Book.description,
+        Book.isbn,
+        User.id.label('donor_id'),
+        User.username,
+        User.email
+    ).outerjoin(Book, Book.id == DonatedBook.book_id).outerjoin(User, User.id == DonatedBook.donor_id)
+
+    if genre:
+        query = query.filter(Book.category.ilike(f'%{genre}%'))
+    if condition:
+        query = query.filter(DonatedBook.condition == condition)
+    if donor_id is not None:
+        query = query.filter(DonatedBook.donor_id == donor_id)
+
+    return query
+
+def _feed_item(row):
+    has_book = row.book_id is not None
+    has_donor = row.donor_id is not None
+
+    return {
+        'id': row.id,
+        'donationId': f"DON{row.id:06d}",
+        'bookTitle': row.title if has_book else '',
+        'bookAuthor': row.author if has_book else '',
+        'bookGenre': row.category if has_book else 'General',
+        'bookDescription': row.description if has_book else '',
+        'bookCondition': row.condition,
+        'bookIsbn': row.isbn if has_book else '',
+        'bookLanguage': 'Hindi',  # Default language
+        'status': 'approved',  # Default status
+        'createdAt': row.donated_at,
+        'donor': {
+            'name': row.username if has_donor else 'Unknown',
+            'email': row.email if has_donor else ''
+        }
+    }
+
+def serialize_donations_feed(rows):
+    return [_feed_item(row) for row in rows]
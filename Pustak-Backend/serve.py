@@ -0,0 +1,67 @@
+import argparse
+import os
+import sys
+
+# Production server launcher.
+#
+#   python serve.py                          # gunicorn on Linux/macOS, waitress on Windows
+#   python serve.py --workers 4 --threads 8 --port 9001
+#   python serve.py --server waitress
+#
+# gunicorn runs several worker processes (settings in gunicorn.conf.py) with
+# the app preloaded in the master; waitress runs one multi-threaded process.
+# Configuration comes from FLASK_CONFIG (default: production) and the
+# environment variables read in config.py.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def serve_gunicorn(args):
+    from gunicorn.app.wsgiapp import run
+
+    sys.argv = ['gunicorn', '--config', os.path.join(HERE, 'gunicorn.conf.py'), '--chdir', HERE]
+    if args.workers:
+        sys.argv += ['--workers', str(args.workers)]
+    if args.threads:
+        sys.argv += ['--threads', str(args.threads)]
+    # Either flag overrides BIND; the other half comes from its default
+    if args.host or args.port:
+        host = args.host or '0.0.0.0'
+        port = args.port or int(os.environ.get('PORT', 9001))
+        sys.argv += ['--bind', f'{host}:{port}']
+    sys.argv.append('wsgi:app')
+    run()
+
+def serve_waitress(args):
+    from waitress import serve
+    from wsgi import app
+    from scheduler import start_background_jobs
+
+    start_background_jobs(app)
+    serve(
+        app,
+        host=args.host or '0.0.0.0',
+        port=args.port or int(os.environ.get('PORT', 9001)),
+        threads=args.threads or int(os.environ.get('WEB_THREADS', 8))
+    )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the API with a production WSGI server')
+    parser.add_argument('--server', choices=['auto', 'gunicorn', 'waitress'], default='auto')
+    parser.add_argument('--host', help='listen address (default 0.0.0.0)')
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--workers', type=int, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, help='threads per process')
+    args = parser.parse_args()
+
+    server = args.server
+    if server == 'auto':
+        # gunicorn needs fork(), so Windows falls back to waitress
+        server = 'waitress' if os.name == 'nt' else 'gunicorn'
+
+    os.chdir(HERE)
+    sys.path.insert(0, HERE)
+
+    if server == 'gunicorn':
+        serve_gunicorn(args)
+    else:
+        serve_waitress(args)
@@ -0,0 +1,78 @@
+from datetime import datetime
+from sqlalchemy import update
+from database import db, User, Book, DonatedBook, BorrowedBook, LibraryStats
+
+# Incrementally maintained dashboard counters.
+#
+# Write paths call bump() before committing, so the counter change commits or
+# rolls back together with the row it describes. reconcile() recomputes every
+# counter from the tables and runs periodically to repair any drift (rows
+# written by scripts, manual SQL, crashes between statements).
+#
+# overdue_borrowings counts active borrowings flagged is_overdue: the overdue
+# job (overdue.py) adds the rows it flags and returning a flagged borrowing
+# takes it off again.
+
+STATS_ROW_ID = 1
+
+def bump(**deltas):
+    values = {
+        name: getattr(LibraryStats, name) + delta
+        for name, delta in deltas.items() if delta
+    }
+    if not values:
+        return
+
+    db.session.execute(
+        update(LibraryStats).where(LibraryStats.id == STATS_ROW_ID).values(**values),
+        execution_options={'synchronize_session': False}
+    )
+
+def record_returns(borrowing_ids):
+    # Clear the flags in SQL so the counter follows the stored values, even if
+    # the overdue job flagged a row after it was loaded
+    cleared = db.session.execute(
+        update(BorrowedBook).where(
+            BorrowedBook.id.in_(borrowing_ids),
+            BorrowedBook.is_overdue == True
+        ).values(is_overdue=False),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+
+    bump(active_borrowings=-len(borrowing_ids), overdue_borrowings=-cleared)
+    return cleared
+
+def record_return(borrowing):
+    record_returns([borrowing.id])
+    borrowing.is_overdue = False
+
+def reconcile():
+    now = datetime.utcnow()
+
+    counts = {
+        'total_users': User.query.count(),
+        'total_books': Book.query.count(),
+        'total_donations': DonatedBook.query.count(),
+        'total_borrowings': BorrowedBook.query.count(),
+        'active_borrowings': BorrowedBook.query.filter_by(is_returned=False).count(),
+        'overdue_borrowings': BorrowedBook.query.filter_by(is_returned=False, is_overdue=True).count()
+    }
+
+    stats = db.session.get(LibraryStats, STATS_ROW_ID)
+    if not stats:
+        stats = LibraryStats(id=STATS_ROW_ID)
+        db.session.add(stats)
+
+    for name, value in counts.items():
+        setattr(stats, name, value)
+    stats.reconciled_at = now
+
+    db.session.commit()
+    return stats
+
+def get_stats():
+    stats = db.session.get(LibraryStats, STATS_ROW_ID)
+    if not stats:
+        stats = reconcile()
+
+    return stats.to_dict()
@@ -0,0 +1,327 @@
+import bisect
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, func, insert, select, delete, text
+from sqlalchemy.orm import Session
+from database import db, Book, DonatedBook, BookChange
+from search import TOKEN_PATTERN
+
+# Typeahead suggestions served from memory.
+#
+# Each process keeps a sorted array of (word, entry) pairs covering every
+# word of every title, author and category; a typed prefix is a bisect into
+# that array, so answering a keystroke never touches the database. Entries
+# are ranked by how many copies the library holds (an author or category
+# counts all of its books), with entries whose whole text starts with the
+# query first. A query of several words intersects the words' ranges.
+# Results are memoised per query (bounded LRU): a single-word prefix until a
+# word starting with it changes, a phrase until any indexed book changes.
+#
+# The index is built at startup (before gunicorn forks, so workers share it)
+# and kept current from the book_change log: the writing process applies
+# its own changes right after they commit, other processes pick them up at
+# most SUGGEST_REFRESH_INTERVAL seconds later. ORM writes are logged by the
+# hook below; Core bulk writers call log_book_changes() themselves.
+
+KINDS = ('title', 'author', 'category')
+MEMO_ENTRIES = 10000
+SCAN_LIMIT = 5000
+CHANGE_BATCH = 5000
+
+def _words(value):
+    return TOKEN_PATTERN.findall(value.casefold())
+
+class PrefixIndex:
+    def __init__(self):
+        self.words = []
+        # entry key (kind, id) -> [display text, weight, book count, normalized text, words, rank]
+        self.entries = {}
+        # book id -> (title, author, category, copies) as indexed
+        self.books = {}
+        self.memo = OrderedDict()
+
+    def _add_words(self, key, words):
+        for word in words:
+            bisect.insort(self.words, (word, key))
+
+    def _remove_words(self, key, words):
+        for word in words:
+            index = bisect.bisect_left(self.words, (word, key))
+            if index < len(self.words) and self.words[index] == (word, key):
+                del self.words[index]
+
+    def _forget(self, words):
+        for word in words:
+            for length in range(1, len(word) + 1):
+                self.memo.pop(word[:length], None)
+        # Phrases could match through any of their words; drop them all
+        for phrase in [phrase for phrase in self.memo if ' ' in phrase]:
+            del self.memo[phrase]
+
+    @staticmethod
+    def _ranked(entry):
+        # Most copies first, then shorter and alphabetical
+        entry[5] = (-entry[1], len(entry[0]), entry[0])
+        return entry
+
+    def _adjust(self, key, text, weight, books):
+        entry = self.entries.get(key)
+        if entry is None:
+            if books <= 0:
+                return
+            words = sorted(set(_words(text)))
+            entry = self.entries[key] = [text, 0, 0, text.casefold(), words, None]
+            self._add_words(key, words)
+
+        entry[1] += weight
+        entry[2] += books
+        self._ranked(entry)
+        self._forget(entry[4])
+
+        if entry[2] <= 0:
+            del self.entries[key]
+            self._remove_words(key, entry[4])
+
+    def _apply(self, book_id, title, author, category, copies, sign):
+        self._adjust(('title', book_id), title, sign * copies, sign)
+        if author:
+            self._adjust(('author', author.casefold()), author, sign * copies, sign)
+        if category:
+            self._adjust(('category', category.casefold()), category, sign * copies, sign)
+
+    def put(self, book_id, title, author, category, copies):
+        self.drop(book_id)
+        self.books[book_id] = (title, author, category, copies)
+        self._apply(book_id, title, author, category, copies, 1)
+
+    def drop(self, book_id):
+        old = self.books.pop(book_id, None)
+        if old is not None:
+            self._apply(book_id, *old, -1)
+
+    def load(self, rows):
+        # Bulk build: gather every pair first and sort once
+        entries = {}
+        for book_id, title, author, category, copies in rows:
+            self.books[book_id] = (title, author, category, copies)
+            for key, text in ((('title', book_id), title),
+                              (('author', (author or '').casefold()), author),
+                              (('category', (category or '').casefold()), category)):
+                if not text:
+                    continue
+                entry = entries.get(key)
+                if entry is None:
+                    entry = entries[key] = [text, 0, 0, text.casefold(), sorted(set(_words(text))), None]
+                entry[1] += copies
+                entry[2] += 1
+
+        for entry in entries.values():
+            self._ranked(entry)
+        self.entries = entries
+        self.words = sorted((word, key) for key, entry in entries.items() for word in entry[4])
+        self.memo = OrderedDict()
+
+    def _range(self, prefix):
+        start = bisect.bisect_left(self.words, (prefix,))
+        return start, bisect.bisect_left(self.words, (prefix + '\U0010ffff',), start)
+
+    def _candidates(self, tokens):
+        # Intersect the tokens' ranges, narrowest first; a token matching a
+        # large part of the catalog is checked against each candidate instead
+        ranges = sorted((self._range(token) + (token,) for token in tokens), key=lambda r: r[1] - r[0])
+        start, end, _ = ranges[0]
+        keys = {key for _, key in self.words[start:min(end, start + SCAN_LIMIT)]}
+
+        for start, end, token in ranges[1:]:
+            if end - start <= SCAN_LIMIT:
+                keys.intersection_update(key for _, key in self.words[start:end])
+            else:
+                keys = {key for key in keys if any(word.startswith(token) for word in self.entries[key][4])}
+        return keys
+
+    def _rank(self, keys, query, limit):
+        entries = self.entries
+        rank = lambda key: entries[key][5]
+        leading = [key for key in keys if entries[key][3].startswith(query)]
+        best = heapq.nsmallest(limit, leading, key=rank)
+        if len(best) < limit:
+            leading = set(leading)
+            best += heapq.nsmallest(limit - len(best), (key for key in keys if key not in leading), key=rank)
+        return best
+
+    def search(self, query, limit, kinds=KINDS, memo_limit=None):
+        tokens = _words(query)
+        if not tokens:
+            return []
+
+        normalized = ' '.join(tokens)
+        memoised = bool(memo_limit)
+        if memoised:
+            cached = self.memo.get(normalized, {}).get(kinds)
+            if cached is not None:
+                self.memo.move_to_end(normalized)
+                return cached[:limit]
+
+        keys = [key for key in self._candidates(tokens) if key[0] in kinds]
+        ranked = self._rank(keys, normalized, memo_limit if memoised else limit)
+
+        if memoised:
+            self.memo.setdefault(normalized, {})[kinds] = ranked
+            self.memo.move_to_end(normalized)
+            while len(self.memo) > MEMO_ENTRIES:
+                self.memo.popitem(last=False)
+        return ranked[:limit]
+
+    def describe(self, key):
+        text, weight, books = self.entries[key][:3]
+        kind, ident = key
+        data = {'text': text, 'kind': kind, 'copies': weight}
+        if kind == 'title':
+            data['book_id'] = ident
+        else:
+            data['books'] = books
+        return data
+
+_index = None
+_index_lock = threading.Lock()
+_last_change_id = 0
+_synced_at = None
+_pending = threading.Event()
+
+def _book_rows(book_ids=None):
+    copies = select(DonatedBook.book_id, func.count(DonatedBook.id).label('copies')).group_by(
+        DonatedBook.book_id
+    )
+    if book_ids is not None:
+        copies = copies.where(DonatedBook.book_id.in_(book_ids))
+    copies = copies.subquery()
+
+    query = select(
+        Book.id, Book.title, Book.author, Book.category, func.coalesce(copies.c.copies, 0)
+    ).outerjoin(copies, copies.c.book_id == Book.id)
+    if book_ids is not None:
+        query = query.where(Book.id.in_(book_ids))
+    return db.session.execute(query).all()
+
+def _log_high_water():
+    # Highest id ever given to a change, including pruned ones. SQLite's
+    # AUTOINCREMENT keeps it in sqlite_sequence; elsewhere MAX(id) has to do.
+    if db.engine.dialect.name == 'sqlite':
+        seq = db.session.execute(
+            text('SELECT seq FROM sqlite_sequence WHERE name = :name'), {'name': BookChange.__tablename__}
+        ).scalar()
+        if seq is not None:
+            return seq
+    return db.session.execute(select(func.max(BookChange.id))).scalar() or 0
+
+def build_index():
+    global _index, _last_change_id, _synced_at
+
+    with _index_lock:
+        last_change_id = _log_high_water()
+        index = PrefixIndex()
+        index.load(_book_rows())
+
+        _index = index
+        _last_change_id = last_change_id
+        _synced_at = time.monotonic()
+
+    return len(index.books)
+
+def _sync():
+    global _last_change_id, _synced_at
+
+    interval = current_app.config.get('SUGGEST_REFRESH_INTERVAL', 5)
+    now = time.monotonic()
+    if not _pending.is_set() and _synced_at is not None and now - _synced_at < interval:
+        return
+
+    with _index_lock:
+        _pending.clear()
+        # Changes we never saw were pruned: ids were issued after ours but the
+        # log no longer starts right after it (or is empty). Without a
+        # high-water mark, a process idle for longer than the retention may
+        # have missed some too (e.g. a worker forked from an old master).
+        high_water = _log_high_water()
+        oldest = db.session.execute(select(func.min(BookChange.id))).scalar()
+        pruned = high_water > _last_change_id and (oldest is None or oldest > _last_change_id + 1)
+        retention = current_app.config.get('BOOK_CHANGE_RETENTION', 86400)
+        stale = _synced_at is not None and now - _synced_at > retention
+        if pruned or stale:
+            _synced_at = None
+        else:
+            while True:
+                changes = db.session.execute(
+                    select(BookChange.id, BookChange.book_id).where(BookChange.id > _last_change_id)
+                    .order_by(BookChange.id).limit(CHANGE_BATCH)
+                ).all()
+                if not changes:
+                    break
+
+                book_ids = {book_id for _, book_id in changes}
+                rows = {row[0]: row for row in _book_rows(book_ids)}
+                for book_id in book_ids:
+                    if book_id in rows:
+                        _index.put(*rows[book_id])
+                    else:
+                        _index.drop(book_id)
+                _last_change_id = changes[-1][0]
+
+            _synced_at = now
+            return
+
+    build_index()
+
+def suggest(query, limit, kinds=KINDS):
+    if _index is None:
+        build_index()
+    else:
+        _sync()
+
+    memo_limit = current_app.config.get('SUGGEST_MAX_RESULTS', 20)
+    with _index_lock:
+        return [_index.describe(key) for key in _index.search(query, limit, kinds, memo_limit)]
+
+def log_book_changes(book_ids, session=None):
+    # Core-level writes to book (bulk imports, seeding) must call this themselves
+    session = session or db.session
+    now = datetime.utcnow()
+    rows = [{'book_id': book_id, 'changed_at': now} for book_id in book_ids]
+    if rows:
+        session.execute(insert(BookChange), rows)
+
+def prune_book_changes():
+    # Scheduled: processes that fall further behind than this rebuild instead
+    retention = current_app.config.get('BOOK_CHANGE_RETENTION', 86400)
+    result = db.session.execute(
+        delete(BookChange).where(BookChange.changed_at < datetime.utcnow() - timedelta(seconds=retention))
+    )
+    db.session.commit()
+    return result.rowcount
+
+@event.listens_for(Session, 'after_flush')
+def _log_book_changes(session, flush_context):
+    book_ids = [
+        obj.id for obj in (session.new | session.dirty | session.deleted)
+        if isinstance(obj, Book) and obj.id is not None
+    ]
+    if book_ids:
+        session.connection().execute(
+            insert(BookChange),
+            [{'book_id': book_id, 'changed_at': datetime.utcnow()} for book_id in book_ids]
+        )
+        session.info['books_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _apply_own_changes(session):
+    # This process sees its own edits on the next suggest call
+    if session.info.pop('books_changed', False):
+        _pending.set()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_own_changes(session):
+    session.info.pop('books_changed', None)
@@ -0,0 +1,20 @@
+import os
+from app import create_app, prepare_database
+
+# WSGI entry point for production servers:
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#   python serve.py
+#
+# Uses ProductionConfig unless FLASK_CONFIG says otherwise. With gunicorn's
+# preload_app this module is imported once in the master process, so
+# migrations and the other startup work run once before workers fork.
+
+app = create_app(config_name=os.environ.get('FLASK_CONFIG', 'production'))
+
+if app.config['SECRET_KEY'].endswith('change-in-production') or \
+        app.config['JWT_SECRET_KEY'].endswith('change-in-production'):
+    print("WARNING: SECRET_KEY/JWT_SECRET_KEY are the built-in defaults; set them in the environment")
+
+for version, name in prepare_database(app):
+    print(f"Applied migration {version}: {name}")